@@ -3,10 +3,45 @@ CMH1 Fusion - Professional Streamlit Application
 Main entry point with modular architecture
 """
 import streamlit as st
-from utils.config import setup_page
+from utils.config import APP_NAME
 from utils.styles import load_custom_css
 from pages import html_editor, email_tool, cmh1_pro
 
+# Navigation entries and the page each one renders
+PAGES = {
+    "💻 HTML FUSION EDITOR": html_editor,
+    "📧 IMAP EMAIL TOOL": email_tool,
+    "⚡ CMH-1 PRO": cmh1_pro,
+}
+
+def setup_page():
+    """Configure Streamlit page settings"""
+    st.set_page_config(
+        page_title=APP_NAME,
+        page_icon="🚀",
+        layout="wide",
+        initial_sidebar_state="collapsed"
+    )
+
+def keep_widget_state(page):
+    """
+    Keep the widget values of a page that is not rendered in this run
+
+    Streamlit forgets the state of widgets a run does not draw, so the
+    options of a hidden page would reset when the user comes back to it.
+    Re-assigning the keyed values turns them into plain session state,
+    which the widgets pick up again once the page is shown.
+
+    Args:
+        page: Page module; its keys start with its WIDGET_KEY_PREFIX
+    """
+    prefix = getattr(page, 'WIDGET_KEY_PREFIX', None)
+    if not prefix:
+        return
+    for key in list(st.session_state):
+        if isinstance(key, str) and key.startswith(prefix):
+            st.session_state[key] = st.session_state[key]
+
 def main():
     """Main application entry point"""
     # Setup page configuration
@@ -15,22 +50,26 @@ def main():
     # Load custom styles
     load_custom_css()
     
-    # Create navigation tabs
-    tab1, tab2, tab3 = st.tabs([
-        "💻 HTML FUSION EDITOR", 
-        "📧 IMAP EMAIL TOOL", 
-        "⚡ CMH-1 PRO"
-    ])
-    
-    # Render each page in its respective tab
-    with tab1:
-        html_editor.render()
+    # Tab-style navigation; unlike st.tabs only the selected page is
+    # rendered, so reruns (e.g. every second while a background job runs)
+    # do not rebuild and resend the other pages. The trade-off: a hidden
+    # page is unmounted. Widget values survive through keep_widget_state(),
+    # but the HTML editor and CMH-1 Pro iframes are rebuilt from the cached
+    # asset when shown again, losing any unsaved in-browser state
+    selected = st.radio(
+        "Navigation",
+        list(PAGES),
+        horizontal=True,
+        key="active_page",
+        label_visibility="collapsed"
+    )
     
-    with tab2:
-        email_tool.render()
+    for name, page in PAGES.items():
+        if name != selected:
+            keep_widget_state(page)
     
-    with tab3:
-        cmh1_pro.render()
+    # Render the selected page
+    PAGES[selected].render()
 
 if __name__ == "__main__":
     main()
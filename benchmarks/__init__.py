@@ -0,0 +1 @@
+"""Benchmarks for CMH1 Fusion: synthetic mailboxes, a fake IMAP server and a runner"""
@@ -0,0 +1,493 @@
+"""
+In-process fake IMAP4 server
+Serves a synthetic mailbox over a local socket with configurable latency and bandwidth
+"""
+import email
+import imaplib
+import queue
+import re
+import socketserver
+import threading
+import time
+from collections import Counter
+from email.policy import compat32
+
+_policy = compat32.clone(linesep='\r\n')
+
+_SEQUENCE_SET = re.compile(rb'^(\d+|\*)(:(\d+|\*))?(,(\d+|\*)(:(\d+|\*))?)*$')
+_SECTION = re.compile(rb'BODY(\.PEEK)?\[([^\]]*)\](<(\d+)\.(\d+)>)?', re.I)
+_LITERAL = re.compile(rb'\{(\d+)\+?\}\r\n$')
+_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|\(|\)|[^\s()]+')
+# SEARCH keys followed by one argument (HEADER takes two)
+_SEARCH_ARGS = {
+    b'BCC', b'BEFORE', b'BODY', b'CC', b'FROM', b'KEYWORD', b'LARGER', b'ON', b'SENTBEFORE',
+    b'SENTON', b'SENTSINCE', b'SINCE', b'SMALLER', b'SUBJECT', b'TEXT', b'TO', b'UNKEYWORD',
+}
+
+
+def _quote(value):
+    """IMAP quoted string (or NIL)"""
+    if value is None:
+        return b'NIL'
+    if isinstance(value, str):
+        value = value.encode('utf-8', 'replace')
+    value = value.replace(b'\r', b' ').replace(b'\n', b' ')
+    return b'"' + value.replace(b'\\', b'\\\\').replace(b'"', b'\\"') + b'"'
+
+
+def _params(params):
+    """Body parameter list: ("name" "value" ...) or NIL"""
+    if not params:
+        return b'NIL'
+    return b'(' + b' '.join(_quote(k) + b' ' + _quote(v) for k, v in params) + b')'
+
+
+def _payload_bytes(part):
+    """Undecoded body of a leaf part as it appears on the wire"""
+    # get_payload() re-decodes 8bit bodies with their charset; the stored
+    # payload still holds the original bytes as surrogate escapes
+    payload = part._payload
+    if isinstance(payload, str):
+        return payload.encode('ascii', 'surrogateescape')
+    if isinstance(payload, list):
+        return b''.join(p.as_bytes(policy=_policy) for p in payload)
+    return payload or b''
+
+
+def _disposition(part):
+    value = part.get('Content-Disposition')
+    if not value:
+        return b'NIL'
+    kind = value.split(';', 1)[0].strip().lower()
+    # RFC 2231 names are sent decoded, as UTF-8
+    filename = part.get_filename()
+    params = [('filename', filename)] if filename else []
+    return b'(' + _quote(kind) + b' ' + _params(params) + b')'
+
+
+def _envelope(msg):
+    """Minimal ENVELOPE: date, subject and message-id; address lists are NIL"""
+    fields = [_quote(msg.get('Date')), _quote(msg.get('Subject'))]
+    fields += [b'NIL'] * 7
+    fields.append(_quote(msg.get('Message-ID')))
+    return b'(' + b' '.join(fields) + b')'
+
+
+def body_structure(part):
+    """
+    BODYSTRUCTURE of a parsed message (RFC 3501 section 7.4.2)
+
+    Args:
+        part: email.message.Message
+
+    Returns:
+        Parenthesized list as bytes
+    """
+    if part.is_multipart() and part.get_content_maintype() == 'multipart':
+        children = b''.join(body_structure(p) for p in part.get_payload())
+        params = [('boundary', part.get_boundary())] if part.get_boundary() else []
+        return (b'(' + children + b' ' + _quote(part.get_content_subtype()) + b' '
+                + _params(params) + b' ' + _disposition(part) + b' NIL NIL)')
+
+    ctype = part.get_content_type()
+    maintype, subtype = ctype.split('/', 1)
+    params = [(k, v) for k, v in part.get_params([])[1:] if v] if part.get('Content-Type') else []
+    if maintype == 'text' and not params:
+        params = [('charset', 'us-ascii')]
+    body = _payload_bytes(part)
+    fields = [
+        _quote(maintype), _quote(subtype), _params(params),
+        _quote(part.get('Content-ID')), _quote(part.get('Content-Description')),
+        _quote(str(part.get('Content-Transfer-Encoding', '7bit')).strip()),
+        str(len(body)).encode('ascii'),
+    ]
+    if maintype == 'text':
+        fields.append(str(body.count(b'\n')).encode('ascii'))
+    elif ctype == 'message/rfc822' and part.is_multipart():
+        inner = part.get_payload(0)
+        fields += [_envelope(inner), body_structure(inner), str(body.count(b'\n')).encode('ascii')]
+    fields += [b'NIL', _disposition(part), b'NIL', b'NIL']
+    return b'(' + b' '.join(fields) + b')'
+
+
+def _split(raw):
+    """Split raw message bytes into (header block incl. blank line, body)"""
+    for sep in (b'\r\n\r\n', b'\n\n'):
+        pos = raw.find(sep)
+        if pos != -1:
+            return raw[:pos + len(sep)], raw[pos + len(sep):]
+    return raw, b''
+
+
+def _header_fields(header, names, exclude=False):
+    """Subset of a header block (HEADER.FIELDS / HEADER.FIELDS.NOT)"""
+    wanted = {n.upper().encode("ascii") for n in names}
+    lines = re.split(rb'\r\n(?![ \t])', header.rstrip(b'\r\n'))
+    keep = [ln for ln in lines if (ln.split(b':', 1)[0].strip().upper() in wanted) != exclude]
+    return b''.join(ln + b'\r\n' for ln in keep) + b'\r\n'
+
+
+class Mailbox:
+    """
+    Messages of one folder, with UIDs and the folder's UIDVALIDITY
+
+    BODYSTRUCTUREs are computed up front so serving FETCH costs the
+    benchmark as little server-side CPU as possible.
+    """
+
+    def __init__(self, messages, uidvalidity=1, uid_start=1):
+        self.messages = list(messages)
+        self.uidvalidity = uidvalidity
+        self.uids = [uid_start + k for k in range(len(self.messages))]
+        self._parsed = [None] * len(self.messages)
+        self._structures = [None] * len(self.messages)
+        for k in range(len(self.messages)):
+            self.structure(k)
+
+    def parsed(self, k):
+        if self._parsed[k] is None:
+            self._parsed[k] = email.message_from_bytes(self.messages[k], policy=compat32)
+        return self._parsed[k]
+
+    def structure(self, k):
+        if self._structures[k] is None:
+            self._structures[k] = body_structure(self.parsed(k))
+        return self._structures[k]
+
+    def section(self, k, spec):
+        """
+        Content of a BODY[section] (RFC 3501 section 6.4.5)
+
+        Args:
+            k: Message index
+            spec: Section specification, e.g. '', 'HEADER', 'TEXT', '1.2',
+                'HEADER.FIELDS (SUBJECT FROM)'
+
+        Returns:
+            Section bytes
+        """
+        raw = self.messages[k]
+        header, text = _split(raw)
+        spec = spec.strip()
+        upper = spec.upper()
+        if not spec:
+            return raw
+        if upper == 'HEADER':
+            return header
+        if upper == 'TEXT':
+            return text
+        if upper.startswith('HEADER.FIELDS'):
+            names = spec[spec.index('(') + 1:spec.rindex(')')].split()
+            return _header_fields(header, names, upper.startswith('HEADER.FIELDS.NOT'))
+
+        part = self.parsed(k)
+        for number in spec.split('.'):
+            if not number.isdigit():
+                break
+            if part.get_content_type() == 'message/rfc822' and part.is_multipart():
+                part = part.get_payload(0)
+            if part.get_content_maintype() == 'multipart':
+                children = part.get_payload()
+                index = int(number) - 1
+                if not 0 <= index < len(children):
+                    return b''
+                part = children[index]
+            elif number != '1':
+                return b''
+            elif part is self.parsed(k):
+                return text
+        return _payload_bytes(part)
+
+
+class _Connection(socketserver.StreamRequestHandler):
+    """One IMAP session; commands may be pipelined by the client"""
+
+    def setup(self):
+        super().setup()
+        self.mailbox = None
+        self._free_at = time.monotonic()
+        self._write_lock = threading.Lock()
+
+    def send(self, data):
+        """Write a response, throttled to the server bandwidth"""
+        server = self.server.owner
+        bandwidth = server.bandwidth
+        with server.lock:
+            server.bytes_sent += len(data)
+        if not bandwidth:
+            with self._write_lock:
+                self.wfile.write(data)
+            return
+        view = memoryview(data)
+        for pos in range(0, len(view), 16384):
+            chunk = view[pos:pos + 16384]
+            with self._write_lock:
+                self.wfile.write(chunk)
+            self._free_at = max(self._free_at, time.monotonic()) + len(chunk) / bandwidth
+            delay = self._free_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _read_commands(self, lines):
+        """Reader thread: timestamp each complete command, answering literals"""
+        try:
+            while True:
+                line = self.rfile.readline()
+                while line:
+                    literal = _LITERAL.search(line)
+                    if not literal:
+                        break
+                    if not line.endswith(b'+}\r\n'):
+                        with self._write_lock:
+                            self.wfile.write(b'+ Ready\r\n')
+                    line = line[:literal.start()] + _quote(self.rfile.read(int(literal.group(1))))
+                    line += self.rfile.readline()
+                lines.put((time.monotonic(), line))
+                if not line:
+                    return
+        except (OSError, ValueError):
+            lines.put((time.monotonic(), b''))
+
+    def handle(self):
+        server = self.server.owner
+        self.send(b'* OK [CAPABILITY IMAP4rev1] Fake IMAP server ready\r\n')
+        lines = queue.Queue()
+        threading.Thread(target=self._read_commands, args=(lines,), daemon=True).start()
+        while True:
+            received, line = lines.get()
+            # Latency models the round trip: no reply before receipt + latency
+            delay = received + server.latency - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if not line:
+                return
+            try:
+                if not self.dispatch(line.rstrip(b'\r\n')):
+                    return
+            except (OSError, ValueError):
+                return
+
+    def dispatch(self, line):
+        """Execute one command; returns False once the session ends"""
+        parts = line.split(b' ', 2)
+        if len(parts) < 2:
+            self.send(b'* BAD Invalid command\r\n')
+            return True
+        tag, command = parts[0], parts[1].upper()
+        args = parts[2] if len(parts) > 2 else b''
+        uid = False
+        if command == b'UID':
+            sub = args.split(b' ', 1)
+            command, args, uid = sub[0].upper(), (sub[1] if len(sub) > 1 else b''), True
+
+        server = self.server.owner
+        with server.lock:
+            server.commands[command.decode('ascii', 'replace')] += 1
+
+        handler = getattr(self, 'cmd_' + command.decode('ascii', 'replace').lower(), None)
+        if handler is None:
+            self.send(tag + b' BAD Unknown command\r\n')
+            return True
+        return handler(tag, args, uid) is not False
+
+    def cmd_capability(self, tag, args, uid):
+        self.send(b'* CAPABILITY IMAP4rev1 LITERAL+\r\n' + tag + b' OK CAPABILITY completed\r\n')
+
+    def cmd_noop(self, tag, args, uid):
+        self.send(tag + b' OK NOOP completed\r\n')
+
+    cmd_check = cmd_noop
+
+    def cmd_login(self, tag, args, uid):
+        self.send(tag + b' OK [CAPABILITY IMAP4rev1] LOGIN completed\r\n')
+
+    def cmd_logout(self, tag, args, uid):
+        self.send(b'* BYE Logging out\r\n' + tag + b' OK LOGOUT completed\r\n')
+        return False
+
+    def cmd_list(self, tag, args, uid):
+        out = [b'* LIST (\\HasNoChildren) "/" ' + _quote(name) + b'\r\n'
+               for name in self.server.owner.folders]
+        self.send(b''.join(out) + tag + b' OK LIST completed\r\n')
+
+    def cmd_select(self, tag, args, uid):
+        name = args.strip().strip(b'"').decode('utf-8', 'replace')
+        folders = self.server.owner.folders
+        match = next((f for f in folders if f.upper() == name.upper()), None)
+        if match is None:
+            self.send(tag + b' NO Mailbox does not exist\r\n')
+            return
+        self.mailbox = mailbox = folders[match]
+        next_uid = (mailbox.uids[-1] + 1) if mailbox.uids else 1
+        self.send(
+            b'* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)\r\n'
+            b'* %d EXISTS\r\n* 0 RECENT\r\n'
+            b'* OK [UIDVALIDITY %d] UIDs valid\r\n'
+            b'* OK [UIDNEXT %d] Predicted next UID\r\n'
+            % (len(mailbox.messages), mailbox.uidvalidity, next_uid)
+            + tag + b' OK [READ-WRITE] SELECT completed\r\n'
+        )
+
+    cmd_examine = cmd_select
+
+    def cmd_close(self, tag, args, uid):
+        self.mailbox = None
+        self.send(tag + b' OK CLOSE completed\r\n')
+
+    def _resolve(self, spec, uid):
+        """Message indexes matching a sequence set (sequence numbers or UIDs)"""
+        mailbox = self.mailbox
+        numbers = mailbox.uids if uid else list(range(1, len(mailbox.messages) + 1))
+        if not numbers:
+            return []
+        top = numbers[-1]
+        wanted = []
+        for item in spec.split(b','):
+            first, _, last = item.partition(b':')
+            lo = top if first == b'*' else int(first)
+            hi = lo if not last else (top if last == b'*' else int(last))
+            wanted.append((min(lo, hi), max(lo, hi)))
+        return [k for k, n in enumerate(numbers) if any(lo <= n <= hi for lo, hi in wanted)]
+
+    def cmd_search(self, tag, args, uid):
+        if self.mailbox is None:
+            self.send(tag + b' BAD No mailbox selected\r\n')
+            return
+        # Only the sequence-set and UID criteria restrict the result; other
+        # criteria (dates, addresses, sizes) match every message
+        tokens = _TOKEN.findall(args)
+        if tokens[:1] and tokens[0].upper() == b'CHARSET':
+            tokens = tokens[2:]
+        selected = set(range(len(self.mailbox.messages)))
+        k = 0
+        while k < len(tokens):
+            token = tokens[k].upper()
+            if token == b'UID' and k + 1 < len(tokens):
+                selected &= set(self._resolve(tokens[k + 1], True))
+                k += 1
+            elif token in _SEARCH_ARGS:
+                k += 1
+            elif token == b'HEADER':
+                k += 2
+            elif _SEQUENCE_SET.match(token):
+                selected &= set(self._resolve(token, False))
+            k += 1
+        numbers = self.mailbox.uids if uid else range(1, len(self.mailbox.messages) + 1)
+        found = b' '.join(str(numbers[k]).encode('ascii') for k in sorted(selected))
+        self.send(b'* SEARCH' + (b' ' + found if found else b'') + b'\r\n'
+                  + tag + b' OK SEARCH completed\r\n')
+
+    def cmd_fetch(self, tag, args, uid):
+        if self.mailbox is None:
+            self.send(tag + b' BAD No mailbox selected\r\n')
+            return
+        spec, _, query = args.partition(b' ')
+        query = query.strip()
+        if query.startswith(b'(') and query.endswith(b')'):
+            query = query[1:-1]
+        sections = [(m.group(0), m.group(2).decode('ascii', 'replace'), m.group(4), m.group(5))
+                    for m in _SECTION.finditer(query)]
+        simple = _SECTION.sub(b'', query).upper().split()
+        if uid and b'UID' not in simple:
+            simple.insert(0, b'UID')
+
+        mailbox = self.mailbox
+        out = []
+        for k in self._resolve(spec, uid):
+            items = []
+            for name in simple:
+                if name == b'UID':
+                    items.append(b'UID %d' % mailbox.uids[k])
+                elif name == b'FLAGS':
+                    items.append(b'FLAGS (\\Seen)')
+                elif name == b'RFC822.SIZE':
+                    items.append(b'RFC822.SIZE %d' % len(mailbox.messages[k]))
+                elif name == b'BODYSTRUCTURE':
+                    items.append(b'BODYSTRUCTURE ' + mailbox.structure(k))
+                elif name in (b'RFC822', b'RFC822.HEADER', b'RFC822.TEXT'):
+                    spec_name = {b'RFC822': '', b'RFC822.HEADER': 'HEADER', b'RFC822.TEXT': 'TEXT'}[name]
+                    data = mailbox.section(k, spec_name)
+                    items.append(name + b' {%d}\r\n' % len(data) + data)
+            for _, section, start, length in sections:
+                data = mailbox.section(k, section)
+                label = b'BODY[' + section.encode('ascii') + b']'
+                if start is not None:
+                    data = data[int(start):int(start) + int(length)]
+                    label += b'<' + start + b'>'
+                items.append(label + b' {%d}\r\n' % len(data) + data)
+            out.append(b'* %d FETCH (' % (k + 1) + b' '.join(items) + b')\r\n')
+            if len(out) >= 64:
+                self.send(b''.join(out))
+                out = []
+        self.send(b''.join(out) + tag + b' OK FETCH completed\r\n')
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class FakeIMAPServer:
+    """
+    Threaded IMAP4rev1 server on localhost for benchmarks
+
+    Implements what the extraction path uses: LOGIN, SELECT/EXAMINE, LIST,
+    (UID) SEARCH over sequence sets, and (UID) FETCH with UID, FLAGS,
+    RFC822*, BODYSTRUCTURE and BODY[.PEEK][section]<partial>. Pipelined
+    commands are answered in order. No TLS; connect with imaplib.IMAP4.
+
+    Args:
+        folders: Dict of folder name -> Mailbox (or list of raw messages)
+        latency: Seconds added to every command's round trip
+        bandwidth: Response bytes per second per connection (None = unlimited)
+    """
+
+    def __init__(self, folders, latency=0.0, bandwidth=None, host='127.0.0.1', port=0):
+        self.folders = {
+            name: box if isinstance(box, Mailbox) else Mailbox(box)
+            for name, box in folders.items()
+        }
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.lock = threading.Lock()
+        self.commands = Counter()
+        self.bytes_sent = 0
+        self._server = _TCPServer((host, port), _Connection, bind_and_activate=True)
+        self._server.owner = self
+        self._thread = None
+
+    @property
+    def address(self):
+        """(host, port) the server listens on"""
+        return self._server.server_address[:2]
+
+    def start(self):
+        """Serve in a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the listening socket"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def reset_counters(self):
+        """Zero the command and byte counters"""
+        with self.lock:
+            self.commands.clear()
+            self.bytes_sent = 0
+
+    def connect(self, user='bench', password='bench'):
+        """Open an authenticated imaplib client session"""
+        conn = imaplib.IMAP4(*self.address)
+        conn.login(user, password)
+        return conn
+
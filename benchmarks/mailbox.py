@@ -0,0 +1,250 @@
+"""
+Synthetic mailbox generator
+Deterministic RFC822 messages with mixed MIME structures, charsets, attachments and duplicates
+"""
+import base64
+import binascii
+import random
+from email.header import Header
+
+# Sample text per charset; every sample is encodable in its charset
+CHARSET_TEXT = {
+    'us-ascii': "the quarterly report is attached please review the figures before friday",
+    'utf-8': "naïve café résumé — déjà vu ✓ 日本語 текст ünïcödé emoji 🚀 test",
+    'iso-8859-1': "l'été à la plage était très agréable, merci beaucoup señor Müller",
+    'windows-1252': "“smart quotes” – en dash … ellipsis € euro sign œuvre",
+    'iso-8859-15': "prix total 15 € pour l'œuvre complète",
+    'koi8-r': "Привет, это тестовое письмо с русским текстом для проверки",
+    'shift_jis': "こんにちは、これはテストメールです。よろしくお願いします。",
+    'gb2312': "你好，这是一封测试邮件，请查收附件。",
+}
+CHARSETS = tuple(CHARSET_TEXT)
+
+WORDS = (
+    "account", "agenda", "approval", "budget", "client", "contract", "deadline",
+    "delivery", "draft", "estimate", "feedback", "forecast", "invoice", "meeting",
+    "milestone", "order", "payment", "proposal", "quarter", "release", "report",
+    "review", "schedule", "shipment", "summary", "support", "team", "update",
+    "vendor", "weekly", "project", "status", "request", "customer", "launch",
+)
+
+# Named presets for the benchmark runner
+PROFILES = {
+    'mixed': dict(html_rate=0.3, attachment_rate=0.1, duplicate_rate=0.05, near_duplicate_rate=0.05),
+    'plain': dict(html_rate=0.0, attachment_rate=0.0, duplicate_rate=0.0, near_duplicate_rate=0.0),
+    'html': dict(html_rate=0.9, attachment_rate=0.05, duplicate_rate=0.0, near_duplicate_rate=0.0),
+    'attachments': dict(html_rate=0.2, attachment_rate=0.6, duplicate_rate=0.0, near_duplicate_rate=0.0),
+    'duplicates': dict(html_rate=0.2, attachment_rate=0.05, duplicate_rate=0.25, near_duplicate_rate=0.25),
+}
+
+
+def _paragraphs(rng, charset, count):
+    """Body text: business words mixed with the charset's sample sentence"""
+    sample = CHARSET_TEXT[charset]
+    paragraphs = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(30, 90))]
+        words.insert(rng.randint(0, len(words)), sample)
+        paragraphs.append(' '.join(words).capitalize() + '.')
+    return paragraphs
+
+
+def _html(rng, paragraphs):
+    """HTML-heavy rendering of the paragraphs: nested tables, inline styles, comments"""
+    rows = []
+    for k, para in enumerate(paragraphs):
+        style = f"font-family:Arial,sans-serif;color:#{rng.randrange(0x1000000):06x};padding:{k % 8}px"
+        rows.append(
+            f'<tr><td style="{style}"><!-- block {k} --><div class="c{k}">'
+            f'<p style="margin:0 0 12px 0">{para}</p>'
+            f'<a href="https://example.com/track?id={rng.randrange(10**9)}&amp;p={k}">'
+            f'<img src="https://example.com/px/{k}.gif" width="1" height="1" alt=""></a>'
+            f'</div></td></tr>'
+        )
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><style type="text/css">'
+        + ''.join(f'.c{k}{{margin:{k}px;line-height:1.{k % 9}}}' for k in range(len(paragraphs)))
+        + '</style><script>var tracking = {"campaign": 42};</script></head><body>'
+        + '<table width="100%" cellpadding="0" cellspacing="0"><tr><td><table>'
+        + ''.join(rows)
+        + '</table></td></tr></table></body></html>'
+    )
+
+
+def _wrap_base64(data):
+    return base64.encodebytes(data).replace(b'\n', b'\r\n')
+
+
+def _encode_body(text, charset, encoding):
+    """Encode text with a charset and Content-Transfer-Encoding, CRLF line breaks"""
+    data = text.encode(charset)
+    if encoding == 'base64':
+        return _wrap_base64(data)
+    if encoding == 'quoted-printable':
+        return binascii.b2a_qp(data).replace(b'\n', b'\r\n')
+    return data.replace(b'\n', b'\r\n')
+
+
+def _text_part(text, subtype, charset, encoding):
+    head = (
+        f"Content-Type: text/{subtype}; charset=\"{charset}\"\r\n"
+        f"Content-Transfer-Encoding: {encoding}\r\n\r\n"
+    ).encode('ascii')
+    return head + _encode_body(text, charset, encoding)
+
+
+def _multipart(subtype, parts, boundary):
+    out = [f"Content-Type: multipart/{subtype}; boundary=\"{boundary}\"\r\n\r\n"
+           f"This is a multi-part message in MIME format.\r\n".encode('ascii')]
+    for part in parts:
+        out.append(f"--{boundary}\r\n".encode('ascii'))
+        out.append(part)
+        out.append(b"\r\n")
+    out.append(f"--{boundary}--\r\n".encode('ascii'))
+    return b''.join(out)
+
+
+def _attachment(rng, size, name, ctype):
+    head = (
+        f"Content-Type: {ctype}; name=\"{name}\"\r\n"
+        f"Content-Transfer-Encoding: base64\r\n"
+        f"Content-Disposition: attachment; filename=\"{name}\"\r\n\r\n"
+    ).encode('ascii')
+    return head + _wrap_base64(rng.randbytes(size))
+
+
+def _inline_image(rng, cid):
+    head = (
+        f"Content-Type: image/png; name=\"{cid}.png\"\r\n"
+        f"Content-Transfer-Encoding: base64\r\n"
+        f"Content-ID: <{cid}>\r\n"
+        f"Content-Disposition: inline; filename=\"{cid}.png\"\r\n\r\n"
+    ).encode('ascii')
+    return head + _wrap_base64(rng.randbytes(rng.randint(2000, 20000)))
+
+
+def _headers(rng, n, subject, charset, message_id, extra=''):
+    subject_field = Header(subject, charset).encode() if charset != 'us-ascii' else subject
+    name = Header(f"Sender {n % 97}", 'utf-8').encode()
+    return (
+        f"Return-Path: <bounce-{n}@mail.example.com>\r\n"
+        f"Received: from mx{n % 5}.example.com (mx{n % 5}.example.com [10.0.{n % 256}.1])\r\n"
+        f"\tby imap.example.org with ESMTPS id {rng.randrange(16**12):012x}\r\n"
+        f"DKIM-Signature: v=1; a=rsa-sha256; d=example.com; s=sel; b={rng.randrange(16**40):040x}\r\n"
+        f"Authentication-Results: imap.example.org; dkim=pass; spf=pass\r\n"
+        f"Message-ID: {message_id}\r\n"
+        f"Date: Mon, {1 + n % 28:02d} Sep 2025 {n % 24:02d}:{n % 60:02d}:00 +0000\r\n"
+        f"From: {name} <sender{n % 97}@example.com>\r\n"
+        f"To: Recipient <user@example.org>\r\n"
+        f"Subject: {subject_field}\r\n"
+        f"{extra}"
+        f"MIME-Version: 1.0\r\n"
+    ).encode('ascii')
+
+
+def _body(rng, n, paragraphs, charset, html_rate, attachment_rate, attachment_size):
+    """Build the MIME entity (headers of the top-level part included)"""
+    text = '\n\n'.join(paragraphs)
+    encoding = rng.choice(('quoted-printable', 'base64', '8bit')) if charset != 'us-ascii' else '7bit'
+    boundary = f"=_b{n}_{rng.randrange(16**8):08x}"
+
+    if rng.random() < html_rate:
+        html = _html(rng, paragraphs)
+        html_enc = rng.choice(('quoted-printable', 'base64'))
+        shape = rng.choice(('html', 'alternative', 'related'))
+        if shape == 'html':
+            body = _text_part(html, 'html', charset, html_enc)
+        elif shape == 'alternative':
+            body = _multipart('alternative', [
+                _text_part(text, 'plain', charset, encoding),
+                _text_part(html, 'html', charset, html_enc),
+            ], boundary)
+        else:
+            body = _multipart('related', [
+                _text_part(html, 'html', charset, html_enc),
+                _inline_image(rng, f"img{n}a"),
+                _inline_image(rng, f"img{n}b"),
+            ], boundary)
+    else:
+        body = _text_part(text, 'plain', charset, encoding)
+
+    if rng.random() < attachment_rate:
+        size = max(1, int(attachment_size * rng.uniform(0.5, 1.5)))
+        parts = [body, _attachment(rng, size, f"report_{n}.pdf", 'application/pdf')]
+        if rng.random() < 0.3:
+            parts.append(_attachment(rng, size // 4 + 1, f"data_{n}.zip", 'application/zip'))
+        if rng.random() < 0.2:
+            # A forwarded message with its own structure
+            inner = _headers(rng, n + 1, "Fwd: original", 'us-ascii', f"<fwd{n}@example.com>")
+            inner += _text_part('\n'.join(_paragraphs(rng, 'us-ascii', 1)), 'plain', 'us-ascii', '7bit')
+            parts.append(b"Content-Type: message/rfc822\r\n\r\n" + inner)
+        body = _multipart('mixed', parts, boundary + 'm')
+    return body
+
+
+def generate_mailbox(count=1000, seed=0, html_rate=0.3, attachment_rate=0.1,
+                     attachment_size=256 * 1024, duplicate_rate=0.05, near_duplicate_rate=0.05,
+                     charsets=CHARSETS):
+    """
+    Generate a deterministic synthetic mailbox
+
+    The same arguments always produce byte-identical messages, so benchmark
+    runs are comparable across commits and machines.
+
+    Args:
+        count: Number of messages
+        seed: Random seed
+        html_rate: Share of messages with an HTML body (HTML only,
+            multipart/alternative or multipart/related with inline images)
+        attachment_rate: Share of messages with attachments (multipart/mixed,
+            some also carrying a forwarded message/rfc822)
+        attachment_size: Average attachment size in bytes
+        duplicate_rate: Share of messages that are exact copies of an
+            earlier message (same Message-ID)
+        near_duplicate_rate: Share of messages resending an earlier body
+            with a small edit under a new Message-ID
+        charsets: Charsets to draw body text from
+
+    Returns:
+        List of raw RFC822 messages (bytes, CRLF line breaks)
+    """
+    rng = random.Random(seed)
+    messages = []
+    originals = []
+    for n in range(count):
+        roll = rng.random()
+        if originals and roll < duplicate_rate:
+            messages.append(rng.choice(originals)[0])
+            continue
+
+        if originals and roll < duplicate_rate + near_duplicate_rate:
+            _, paragraphs, charset, subject = rng.choice(originals)
+            paragraphs = list(paragraphs)
+            paragraphs[-1] += f" Reminder {n}."
+        else:
+            charset = rng.choice(charsets)
+            paragraphs = _paragraphs(rng, charset, rng.randint(1, 8))
+            subject = f"{rng.choice(WORDS).capitalize()} {rng.choice(WORDS)} #{n} {CHARSET_TEXT[charset][:24]}"
+
+        raw = (
+            _headers(rng, n, subject, charset, f"<msg{n}.{rng.randrange(16**8):08x}@example.com>")
+            + _body(rng, n, paragraphs, charset, html_rate, attachment_rate, attachment_size)
+        )
+        messages.append(raw)
+        originals.append((raw, paragraphs, charset, subject))
+    return messages
+
+
+def mailbox_stats(messages):
+    """
+    Summary of a generated mailbox
+
+    Returns:
+        Dict with message count, total and largest size in bytes
+    """
+    sizes = [len(m) for m in messages]
+    return {
+        'messages': len(messages),
+        'bytes': sum(sizes),
+        'largest': max(sizes) if sizes else 0,
+    }
@@ -0,0 +1,427 @@
+"""
+Benchmark runner
+Times the email extraction path on a synthetic mailbox and compares runs with a saved baseline
+
+Usage:
+    python -m benchmarks.run --messages 2000 --save baseline
+    python -m benchmarks.run --messages 2000 --baseline baseline --check
+    python -m benchmarks.run --profile attachments --latency 20 --bandwidth 5 --cases e2e
+"""
+import argparse
+import email
+import imaplib
+import json
+import os
+import platform
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fake_imap import FakeIMAPServer, Mailbox
+from benchmarks.mailbox import PROFILES, generate_mailbox, mailbox_stats
+from components.email_processor import process_original_emails, process_text_extraction
+from components.imap_pool import IMAPConnectionPool
+from components.output_sinks import ZipSink, zip_options
+from components.progress import ProgressReporter
+from utils.config import (
+    BENCHMARK_DIR,
+    DEFAULT_FETCH_CHUNK_SIZE,
+    DEFAULT_PARSE_WORKERS,
+    DEFAULT_PIPELINE_DEPTH,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_SIMILARITY_THRESHOLD,
+    DEFAULT_ZIP_LEVEL,
+    DEFAULT_ZIP_WORKERS,
+    ZIP_METHODS
+)
+from utils.email_utils import detect_duplicates, get_email_body_text
+from utils.fingerprint import fingerprint_text
+from utils.header_rewriter import TransformPlan
+from utils.html_text import html_to_text
+from utils.imap_fetch import uid_search
+from utils.metrics import RunMetrics
+
+# Header options exercised by the original-format benchmarks
+REWRITE_OPTIONS = {
+    'rep_dom': True,
+    'p_from': 'example.net',
+    'std_headers': True,
+    'custom_headers_text': 'X-Campaign: bench\nReply-To: replies@example.net',
+    'mod_eid': True,
+    'clean_auth': True,
+}
+
+
+class _LocalPool(IMAPConnectionPool):
+    """Connection pool talking plain IMAP to the fake server"""
+
+    def __init__(self, address, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.address = address
+
+    def _connect(self):
+        conn = imaplib.IMAP4(*self.address)
+        conn.login(self.user, self.password)
+        conn.select(self.folder)
+        return conn
+
+
+class Bench:
+    """Shared state of one benchmark session: the mailbox, options and server"""
+
+    def __init__(self, messages, args):
+        self.messages = messages
+        self.args = args
+        self.total_bytes = sum(len(m) for m in messages)
+        self._texts = None
+        self._html = None
+        self._entries = None
+        self.server = None
+
+    @property
+    def texts(self):
+        if self._texts is None:
+            self._texts = [get_email_body_text(raw) for raw in self.messages]
+        return self._texts
+
+    @property
+    def html(self):
+        """Decoded text/html parts of the mailbox"""
+        if self._html is None:
+            self._html = []
+            for raw in self.messages:
+                for part in email.message_from_bytes(raw).walk():
+                    if part.get_content_type() == 'text/html':
+                        payload = part.get_payload(decode=True) or b''
+                        charset = part.get_content_charset() or 'utf-8'
+                        self._html.append(payload.decode(charset, 'replace'))
+        return self._html
+
+    def entries(self, content):
+        """Duplicate-detection input, as built by the email tool page"""
+        if self._entries is None:
+            self._entries = []
+            for k, raw in enumerate(self.messages):
+                headers = email.message_from_bytes(raw.split(b'\r\n\r\n', 1)[0])
+                self._entries.append({
+                    'id': str(k).encode('ascii'),
+                    'message_id': headers.get('Message-ID', ''),
+                    'subject': headers.get('Subject', ''),
+                    'from': headers.get('From', ''),
+                })
+        if not content:
+            return [dict(e) for e in self._entries]
+        return [{**e, **fingerprint_text(text)} for e, text in zip(self._entries, self.texts)]
+
+    def pool(self):
+        args = self.args
+        return _LocalPool(
+            self.server.address, '127.0.0.1', 'bench', 'bench', 'INBOX',
+            args.pool_size, args.pipeline_depth
+        ).open()
+
+
+# Each case: setup(bench) -> state (untimed), run(bench, state) -> RunMetrics or None
+
+def _body_text_raw(bench, state):
+    for raw in bench.messages:
+        get_email_body_text(raw)
+
+
+def _body_text_message(bench, state):
+    for raw in bench.messages:
+        get_email_body_text(email.message_from_bytes(raw))
+
+
+def _regex_strip(html):
+    """The two-regex tag strip html_to_text replaced, kept as a reference"""
+    return re.sub(r'\s+', ' ', re.sub(r'<[^>]+>', ' ', html)).strip()
+
+
+def _html_text(convert):
+    def run(bench, state):
+        for html in state:
+            convert(html)
+    return run
+
+
+def _fingerprint(bench, state):
+    for text in state:
+        fingerprint_text(text)
+
+
+def _detect_duplicates(bench, state):
+    entries, threshold = state
+    detect_duplicates(entries, threshold)
+
+
+def _rewrite_headers(bench, state):
+    for raw in bench.messages:
+        state.apply(raw)
+
+
+def _zip_write(bench, state):
+    args = bench.args
+    settings = zip_options({'zip_method': args.zip_method, 'zip_level': args.zip_level,
+                            'zip_workers': args.zip_workers})
+    with tempfile.TemporaryFile() as f:
+        with ZipSink(f, **settings) as sink:
+            for k, raw in enumerate(bench.messages):
+                sink.add(f"email_{k + 1}.eml", raw)
+
+
+def _e2e(extract):
+    def run(bench, state):
+        args = bench.args
+        metrics = RunMetrics()
+        out = tempfile.mkdtemp(prefix='cmh1_bench_')
+        try:
+            with metrics.stage('connect'):
+                pool = bench.pool()
+            with pool:
+                ids = uid_search(pool.primary, 1, pool.exists)
+                common = dict(mail=pool, id_list=ids, progress=ProgressReporter(),
+                              chunk_size=args.chunk_size, output_dir=out,
+                              workers=args.workers, metrics=metrics)
+                if extract == 'text':
+                    process_text_extraction(export_format="Separate Files (ZIP)",
+                                            name_by_subj=True, **common)
+                else:
+                    process_original_emails(kwargs={**REWRITE_OPTIONS, 'name_by_subj': True}, **common)
+        finally:
+            shutil.rmtree(out, ignore_errors=True)
+        metrics.finish()
+        return metrics
+    return run
+
+
+CASES = {
+    'body_text_raw': (None, _body_text_raw),
+    'body_text_message': (None, _body_text_message),
+    'html_to_text': (lambda b: b.html, _html_text(html_to_text)),
+    'html_to_text_regex': (lambda b: b.html, _html_text(_regex_strip)),
+    'fingerprint': (lambda b: b.texts, _fingerprint),
+    'detect_duplicates_headers': (lambda b: (b.entries(False), None), _detect_duplicates),
+    'detect_duplicates_content': (
+        lambda b: (b.entries(True), DEFAULT_SIMILARITY_THRESHOLD), _detect_duplicates
+    ),
+    'rewrite_headers': (lambda b: TransformPlan.from_options(REWRITE_OPTIONS), _rewrite_headers),
+    'zip_write': (None, _zip_write),
+    'e2e_text': (None, _e2e('text')),
+    'e2e_original': (None, _e2e('original')),
+}
+# Cases that need the fake IMAP server
+E2E_CASES = ('e2e_text', 'e2e_original')
+
+
+def run_case(bench, name, repeat, measure_memory=True):
+    """
+    Time one case
+
+    The best of `repeat` timed runs is reported; peak memory is measured in
+    a separate run under tracemalloc so tracing does not skew the timings.
+    For end-to-end cases the peak includes the in-process fake server.
+
+    Returns:
+        Dict with seconds, messages/s, bytes/s, peak_mb and, for end-to-end
+        cases, the per-stage breakdown of the best run
+    """
+    setup, run = CASES[name]
+    state = setup(bench) if setup else None
+
+    best = None
+    best_metrics = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        metrics = run(bench, state)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best, best_metrics = elapsed, metrics
+
+    peak = None
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            run(bench, state)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    count = len(bench.messages)
+    nbytes = bench.total_bytes
+    stages = None
+    if best_metrics is not None:
+        stages = best_metrics.to_dict()['stages']
+        # End-to-end throughput counts what was downloaded (text mode
+        # fetches only the text parts)
+        nbytes = stages.get('fetch', {}).get('bytes', 0)
+    result = {
+        'seconds': round(best, 4),
+        'bytes': nbytes,
+        'messages_per_s': round(count / best, 1) if best else None,
+        'bytes_per_s': round(nbytes / best, 1) if best else None,
+        'peak_mb': round(peak / 1048576, 2) if peak is not None else None,
+    }
+    if stages is not None:
+        result['stages'] = stages
+    return result
+
+
+def result_path(name):
+    """Resolve a result name (stored under BENCHMARK_DIR) or a file path"""
+    if os.sep in name or name.endswith('.json'):
+        return name
+    return os.path.join(BENCHMARK_DIR, f"{name}.json")
+
+
+def compare(current, baseline, tolerance):
+    """
+    Compare two result sets case by case
+
+    Args:
+        current: Results of this run
+        baseline: Saved results
+        tolerance: Allowed relative slowdown / memory growth (0.1 = 10%)
+
+    Returns:
+        Tuple of (report lines, list of regressed case names)
+    """
+    lines = [f"{'case':<28} {'msgs/s':>10} {'baseline':>10} {'change':>8} {'peak MB':>8} {'change':>8}"]
+    regressed = []
+    for name, now in current['cases'].items():
+        before = baseline.get('cases', {}).get(name)
+        if not before:
+            continue
+        speed = (now['messages_per_s'] / before['messages_per_s'] - 1) if before['messages_per_s'] else 0.0
+        mem = None
+        if now.get('peak_mb') and before.get('peak_mb'):
+            mem = now['peak_mb'] / before['peak_mb'] - 1
+        flag = ''
+        if speed < -tolerance or (mem is not None and mem > tolerance):
+            regressed.append(name)
+            flag = '  <-- regression'
+        mem_text = f"{mem:+8.1%}" if mem is not None else f"{'-':>8}"
+        lines.append(
+            f"{name:<28} {now['messages_per_s']:>10.1f} {before['messages_per_s']:>10.1f} "
+            f"{speed:+8.1%} {now.get('peak_mb') or 0:>8.2f} {mem_text}{flag}"
+        )
+    return lines, regressed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the email extraction path")
+    parser.add_argument('--messages', type=int, default=1000, help="Messages in the synthetic mailbox")
+    parser.add_argument('--seed', type=int, default=0, help="Mailbox generator seed")
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='mixed',
+                        help="Mailbox composition preset")
+    parser.add_argument('--attachment-kb', type=int, default=256, help="Average attachment size")
+    parser.add_argument('--latency', type=float, default=0.0, help="Server round-trip latency in ms")
+    parser.add_argument('--bandwidth', type=float, default=0.0,
+                        help="Server bandwidth per connection in MB/s (0 = unlimited)")
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE)
+    parser.add_argument('--pipeline-depth', type=int, default=DEFAULT_PIPELINE_DEPTH)
+    parser.add_argument('--workers', type=int, default=DEFAULT_PARSE_WORKERS)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_FETCH_CHUNK_SIZE)
+    parser.add_argument('--zip-method', choices=sorted(ZIP_METHODS), default='deflated')
+    parser.add_argument('--zip-level', type=int, default=DEFAULT_ZIP_LEVEL)
+    parser.add_argument('--zip-workers', type=int, default=DEFAULT_ZIP_WORKERS,
+                        help="Compression threads of the zip_write case")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case (best is kept)")
+    parser.add_argument('--cases', default='all',
+                        help="Comma-separated case names, 'micro', 'e2e' or 'all'")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc pass")
+    parser.add_argument('--save', help="Save results under this name (or file path)")
+    parser.add_argument('--baseline', help="Compare with saved results (name or file path)")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="Relative slowdown or memory growth counted as a regression")
+    parser.add_argument('--check', action='store_true', help="Exit with status 1 on regressions")
+    return parser.parse_args(argv)
+
+
+def select_cases(spec):
+    if spec == 'all':
+        return list(CASES)
+    if spec == 'micro':
+        return [c for c in CASES if c not in E2E_CASES]
+    if spec == 'e2e':
+        return list(E2E_CASES)
+    names = [c.strip() for c in spec.split(',') if c.strip()]
+    unknown = [c for c in names if c not in CASES]
+    if unknown:
+        raise SystemExit(f"Unknown case(s): {', '.join(unknown)}; choose from {', '.join(CASES)}")
+    return names
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cases = select_cases(args.cases)
+
+    print(f"Generating {args.messages} '{args.profile}' messages (seed {args.seed})...")
+    messages = generate_mailbox(
+        args.messages, args.seed, attachment_size=args.attachment_kb * 1024, **PROFILES[args.profile]
+    )
+    stats = mailbox_stats(messages)
+    print(f"  {stats['bytes'] / 1048576:.1f} MB, largest message {stats['largest'] / 1024:.0f} KB")
+
+    bench = Bench(messages, args)
+    if any(c in E2E_CASES for c in cases):
+        bench.server = FakeIMAPServer(
+            {'INBOX': Mailbox(messages, uidvalidity=args.seed + 1, uid_start=1000)},
+            latency=args.latency / 1000,
+            bandwidth=args.bandwidth * 1048576 or None
+        ).start()
+
+    results = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('save', 'baseline', 'check')},
+        'mailbox': stats,
+        'cases': {},
+    }
+    try:
+        print(f"{'case':<28} {'seconds':>9} {'msgs/s':>10} {'MB/s':>8} {'peak MB':>8}")
+        for name in cases:
+            result = run_case(bench, name, args.repeat, not args.no_memory)
+            results['cases'][name] = result
+            peak = f"{result['peak_mb']:>8.2f}" if result['peak_mb'] is not None else f"{'-':>8}"
+            print(f"{name:<28} {result['seconds']:>9.3f} {result['messages_per_s']:>10.1f} "
+                  f"{result['bytes_per_s'] / 1048576:>8.2f} {peak}")
+            for stage, figures in result.get('stages', {}).items():
+                print(f"  {stage:<26} {figures['wall_s']:>9.3f} s wall {figures['cpu_s']:>8.3f} s cpu")
+    finally:
+        if bench.server:
+            bench.server.stop()
+
+    if args.save:
+        path = result_path(args.save)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {path}")
+
+    if args.baseline:
+        with open(result_path(args.baseline), encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('mailbox') != stats:
+            print("Note: the baseline was measured on a different mailbox")
+        changed = [k for k in ('latency', 'bandwidth', 'pool_size', 'pipeline_depth', 'workers', 'chunk_size',
+                               'zip_method', 'zip_level', 'zip_workers')
+                   if baseline.get('config', {}).get(k) != results['config'][k]]
+        if changed:
+            print(f"Note: the baseline used different settings: {', '.join(changed)}")
+        lines, regressed = compare(results, baseline, args.tolerance)
+        print('\n'.join(lines))
+        if regressed:
+            print(f"{len(regressed)} case(s) regressed beyond {args.tolerance:.0%}: {', '.join(regressed)}")
+            if args.check:
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
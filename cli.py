@@ -0,0 +1,269 @@
+"""
+CMH1 Fusion - Headless batch runner
+Runs extraction jobs from a job file without a browser session (cron, worker boxes)
+
+Usage:
+    python cli.py jobs.json
+    python cli.py jobs.json --only work-inbox --parallel 1 --quiet
+
+Job file (JSON, or TOML on Python 3.11+):
+
+    {
+      "parallel": 2,
+      "parse_workers": 2,
+      "defaults": {"imap_server": "imap.example.com", "mode": "original"},
+      "jobs": [
+        {
+          "name": "work-inbox",
+          "imap_user": "me@example.com",
+          "imap_pass_env": "WORK_IMAP_PASSWORD",
+          "folder_name": "INBOX",
+          "start_num": 1,
+          "end_num": 500,
+          "profile": "newsletter-cleanup",
+          "output_dir": "/data/exports/work/inbox"
+        }
+      ]
+    }
+
+Every job accepts the options of the email tool page (see JOB_OPTIONS);
+"defaults" apply to every job and each job overrides them.
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from components.extraction import describe_run, run_extraction, validate_options
+from components.progress import ConsoleProgress
+from components.transform_profiles import load_profile
+from utils.config import (
+    DEFAULT_FETCH_CHUNK_SIZE,
+    DEFAULT_PARSE_WORKERS,
+    DEFAULT_PIPELINE_DEPTH,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_SIMILARITY_THRESHOLD
+)
+from utils.metrics import RunMetrics
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
+# Option defaults of a headless job (the page's widget defaults, but
+# resumable so an interrupted cron run continues where it stopped)
+JOB_DEFAULTS = {
+    'imap_server': 'imap.gmail.com',
+    'folder_name': 'INBOX',
+    'start_num': 1,
+    'end_num': sys.maxsize,
+    'extract_plain_only': False,
+    'extract_attachments': False,
+    'attachment_types': '',
+    'attachment_min_kb': 0,
+    'attachment_max_kb': 0,
+    'export_format': "Separate Files (ZIP)",
+    'remove_duplicates': True,
+    'dedup_content': False,
+    'similarity_threshold': DEFAULT_SIMILARITY_THRESHOLD,
+    'name_by_subj': True,
+    'rep_dom': False,
+    'p_from': '',
+    'std_headers': False,
+    'mod_eid': False,
+    'clean_auth': False,
+    'custom_headers_text': '',
+    'filter_since': None,
+    'filter_before': None,
+    'filter_from': '',
+    'filter_subject': '',
+    'filter_larger_kb': 0,
+    'filter_smaller_kb': 0,
+    'fetch_chunk_size': DEFAULT_FETCH_CHUNK_SIZE,
+    'pool_size': DEFAULT_POOL_SIZE,
+    'pipeline_depth': DEFAULT_PIPELINE_DEPTH,
+    'use_cache': False,
+    'resumable': True,
+    'use_dedup_index': False,
+    'dedup_index_scope': 'folder',
+    'use_search_index': False,
+}
+
+# Keys accepted in a job besides the processing options
+JOB_EXTRAS = {'name', 'mode', 'format', 'profile', 'imap_user', 'imap_pass', 'imap_pass_env',
+              'imap_pass_file', 'output_dir'}
+JOB_OPTIONS = set(JOB_DEFAULTS) | JOB_EXTRAS
+
+EXPORT_FORMATS = {'separate': "Separate Files (ZIP)", 'merged': "Merged Single File"}
+
+
+def load_job_file(path):
+    """
+    Read a JSON or TOML job file
+
+    Returns:
+        Dict with 'jobs' and optional 'defaults', 'parallel', 'parse_workers'
+    """
+    if path.endswith('.toml'):
+        if tomllib is None:
+            raise SystemExit("TOML job files need Python 3.11+; use JSON instead")
+        with open(path, 'rb') as f:
+            config = tomllib.load(f)
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    if not isinstance(config.get('jobs'), list) or not config['jobs']:
+        raise SystemExit(f"{path}: no jobs defined")
+    return config
+
+
+def _password(job):
+    """Resolve the password from the job, an environment variable or a file"""
+    if job.get('imap_pass'):
+        return job['imap_pass']
+    if job.get('imap_pass_env'):
+        value = os.environ.get(job['imap_pass_env'])
+        if not value:
+            raise ValueError(f"environment variable {job['imap_pass_env']} is not set")
+        return value
+    if job.get('imap_pass_file'):
+        with open(os.path.expanduser(job['imap_pass_file']), 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    raise ValueError("no password (imap_pass, imap_pass_env or imap_pass_file)")
+
+
+def _date(value):
+    if value is None or isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value))
+
+
+def build_job_options(job, defaults, index):
+    """
+    Turn one job entry into the processing options of the extraction engine
+
+    Args:
+        job: Job entry of the job file
+        defaults: 'defaults' section of the job file
+        index: Position of the job (for the default name)
+
+    Returns:
+        Tuple of (job name, options dict)
+    """
+    merged = {**defaults, **job}
+    name = str(merged.get('name') or f"job{index + 1}")
+    unknown = sorted(set(merged) - JOB_OPTIONS)
+    if unknown:
+        raise ValueError(f"unknown option(s): {', '.join(unknown)}")
+
+    options = {**JOB_DEFAULTS, **{k: v for k, v in merged.items() if k in JOB_DEFAULTS}}
+    if 'mode' in merged:
+        if merged['mode'] not in ('text', 'original', 'attachments'):
+            raise ValueError("mode must be 'text', 'original' or 'attachments'")
+        options['extract_plain_only'] = merged['mode'] == 'text'
+        options['extract_attachments'] = merged['mode'] == 'attachments'
+    if 'format' in merged:
+        if merged['format'] not in EXPORT_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+        options['export_format'] = EXPORT_FORMATS[merged['format']]
+    if merged.get('profile'):
+        plan = load_profile(merged['profile'])
+        if plan is None:
+            raise ValueError(f"transform profile '{merged['profile']}' not found")
+        options.update({
+            'rep_dom': plan.rep_dom,
+            'p_from': plan.p_from,
+            'std_headers': plan.std_headers,
+            'mod_eid': plan.mod_eid,
+            'clean_auth': plan.clean_auth,
+            'custom_headers_text': plan.custom_headers_text,
+        })
+
+    options['imap_user'] = merged.get('imap_user', '')
+    options['imap_pass'] = _password(merged)
+    options['filter_since'] = _date(options['filter_since'])
+    options['filter_before'] = _date(options['filter_before'])
+    options['output_dir'] = os.path.expanduser(merged.get('output_dir') or os.path.join('exports', name))
+    if not options['extract_plain_only']:
+        options['export_format'] = None
+    return name, options
+
+
+def run_job(name, options, quiet=False):
+    """
+    Run one job, logging to stderr and to the run statistics log
+
+    Returns:
+        Result dict of run_extraction() plus 'name' and 'seconds'
+    """
+    progress = ConsoleProgress(name, verbose=not quiet)
+    metrics = RunMetrics()
+    try:
+        result = run_extraction(options, progress, metrics)
+    finally:
+        metrics.finish()
+        try:
+            metrics.append_to_log(job=name, **describe_run(options))
+        except OSError:
+            pass
+    return {**result, 'name': name, 'seconds': round(metrics.elapsed, 1)}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run CMH1 Fusion extraction jobs without the web UI")
+    parser.add_argument('job_file', help="JSON (or TOML) job file")
+    parser.add_argument('--only', help="Comma-separated job names to run")
+    parser.add_argument('--parallel', type=int, help="Jobs running at the same time")
+    parser.add_argument('--parse-workers', type=int, help="Worker processes shared by all jobs")
+    parser.add_argument('--quiet', action='store_true', help="Only log results, warnings and errors")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_job_file(args.job_file)
+    defaults = config.get('defaults', {})
+
+    # Parsing runs in one process pool shared by every job
+    parse_workers = args.parse_workers
+    if parse_workers is None:
+        parse_workers = config.get('parse_workers', DEFAULT_PARSE_WORKERS)
+
+    jobs = []
+    for index, job in enumerate(config['jobs']):
+        try:
+            name, options = build_job_options(job, defaults, index)
+        except (ValueError, OSError) as e:
+            raise SystemExit(f"{args.job_file}: job {job.get('name') or index + 1}: {e}")
+        problem = validate_options(options)
+        if problem:
+            raise SystemExit(f"{args.job_file}: job {name}: {problem}")
+        options['parse_workers'] = parse_workers
+        jobs.append((name, options))
+
+    if args.only:
+        wanted = {n.strip() for n in args.only.split(',')}
+        jobs = [(name, options) for name, options in jobs if name in wanted]
+        if not jobs:
+            raise SystemExit(f"No job named {args.only}")
+
+    parallel = max(1, args.parallel or config.get('parallel', 1))
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = [executor.submit(run_job, name, options, args.quiet) for name, options in jobs]
+        results = [future.result() for future in futures]
+
+    print(f"{'job':<24} {'status':<8} {'emails':>7} {'seconds':>8}  output")
+    for (name, options), result in zip(jobs, results):
+        print(f"{name:<24} {result['status']:<8} {result['emails']:>7} {result['seconds']:>8}  "
+              f"{result['error'] or options['output_dir']}")
+    print(f"{len(results)} job(s) in {time.perf_counter() - started:.1f}s")
+    return 1 if any(r['status'] == 'failed' for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,5 @@
-"""Components package for CMH1 Fusion"""
-from . import email_processor
+"""
+Components package for CMH1 Fusion
 
-__all__ = ['email_processor']
+Modules are imported where they are used, so the CLI only loads what it needs.
+"""
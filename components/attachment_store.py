@@ -0,0 +1,153 @@
+"""
+Attachment Store
+Content-addressed files on disk: identical attachments are written once, named by SHA-256
+"""
+import csv
+import hashlib
+import os
+import tempfile
+
+MANIFEST_NAME = "manifest.csv"
+MANIFEST_FIELDS = ('folder', 'uid', 'message_id', 'date', 'sender', 'subject',
+                   'filename', 'content_type', 'size', 'sha256', 'path')
+
+
+class BlobWriter:
+    """
+    Receives one attachment in decoded slices
+
+    Bytes go straight to a temporary file in the store while the SHA-256 is
+    computed; commit() moves the file to its content address, or drops it
+    when the store already holds the same content.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.hash = hashlib.sha256()
+        self.size = 0
+        fd, self.temp_path = tempfile.mkstemp(dir=store.temp_dir)
+        self.file = os.fdopen(fd, 'wb')
+
+    def write(self, data):
+        if data:
+            self.hash.update(data)
+            self.file.write(data)
+            self.size += len(data)
+
+    def commit(self):
+        """
+        Store the file under its SHA-256
+
+        Returns:
+            Tuple of (sha256 hex digest, relative path, True if newly stored)
+        """
+        self.file.close()
+        digest = self.hash.hexdigest()
+        rel_path = self.store.rel_path(digest)
+        path = os.path.join(self.store.root, rel_path)
+        if os.path.exists(path):
+            os.remove(self.temp_path)
+            return digest, rel_path, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self.temp_path, path)
+        return digest, rel_path, True
+
+    def abort(self):
+        """Throw the partial file away"""
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class AttachmentStore:
+    """
+    Directory of attachments addressed by content
+
+    Each file lives at <sha256[:2]>/<sha256> under root, and manifest.csv
+    maps messages (folder, UID, Message-ID, ...) to the files, one row per
+    attachment occurrence. Rows are appended, so a store kept across runs
+    accumulates the manifests of every run and never rewrites a file. The
+    rows of the current run are also kept in a separate temporary manifest,
+    which is what pack() ships.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.temp_dir = os.path.join(root, '.incoming')
+        os.makedirs(self.temp_dir, exist_ok=True)
+        manifest_path = os.path.join(root, MANIFEST_NAME)
+        new_manifest = not os.path.exists(manifest_path)
+        self.manifest_file = open(manifest_path, 'a', encoding='utf-8', newline='')
+        self.manifest = csv.DictWriter(self.manifest_file, fieldnames=MANIFEST_FIELDS)
+        if new_manifest:
+            self.manifest.writeheader()
+        fd, self.run_manifest_path = tempfile.mkstemp(dir=self.temp_dir, suffix='.csv')
+        self.run_manifest_file = os.fdopen(fd, 'w', encoding='utf-8', newline='')
+        self.run_manifest = csv.DictWriter(self.run_manifest_file, fieldnames=MANIFEST_FIELDS)
+        self.run_manifest.writeheader()
+        self.stored = []
+        self.run_paths = {}
+        self.attachments = 0
+        self.bytes_written = 0
+
+    @staticmethod
+    def rel_path(digest):
+        """Relative path of the file with this SHA-256"""
+        return f"{digest[:2]}/{digest}"
+
+    def writer(self):
+        """Start receiving one attachment"""
+        return BlobWriter(self)
+
+    def record(self, writer, **row):
+        """
+        Commit an attachment and add its manifest row
+
+        Args:
+            writer: BlobWriter holding the decoded content
+            **row: Manifest fields describing the message and the attachment
+
+        Returns:
+            True if the content was new to the store
+        """
+        digest, rel_path, new = writer.commit()
+        row = {**row, 'size': writer.size, 'sha256': digest, 'path': rel_path}
+        self.manifest.writerow(row)
+        self.run_manifest.writerow(row)
+        self.run_paths[rel_path] = None
+        self.attachments += 1
+        if new:
+            self.stored.append(rel_path)
+            self.bytes_written += writer.size
+        return new
+
+    def close(self):
+        """Flush the manifests; the staging directory goes with discard()"""
+        self.manifest_file.close()
+        self.run_manifest_file.close()
+
+    def discard(self):
+        """Remove this run's manifest, and the staging directory once it is empty"""
+        if os.path.exists(self.run_manifest_path):
+            os.remove(self.run_manifest_path)
+        try:
+            os.rmdir(self.temp_dir)
+        except OSError:
+            pass  # another run is still staging files
+
+    def pack(self, sink, chunk_size):
+        """
+        Stream this run's manifest and the files it stored into a sink
+
+        Only the rows of this run are packed, with every file they refer to
+        (also those stored by earlier runs of a kept store), so each path in
+        the packed manifest is in the archive.
+        Files are read in chunks; none is loaded whole into memory.
+
+        Args:
+            sink: OutputSink (e.g. a ZIP download); closed store required
+            chunk_size: Read size of the files
+        """
+        sink.add_file(MANIFEST_NAME, self.run_manifest_path, chunk_size)
+        for rel_path in self.run_paths:
+            sink.add_file(rel_path, os.path.join(self.root, rel_path), chunk_size)
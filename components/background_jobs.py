@@ -0,0 +1,315 @@
+"""
+Background Jobs
+Runs extractions on a shared executor so they survive Streamlit reruns
+"""
+import os
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from components.extraction import describe_run, run_extraction
+from components.progress import ProgressReporter
+from utils.config import (
+    DOWNLOAD_BUTTON_MAX_BYTES,
+    JOB_ARTIFACT_TTL,
+    MAX_BACKGROUND_JOBS,
+    MAX_JOBS_PER_USER,
+    STATIC_DOWNLOAD_DIR,
+    STATIC_DOWNLOAD_URL
+)
+from utils.metrics import RunMetrics
+
+
+class JobLimitError(Exception):
+    """Raised when a user already has the maximum number of running jobs"""
+
+
+def _file_size(fileobj):
+    """Size of an open binary file; leaves it positioned at the start"""
+    size = fileobj.seek(0, os.SEEK_END)
+    fileobj.seek(0)
+    return size
+
+
+def publish_download(parts, root=STATIC_DOWNLOAD_DIR):
+    """
+    Place download parts in the static file directory
+
+    The files are hard-linked when they already exist on disk and copied
+    in chunks otherwise, under a random directory name that serves as the
+    access token of the link.
+
+    Args:
+        parts: List of (file name, binary file object)
+        root: Directory served by Streamlit's static file route
+
+    Returns:
+        Tuple of (directory created, {file name: URL})
+    """
+    token = uuid.uuid4().hex
+    directory = os.path.join(root, token)
+    os.makedirs(directory)
+    links = {}
+    for name, fileobj in parts:
+        target = os.path.join(directory, os.path.basename(name))
+        source = getattr(fileobj, 'name', None)
+        try:
+            if not isinstance(source, str):
+                raise OSError
+            os.link(source, target)
+        except OSError:
+            fileobj.seek(0)
+            with open(target, 'wb') as f:
+                shutil.copyfileobj(fileobj, f, 1024 * 1024)
+        links[name] = f"{STATIC_DOWNLOAD_URL}/{token}/{os.path.basename(name)}"
+    return directory, links
+
+
+def sweep_static_downloads(ttl, root=STATIC_DOWNLOAD_DIR, now=None):
+    """Remove published downloads older than ttl seconds (e.g. left by a restart)"""
+    now = now or time.time()
+    try:
+        entries = list(os.scandir(root))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if now - entry.stat().st_mtime > ttl:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            continue
+
+
+class RecordingProgress(ProgressReporter):
+    """
+    Keeps the latest status, progress and artifacts of a job
+
+    The job thread writes, page reruns read a snapshot(); artifacts held in
+    spooled temporary files stay alive here until they are released.
+    Artifacts larger than DOWNLOAD_BUTTON_MAX_BYTES are published to the
+    static file directory by the job thread and offered as links, so the
+    page never reads them into memory.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.status = None
+        self.fraction = 0.0
+        self.details_list = []
+        self.artifacts = []
+        self.traceback = None
+
+    def _set(self, level, message):
+        with self._lock:
+            self.status = (level, message)
+
+    def info(self, message):
+        self._set('info', message)
+
+    def success(self, message):
+        self._set('success', message)
+
+    def warning(self, message):
+        self._set('warning', message)
+
+    def error(self, message):
+        self._set('error', message)
+
+    def exception(self, error):
+        with self._lock:
+            self.status = ('error', f"❌ {type(error).__name__}: {error}")
+            self.traceback = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+
+    def progress(self, fraction):
+        self.fraction = min(1.0, max(0.0, fraction))
+
+    def done(self):
+        self.fraction = 1.0
+
+    def details(self, title, lines):
+        with self._lock:
+            self.details_list.append((title, list(lines)))
+
+    def artifact(self, sink, label, file_name, mime):
+        if sink.path:
+            super().artifact(sink, label, file_name, mime)
+            return
+        parts = sink.downloads(file_name)
+        files = [name for name, _ in parts]
+        entry = {'sink': sink, 'label': label, 'file_name': file_name,
+                 'files': files, 'mime': mime, 'links': None, 'directory': None}
+        if sum(_file_size(data) for _, data in parts) > DOWNLOAD_BUTTON_MAX_BYTES:
+            try:
+                entry['directory'], entry['links'] = publish_download(parts)
+            except OSError:
+                pass  # fall back to download buttons
+            else:
+                sink.discard()
+        with self._lock:
+            self.artifacts.append(entry)
+
+    def snapshot(self):
+        """Return a consistent copy of the recorded state"""
+        with self._lock:
+            return {
+                'status': self.status,
+                'fraction': self.fraction,
+                'details': list(self.details_list),
+                'artifacts': list(self.artifacts),
+                'traceback': self.traceback,
+            }
+
+    def release(self):
+        """Drop the artifacts and free their temporary files"""
+        with self._lock:
+            artifacts, self.artifacts = self.artifacts, []
+        for artifact in artifacts:
+            artifact['sink'].discard()
+            if artifact['directory']:
+                shutil.rmtree(artifact['directory'], ignore_errors=True)
+
+
+class BackgroundJob:
+    """One extraction run submitted to the JobManager"""
+
+    def __init__(self, job_id, owner, kwargs, metrics=None, runner=run_extraction):
+        self.id = job_id
+        self.owner = owner
+        self.kwargs = kwargs
+        self.runner = runner
+        self.run_info = describe_run(kwargs)
+        self.metrics = metrics or RunMetrics()
+        self.progress = RecordingProgress()
+        self.state = 'queued'
+        self.result = None
+        self.submitted = time.time()
+        self.finished = None
+        self.downloaded = set()
+
+    @property
+    def active(self):
+        return self.state in ('queued', 'running')
+
+    def run(self):
+        """Run the extraction (called on the executor thread)"""
+        self.state = 'running'
+        # cProfile only sees the thread that enables it
+        self.metrics.start_profiling()
+        try:
+            self.result = self.runner(self.kwargs, self.progress, self.metrics)
+        except Exception as e:
+            self.progress.exception(e)
+            self.result = {'status': 'failed', 'emails': 0, 'error': str(e)}
+        finally:
+            self.metrics.finish()
+            try:
+                self.metrics.append_to_log(**self.run_info)
+            except OSError:
+                pass
+            # Passwords are not needed any more
+            self.kwargs.pop('imap_pass', None)
+            for target in self.kwargs.get('targets') or ():
+                target.pop('imap_pass', None)
+            self.finished = time.time()
+            self.state = self.result['status'] if self.result else 'failed'
+
+
+class JobManager:
+    """
+    Process-wide registry of background extraction jobs
+
+    Jobs run on a thread pool shared by all sessions and are looked up by
+    ID, so a rerun (or a new browser tab of the same session) picks them up
+    again. Each owner may have max_per_user jobs queued or running; finished
+    jobs and their artifacts are dropped when released or after ttl seconds.
+    """
+
+    def __init__(self, max_workers=MAX_BACKGROUND_JOBS, max_per_user=MAX_JOBS_PER_USER,
+                 ttl=JOB_ARTIFACT_TTL):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='extraction')
+        self.max_per_user = max_per_user
+        self.ttl = ttl
+        self.jobs = {}
+        self._lock = threading.Lock()
+        # Links published before a restart point at jobs that are gone
+        sweep_static_downloads(0)
+
+    def submit(self, owner, kwargs, metrics=None, runner=run_extraction):
+        """
+        Queue an extraction
+
+        Args:
+            owner: Key the concurrency cap applies to (e.g. the IMAP account)
+            kwargs: Processing options for the runner
+            metrics: Optional RunMetrics of the run
+            runner: Function called as runner(kwargs, progress, metrics),
+                e.g. run_extraction or run_batch
+
+        Returns:
+            BackgroundJob
+
+        Raises:
+            JobLimitError: If the owner already has max_per_user active jobs
+        """
+        self.sweep()
+        with self._lock:
+            active = sum(1 for job in self.jobs.values() if job.owner == owner and job.active)
+            if active >= self.max_per_user:
+                raise JobLimitError(
+                    f"{active} job(s) already running for this account (limit {self.max_per_user})"
+                )
+            job = BackgroundJob(uuid.uuid4().hex[:12], owner, dict(kwargs), metrics, runner)
+            self.jobs[job.id] = job
+        self.executor.submit(job.run)
+        return job
+
+    def get(self, job_id):
+        """Return the job with this ID, or None if it was released or expired"""
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def downloaded(self, job_id, file_name):
+        """Note that one download of a job was fetched; release the job after the last one"""
+        job = self.get(job_id)
+        if job is None:
+            return
+        job.downloaded.add(file_name)
+        parts = {name for artifact in job.progress.snapshot()['artifacts']
+                 for name in artifact['files']}
+        if parts <= job.downloaded:
+            self.release(job_id)
+
+    def release(self, job_id):
+        """Forget a finished job and free its artifacts"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.active:
+                return
+            del self.jobs[job_id]
+        job.progress.release()
+
+    def sweep(self, now=None):
+        """Release finished jobs older than the TTL"""
+        now = now or time.time()
+        with self._lock:
+            expired = [job.id for job in self.jobs.values()
+                       if not job.active and now - job.finished > self.ttl]
+        for job_id in expired:
+            self.release(job_id)
+        sweep_static_downloads(self.ttl, now=now)
+
+
+_shared_manager = None
+_shared_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Return the process-wide JobManager shared by all sessions"""
+    global _shared_manager
+    with _shared_lock:
+        if _shared_manager is None:
+            _shared_manager = JobManager()
+        return _shared_manager
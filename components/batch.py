@@ -0,0 +1,233 @@
+"""
+Batch Extraction
+Runs many (account, folder, range) targets concurrently under one connection budget
+"""
+import os
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from components.extraction import run_extraction
+from components.output_sinks import PrefixedSink, open_sink, zip_options
+from components.progress import ProgressReporter
+from utils.config import DEFAULT_CONNECTION_BUDGET, DEFAULT_POOL_SIZE, max_connections_for
+
+BATCH_ARCHIVE_NAME = "emails_batch.zip"
+
+
+class ConnectionBudget:
+    """
+    Hands out IMAP connections under a global limit
+
+    Connections to one server never exceed that server's own limit
+    (max_connections_for), however many targets use it. acquire() blocks
+    until at least one connection is free and may grant fewer than asked.
+    """
+
+    def __init__(self, total=DEFAULT_CONNECTION_BUDGET):
+        self.total = max(1, int(total))
+        self.in_use = 0
+        self.per_server = Counter()
+        self._cond = threading.Condition()
+
+    def _free(self, server):
+        return min(self.total - self.in_use,
+                   max_connections_for(server) - self.per_server[server.strip().lower()])
+
+    def acquire(self, server, wanted):
+        """
+        Reserve connections to a server
+
+        Args:
+            server: IMAP server host name
+            wanted: Connections the target would like to use
+
+        Returns:
+            Number of connections granted (at least 1)
+        """
+        with self._cond:
+            while self._free(server) < 1:
+                self._cond.wait()
+            granted = min(max(1, wanted), self._free(server))
+            self.in_use += granted
+            self.per_server[server.strip().lower()] += granted
+            return granted
+
+    def release(self, server, count):
+        """Return connections reserved with acquire()"""
+        with self._cond:
+            self.in_use -= count
+            self.per_server[server.strip().lower()] -= count
+            self._cond.notify_all()
+
+
+class BatchProgress:
+    """Combines the progress of all targets into one ProgressReporter"""
+
+    def __init__(self, progress, count):
+        self.progress = progress
+        self.fractions = [0.0] * count
+        self._lock = threading.Lock()
+
+    def update(self, index, fraction):
+        with self._lock:
+            self.fractions[index] = fraction
+            overall = sum(self.fractions) / len(self.fractions)
+        self.progress.progress(overall)
+
+    def target(self, index, label):
+        """Reporter for one target"""
+        return TargetProgress(self, index, label)
+
+
+class TargetProgress(ProgressReporter):
+    """
+    Forwards the messages of one target, prefixed with its label
+
+    Errors are reported as warnings: one failing folder does not stop the
+    batch, and the summary lists it.
+    """
+
+    def __init__(self, batch, index, label):
+        self.batch = batch
+        self.index = index
+        self.prefix = f"[{label}] "
+
+    def info(self, message):
+        self.batch.progress.info(self.prefix + message)
+
+    def success(self, message):
+        self.batch.progress.info(self.prefix + message)
+
+    def warning(self, message):
+        self.batch.progress.warning(self.prefix + message)
+
+    def error(self, message):
+        self.batch.progress.warning(self.prefix + message)
+
+    def exception(self, error):
+        self.batch.progress.warning(f"{self.prefix}{type(error).__name__}: {error}")
+
+    def progress(self, fraction):
+        self.batch.update(self.index, fraction)
+
+    def done(self):
+        self.batch.update(self.index, 1.0)
+
+    def details(self, title, lines):
+        self.batch.progress.details(self.prefix + title, lines)
+
+
+def _path_part(text):
+    """Make one folder or account name safe as a path component"""
+    part = re.sub(r'[^\w@.\- ]', '_', text.strip()).strip('. ')
+    return part or '_'
+
+
+def target_label(target):
+    """Short display name of a target, e.g. 'me@example.com/INBOX'"""
+    return f"{target['imap_user']}/{target['folder_name']}"
+
+
+def target_path(target):
+    """Relative output path of a target: account, then the folder hierarchy"""
+    folders = [_path_part(p) for p in target['folder_name'].split('/') if p.strip()]
+    return '/'.join([_path_part(target['imap_user'])] + (folders or ['_']))
+
+
+def run_batch(kwargs, progress=None, metrics=None, budget=None):
+    """
+    Run several extraction targets concurrently
+
+    Every target is a dict with imap_server, imap_user, imap_pass,
+    folder_name, start_num and end_num; all other options are shared. Each
+    target asks for pool_size connections out of the budget. Downloads go
+    into one ZIP with a directory per account and folder; with output_dir
+    every target writes to output_dir/<account>/<folder>.
+
+    Args:
+        kwargs: Shared processing options plus 'targets' and optional
+            'connection_budget' (total connections across targets)
+        progress: Optional ProgressReporter receiving the combined progress,
+            the per-folder summary and the archive
+        metrics: Optional RunMetrics shared by all targets
+        budget: Optional ConnectionBudget (e.g. shared between batches)
+
+    Returns:
+        Dict with 'status', 'emails' and 'error' like run_extraction(), plus
+        'targets': one dict per target with 'label', 'status', 'emails',
+        'error' and 'seconds'
+    """
+    progress = progress or ProgressReporter()
+    targets = kwargs['targets']
+    budget = budget or ConnectionBudget(kwargs.get('connection_budget') or DEFAULT_CONNECTION_BUDGET)
+    shared = {k: v for k, v in kwargs.items() if k not in ('targets', 'connection_budget')}
+    output_dir = kwargs.get('output_dir')
+    wanted = kwargs.get('pool_size') or DEFAULT_POOL_SIZE
+
+    archive = None
+    archive_lock = threading.Lock()
+    if not output_dir:
+        archive = open_sink("zip", BATCH_ARCHIVE_NAME, None, zip_options(kwargs))
+
+    batch = BatchProgress(progress, len(targets))
+    progress.info(f"📚 Running {len(targets)} target(s) with up to {budget.total} connection(s)")
+
+    def run_target(index, target):
+        label = target_label(target)
+        options = {**shared, **target}
+        sink = None
+        if archive is not None:
+            sink = PrefixedSink(archive, target_path(target), archive_lock)
+        else:
+            options['output_dir'] = os.path.join(output_dir, *target_path(target).split('/'))
+
+        granted = budget.acquire(target['imap_server'], wanted)
+        started = time.perf_counter()
+        try:
+            options['pool_size'] = granted
+            result = run_extraction(options, batch.target(index, label), metrics, sink)
+        finally:
+            budget.release(target['imap_server'], granted)
+        batch.update(index, 1.0)
+        return {**result, 'label': label, 'seconds': round(time.perf_counter() - started, 1)}
+
+    with ThreadPoolExecutor(max_workers=min(len(targets), budget.total)) as executor:
+        futures = [executor.submit(run_target, i, target) for i, target in enumerate(targets)]
+        results = [future.result() for future in futures]
+
+    emails = sum(r['emails'] for r in results)
+    failed = [r for r in results if r['status'] == 'failed']
+    progress.done()
+    progress.details("📊 Per-folder results", [
+        f"{r['label']}: {r['status']} · {r['emails']} email(s) · {r['seconds']} s"
+        + (f" · {r['error']}" if r['error'] else '')
+        for r in results
+    ])
+
+    if archive is not None:
+        archive.close()
+        if emails:
+            progress.artifact(archive, "📥 Download Batch Archive (ZIP)", BATCH_ARCHIVE_NAME,
+                              "application/zip")
+        else:
+            archive.discard()
+
+    if len(failed) == len(results):
+        status = 'failed'
+    elif emails == 0 and not failed:
+        status = 'empty'
+    else:
+        status = 'done'
+    error = f"{len(failed)} of {len(results)} target(s) failed" if failed else None
+    if status == 'failed':
+        progress.error(f"❌ {error}")
+    elif failed:
+        progress.warning(f"⚠️ Exported {emails} emails; {error}")
+    elif status == 'done':
+        progress.success(f"🎉 Exported {emails} emails from {len(results)} target(s)")
+    else:
+        progress.info("📭 No emails to export in any target")
+    return {'status': status, 'emails': emails, 'error': error, 'targets': results}
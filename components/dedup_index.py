@@ -0,0 +1,241 @@
+"""
+Dedup Index
+Persistent SQLite record of exported emails, so later runs skip what was already exported
+"""
+import hashlib
+import os
+import sqlite3
+import struct
+import time
+
+from utils.config import DEDUP_INDEX_DIR, DEFAULT_FETCH_CHUNK_SIZE, FINGERPRINT_SIZE
+from utils.fingerprint import NearDuplicateIndex
+from utils.imap_fetch import chunk_ids
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS exported (
+    id INTEGER PRIMARY KEY,
+    folder TEXT NOT NULL,
+    uidvalidity INTEGER,
+    uid INTEGER,
+    message_id TEXT,
+    body_hash TEXT,
+    signature BLOB,
+    exported_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS exported_message_id ON exported (message_id);
+CREATE INDEX IF NOT EXISTS exported_body_hash ON exported (body_hash);
+"""
+
+# One row per exported message; created by _ensure_unique_key(), which
+# first drops duplicate rows left by versions without it
+_UNIQUE_KEY = """
+CREATE UNIQUE INDEX IF NOT EXISTS exported_key ON exported (folder, uidvalidity, uid)
+"""
+
+_SIGNATURE = struct.Struct(f'<{FINGERPRINT_SIZE}Q')
+
+
+class DedupIndex:
+    """
+    Exported Message-IDs, body hashes and MinHash signatures of one account
+
+    One SQLite database per account; every row records the folder it was
+    exported from, so lookups can be limited to one folder or cover the
+    whole account. Lookups and inserts are batched, with one transaction
+    per chunk.
+    """
+
+    def __init__(self, server, user, root=DEDUP_INDEX_DIR):
+        key = hashlib.sha256(f"{server}\0{user}".encode('utf-8')).hexdigest()[:32]
+        os.makedirs(root, exist_ok=True)
+        self.path = os.path.join(root, f"{key}.sqlite3")
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(_SCHEMA)
+        self._ensure_unique_key()
+        self._near = None
+
+    def _ensure_unique_key(self):
+        """Add the unique (folder, uidvalidity, uid) index, keeping the newest of duplicate rows"""
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'exported_key'"
+        ).fetchone()
+        if exists:
+            return
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM exported WHERE uid IS NOT NULL AND id NOT IN "
+                "(SELECT MAX(id) FROM exported WHERE uid IS NOT NULL "
+                "GROUP BY folder, uidvalidity, uid)"
+            )
+            self.conn.execute("DROP INDEX IF EXISTS exported_uid")
+            self.conn.execute(_UNIQUE_KEY)
+
+    def close(self):
+        """Close the database"""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def _scope_clause(folder):
+        """SQL filter and parameters limiting a query to a folder"""
+        if folder is None:
+            return '', []
+        return ' AND folder = ?', [folder]
+
+    def _lookup(self, column, values, folder, chunk_size):
+        """Return the subset of values present in a column (batched IN queries)"""
+        found = set()
+        clause, params = self._scope_clause(folder)
+        values = list(values)
+        for _, chunk in chunk_ids(values, chunk_size):
+            marks = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT DISTINCT {column} FROM exported WHERE {column} IN ({marks}){clause}",
+                list(chunk) + params
+            )
+            found.update(row[0] for row in rows)
+        return found
+
+    def known_uids(self, folder, uidvalidity, uids, chunk_size=DEFAULT_FETCH_CHUNK_SIZE):
+        """
+        Find UIDs of a folder that were already exported
+
+        Args:
+            folder: Folder name
+            uidvalidity: Current UIDVALIDITY of the folder
+            uids: Iterable of UIDs (bytes, str or int)
+            chunk_size: UIDs per query
+
+        Returns:
+            Set of exported UIDs (int)
+        """
+        if uidvalidity is None:
+            return set()
+        found = set()
+        numbers = [int(u) for u in uids]
+        for _, chunk in chunk_ids(numbers, chunk_size):
+            marks = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT uid FROM exported WHERE folder = ? AND uidvalidity = ? AND uid IN ({marks})",
+                [folder, int(uidvalidity)] + chunk
+            )
+            found.update(row[0] for row in rows)
+        return found
+
+    def _near_index(self, folder, threshold):
+        """LSH index over stored signatures, built once per scope and threshold"""
+        if self._near and self._near[0] == (folder, threshold):
+            return self._near[1]
+
+        index = NearDuplicateIndex(threshold)
+        clause, params = self._scope_clause(folder)
+        rows = self.conn.execute(
+            f"SELECT id, signature FROM exported WHERE signature IS NOT NULL{clause}", params
+        )
+        for rowid, blob in rows:
+            index.add(rowid, _SIGNATURE.unpack(blob))
+        self._near = ((folder, threshold), index)
+        return index
+
+    def find_exported(self, entries, folder=None, threshold=None,
+                      chunk_size=DEFAULT_FETCH_CHUNK_SIZE):
+        """
+        Match emails against earlier exports
+
+        Args:
+            entries: List of email data dicts with 'id', 'message_id' and,
+                when fingerprinted, 'body_hash' and 'signature'
+            folder: Limit matches to this folder (None = whole account)
+            threshold: Near-duplicate similarity threshold (None = exact only)
+            chunk_size: Values per lookup query
+
+        Returns:
+            Dict of email id -> reason
+        """
+        ids = self._lookup('message_id', {e['message_id'] for e in entries if e.get('message_id')},
+                           folder, chunk_size)
+        hashes = self._lookup('body_hash', {e['body_hash'] for e in entries if e.get('body_hash')},
+                              folder, chunk_size)
+        near = None
+        if threshold and any(e.get('signature') for e in entries):
+            near = self._near_index(folder, threshold)
+            if not len(near):
+                near = None
+
+        matches = {}
+        for entry in entries:
+            if entry.get('message_id') in ids:
+                matches[entry['id']] = "Already exported (Message-ID)"
+            elif entry.get('body_hash') in hashes:
+                matches[entry['id']] = "Already exported (identical body)"
+            elif near is not None and entry.get('signature'):
+                found = near.query(entry['signature'])
+                if found:
+                    matches[entry['id']] = f"Already exported (near-duplicate, {found[1]:.0%} similar)"
+        return matches
+
+    def record(self, folder, uidvalidity, entries, chunk_size=DEFAULT_FETCH_CHUNK_SIZE):
+        """
+        Record exported emails
+
+        Exporting a message again updates its row: fingerprints are
+        replaced when the new export has them, and the export time is
+        refreshed.
+
+        Args:
+            folder: Folder name
+            uidvalidity: UIDVALIDITY the UIDs belong to
+            entries: Iterable of dicts with 'uid' and optionally
+                'message_id', 'body_hash' and 'signature'
+            chunk_size: Rows per transaction
+        """
+        now = time.time()
+        rows = []
+        for entry in entries:
+            signature = entry.get('signature')
+            rows.append((
+                folder,
+                int(uidvalidity) if uidvalidity is not None else None,
+                int(entry['uid']) if entry.get('uid') is not None else None,
+                entry.get('message_id') or None,
+                entry.get('body_hash') or None,
+                _SIGNATURE.pack(*signature) if signature else None,
+                now,
+            ))
+
+        for _, chunk in chunk_ids(rows, chunk_size):
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO exported (folder, uidvalidity, uid, message_id, body_hash, "
+                    "signature, exported_at) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (folder, uidvalidity, uid) DO UPDATE SET "
+                    "message_id = COALESCE(excluded.message_id, message_id), "
+                    "body_hash = COALESCE(excluded.body_hash, body_hash), "
+                    "signature = COALESCE(excluded.signature, signature), "
+                    "exported_at = excluded.exported_at",
+                    chunk
+                )
+        self._near = None
+
+    def count(self, folder=None):
+        """Number of recorded exports in a folder (None = whole account)"""
+        clause, params = self._scope_clause(folder)
+        return self.conn.execute(f"SELECT COUNT(*) FROM exported WHERE 1{clause}", params).fetchone()[0]
+
+    def clear(self, folder=None):
+        """
+        Forget recorded exports
+
+        Args:
+            folder: Only forget this folder (None = whole account)
+        """
+        clause, params = self._scope_clause(folder)
+        with self.conn:
+            self.conn.execute(f"DELETE FROM exported WHERE 1{clause}", params)
+        self._near = None
@@ -2,15 +2,87 @@
 Email Processor Component
 Handles the actual processing of emails in different formats
 """
-import streamlit as st
-import email
-import zipfile
-import io
-import re
-from utils.email_utils import get_email_body_text, clean_filename
+import shutil
+import tempfile
+from functools import partial
 
+from components.attachment_store import AttachmentStore
+from components.output_sinks import open_sink
+from components.pipeline import pipelined
+from utils.attachments import AttachmentFilter, StreamDecoder, decoded_size
+from utils.body_structure import (
+    decode_text_payload,
+    fetch_attachment_lists,
+    fetch_part_chunks,
+    fetch_text_bodies,
+    payload_size
+)
+from utils.config import ATTACHMENT_CHUNK_BYTES, DEFAULT_FETCH_CHUNK_SIZE, DEFAULT_PARSE_WORKERS
+from utils.email_utils import clean_filename, decode_header_text
+from utils.header_rewriter import TransformPlan, split_message
+from utils.imap_fetch import fetch_batched, interrupt_fetches
+from utils.metrics import timed
 
-def process_text_extraction(mail, id_list, export_format, name_by_subj, status_msg, prog_bar):
+
+def _rewrite_original(plan, header_block):
+    """
+    Pipeline transform for original-format exports (runs in a worker)
+    
+    Only the header block is sent to the worker and only the rewritten
+    header travels back; the body stays with the writer, which slices it
+    from the raw message. The plan is the pipeline's run context, sent to
+    each worker once.
+    
+    Args:
+        plan: TransformPlan of the run
+        header_block: Header block bytes including the blank line that ends it
+        
+    Returns:
+        Tuple of (header bytes, separator bytes, subject)
+    """
+    (head, sep, _), subject = plan.apply(header_block)
+    return head, sep, subject
+
+
+def _header_payloads(fetched):
+    """
+    Split fetched messages into pipeline items for _rewrite_original
+    
+    Args:
+        fetched: Iterable of (index, email ID, FETCH items) with RFC822
+        
+    Returns:
+        Generator of ((index, UID, raw, body offset), header block, size)
+    """
+    for i, eid, items in fetched:
+        raw = items['RFC822']
+        body_start = len(raw) - len(split_message(raw)[2])
+        yield (i, items.get('UID', eid), raw, body_start), raw[:body_start], len(raw)
+
+
+def _report_unfetched(progress, id_list, seen):
+    """
+    Warn about emails the server did not return (expunged or refused)
+    
+    Args:
+        progress: ProgressReporter
+        id_list: Email IDs requested from the server
+        seen: Set of int IDs that were returned
+    """
+    missing = [eid for eid in id_list if int(eid) not in seen]
+    if not missing:
+        return
+    progress.warning(f"⚠️ {len(missing)} email(s) could not be fetched from the server and were not exported")
+    lines = [f"UID {int(eid)}" for eid in missing[:20]]
+    if len(missing) > 20:
+        lines.append(f"... and {len(missing)-20} more")
+    progress.details(f"📋 View {len(missing)} Unfetched Emails", lines)
+
+
+def process_text_extraction(mail, id_list, export_format, name_by_subj, progress,
+                            chunk_size=DEFAULT_FETCH_CHUNK_SIZE, prefetched=None, output_dir=None,
+                            job=None, workers=DEFAULT_PARSE_WORKERS, metrics=None, zip_settings=None,
+                            sink=None, search_index=None, folder=None, uidvalidity=None):
     """
     Process emails and extract only plain text bodies
     
@@ -19,171 +91,158 @@ def process_text_extraction(mail, id_list, export_format, name_by_subj, status_m
         id_list: List of email IDs to process
         export_format: "Separate Files (ZIP)" or "Merged Single File"
         name_by_subj: Boolean to name files by subject
-        status_msg: Streamlit message placeholder
-        prog_bar: Streamlit progress bar
+        progress: ProgressReporter receiving status, progress and the artifact
+        chunk_size: Number of messages fetched per IMAP FETCH command
+        prefetched: Optional dict of eid -> FETCH items already downloaded
+        output_dir: Optional directory to write to instead of a download
+        job: Optional ExtractionJob used to checkpoint and resume progress
+        workers: Worker processes decoding bodies (0 = decode in this process)
+        metrics: Optional RunMetrics collecting per-stage timings
+        zip_settings: Optional ZipSink settings (compression, level, threads, volumes)
+        sink: Optional OutputSink to write into instead of a new one
+            (e.g. the folder of a batch archive)
+        search_index: Optional SearchIndex receiving each body and its headers
+        folder: Folder name recorded in the search index
+        uidvalidity: UIDVALIDITY of the folder recorded in the search index
+    
+    Returns:
+        List of the UIDs written to the output (including those written
+        before a resumed job was interrupted)
     """
-    if "Merged" in export_format:
-        # Extract to merged single file
-        full_extracted_text = []
-        
-        for i, eid in enumerate(id_list):
+    merged = "Merged" in export_format
+    file_name = "emails_bodies_merged.txt" if merged else "emails_bodies_separate.zip"
+    kind = "merged" if merged else "zip"
+    if sink is None:
+        sink = (job.open_sink if job else open_sink)(kind, file_name, output_dir, zip_settings)
+    
+    # Resumed jobs skip what is already done; the sink continues after it
+    start = job.completed if job else 0
+    exported = job.exported if job else []
+    
+    with sink:
+        # Only the chosen text part of each message is downloaded; decoding
+        # overlaps with the download and results are written in order
+        remaining = id_list[start:]
+        seen = set()
+        fetched = (
+            ((i, eid, headers), payload, payload_size(payload))
+            for i, eid, headers, payload in fetch_text_bodies(mail, remaining, chunk_size, prefetched,
+                                                              decode=False,
+                                                              with_headers=search_index is not None)
+        )
+        if metrics:
+            fetched = metrics.timed_iter('fetch', fetched, size=lambda item: item[2])
+        for (i, eid, headers), body_content in pipelined(fetched, decode_text_payload, workers,
+                                                         metrics=metrics, stage='parse',
+                                                         interrupt=partial(interrupt_fetches, mail)):
+            i += start
+            seen.add(int(eid))
             try:
-                _, msg_data = mail.fetch(eid, '(RFC822)')
-                raw_bytes = msg_data[0][1]
-                email_message = email.message_from_bytes(raw_bytes)
-                
-                # Get clean body text
-                body_content = get_email_body_text(email_message)
-                
+                if isinstance(body_content, Exception):
+                    continue
+                original_subj = headers
+                if search_index is not None:
+                    original_subj = headers.get('Subject', 'no_subject')
+                    with timed(metrics, 'index'):
+                        search_index.add(folder, uidvalidity, eid, headers, body_content)
                 if body_content:
-                    full_extracted_text.append(body_content)
+                    # Create filename
+                    if name_by_subj:
+                        subj = clean_filename(original_subj)
+                        fname = f"{i+1}_{subj}.txt"
+                    else:
+                        fname = f"email_{i+1}.txt"
+                    
+                    with timed(metrics, sink.stage):
+                        sink.add(fname, body_content)
+                    exported.append(int(eid))
+                    if metrics:
+                        metrics.count_message()
                 
-                prog_bar.progress((i + 1) / len(id_list))
+                progress.progress((i + 1) / len(id_list))
             except:
                 continue
-        
-        # Merge with separator
-        final_output = "\n__SEP__\n".join(full_extracted_text)
-        
-        prog_bar.empty()
-        status_msg.success(f"🎉 Extracted {len(full_extracted_text)} emails into 1 merged file!")
-        
-        st.download_button(
-            label="📥 Download Merged Text File (.txt)",
-            data=final_output,
-            file_name="emails_bodies_merged.txt",
-            mime="text/plain",
-            use_container_width=True
-        )
+            finally:
+                if job:
+                    job.mark_done(i, eid)
+    
+    if job:
+        job.finish()
+    progress.done()
+    _report_unfetched(progress, remaining, seen)
     
+    if merged:
+        progress.success(f"🎉 Extracted {sink.count} emails into 1 merged file!")
+        progress.artifact(sink, "📥 Download Merged Text File (.txt)", file_name, "text/plain")
     else:
-        # Extract to separate files in ZIP
-        zip_buf = io.BytesIO()
-        
-        with zipfile.ZipFile(zip_buf, "a", zipfile.ZIP_DEFLATED, False) as zf:
-            for i, eid in enumerate(id_list):
-                try:
-                    _, msg_data = mail.fetch(eid, '(RFC822)')
-                    raw_bytes = msg_data[0][1]
-                    email_message = email.message_from_bytes(raw_bytes)
-                    
-                    # Get clean body text
-                    body_content = get_email_body_text(email_message)
-                    
-                    if body_content:
-                        # Create filename
-                        if name_by_subj:
-                            original_subj = email_message.get('Subject', 'no_subject')
-                            subj = clean_filename(original_subj)
-                            fname = f"{i+1}_{subj}.txt"
-                        else:
-                            fname = f"email_{i+1}.txt"
-                        
-                        # Write to zip
-                        zf.writestr(fname, body_content.encode('utf-8'))
-                    
-                    prog_bar.progress((i + 1) / len(id_list))
-                except:
-                    continue
-        
-        prog_bar.empty()
-        status_msg.success(f"🎉 Extracted {len(id_list)} emails into separate files!")
-        
-        st.download_button(
-            label="📥 Download ZIP File (Separate Text Files)",
-            data=zip_buf.getvalue(),
-            file_name="emails_bodies_separate.zip",
-            mime="application/zip",
-            use_container_width=True
-        )
+        progress.success(f"🎉 Extracted {len(id_list)} emails into separate files!")
+        progress.artifact(sink, "📥 Download ZIP File (Separate Text Files)", file_name,
+                          "application/zip")
+    return exported
 
 
-def process_original_emails(mail, id_list, kwargs, status_msg, prog_bar):
+def process_original_emails(mail, id_list, kwargs, progress,
+                            chunk_size=DEFAULT_FETCH_CHUNK_SIZE, prefetched=None, output_dir=None,
+                            job=None, workers=DEFAULT_PARSE_WORKERS, metrics=None, zip_settings=None,
+                            sink=None):
     """
     Process emails in original format with header modifications
     
     Args:
         mail: IMAP connection object
         id_list: List of email IDs to process
-        kwargs: Dictionary containing all processing options
-        status_msg: Streamlit message placeholder
-        prog_bar: Streamlit progress bar
+        kwargs: Dictionary containing all processing options (may carry a
+            precompiled 'transform_plan')
+        progress: ProgressReporter receiving status, progress and the artifact
+        chunk_size: Number of messages fetched per IMAP FETCH command
+        prefetched: Optional dict of eid -> FETCH items already downloaded
+        output_dir: Optional directory to write to instead of a download
+        job: Optional ExtractionJob used to checkpoint and resume progress
+        workers: Worker processes rewriting headers (0 = rewrite in this process)
+        metrics: Optional RunMetrics collecting per-stage timings
+        zip_settings: Optional ZipSink settings (compression, level, threads, volumes)
+        sink: Optional OutputSink to write into instead of a new one
+            (e.g. the folder of a batch archive)
+    
+    Returns:
+        List of the UIDs written to the output (including those written
+        before a resumed job was interrupted)
     """
     # Extract parameters
     name_by_subj = kwargs.get('name_by_subj', True)
-    rep_dom = kwargs.get('rep_dom', False)
-    p_from = kwargs.get('p_from', '')
-    std_headers = kwargs.get('std_headers', False)
-    custom_headers_text = kwargs.get('custom_headers_text', '')
-    mod_eid = kwargs.get('mod_eid', False)
-    clean_auth = kwargs.get('clean_auth', False)
+    # Compile header options once; the loop only applies the plan
+    plan = kwargs.get('transform_plan') or TransformPlan.from_options(kwargs)
+    
+    if sink is None:
+        sink = (job.open_sink if job else open_sink)("zip", "emails_raw_pack.zip", output_dir,
+                                                     zip_settings)
     
-    zip_buf = io.BytesIO()
+    # Resumed jobs skip what is already done; the sink continues after it
+    start = job.completed if job else 0
+    exported = job.exported if job else []
     
-    with zipfile.ZipFile(zip_buf, "a", zipfile.ZIP_DEFLATED, False) as zf:
-        for i, eid in enumerate(id_list):
+    remaining = id_list[start:]
+    seen = set()
+    
+    with sink:
+        fetched = _header_payloads(
+            fetch_batched(mail, remaining, '(RFC822)', chunk_size, prefetched)
+        )
+        if metrics:
+            fetched = metrics.timed_iter('fetch', fetched, size=lambda item: item[2])
+        for (i, uid, raw, body_start), rewritten in pipelined(fetched, _rewrite_original, workers,
+                                                              metrics=metrics, stage='transform',
+                                                              interrupt=partial(interrupt_fetches, mail),
+                                                              context=plan):
+            i += start
+            seen.add(int(uid))
             try:
-                _, msg = mail.fetch(eid, '(RFC822)')
-                raw = msg[0][1]
-                
-                # Split headers and body
-                sep = b'\r\n\r\n'
-                idx = raw.find(sep)
-                if idx == -1:
-                    sep = b'\n\n'
-                    idx = raw.find(sep)
-                
-                head = raw[:idx] if idx != -1 else raw
-                body = raw[idx+len(sep):] if idx != -1 else b""
-                
-                # Parse headers
-                mime = email.message_from_bytes(head)
-                original_subj = mime.get('Subject', 'no_subject')
-                
-                # Apply transformations
-                if rep_dom and mime.get('From'):
-                    n_from = re.sub(r'@[a-zA-Z0-9.-]+', f'@{p_from}', mime['From'])
-                    del mime['From']
-                    mime['From'] = n_from
-                
-                if std_headers:
-                    if 'To' in mime:
-                        del mime['To']
-                    mime['To'] = '[*to]'
-                    
-                    if 'Date' in mime:
-                        del mime['Date']
-                    mime['Date'] = '[*date]'
-                
-                if custom_headers_text:
-                    for line in custom_headers_text.split('\n'):
-                        if ":" in line:
-                            k, v = line.split(":", 1)
-                            if k.strip() in mime:
-                                del mime[k.strip()]
-                            mime[k.strip()] = v.strip()
-                
-                if mod_eid and mime.get('Message-ID') and '@' in mime['Message-ID']:
-                    new_mid = mime['Message-ID'].replace('@', '[EID]@', 1)
-                    del mime['Message-ID']
-                    mime['Message-ID'] = new_mid
-                
-                if clean_auth:
-                    auth_headers = [
-                        'DKIM-Signature', 
-                        'Authentication-Results', 
-                        'Received', 
-                        'Received-SPF',
-                        'ARC-Authentication-Results', 
-                        'ARC-Message-Signature', 
-                        'ARC-Seal'
-                    ]
-                    for h in auth_headers:
-                        while h in mime:
-                            del mime[h]
+                if isinstance(rewritten, Exception):
+                    continue
                 
-                # Reconstruct email
-                fin = mime.as_bytes() + b'\r\n\r\n' + body
+                # Rewrite the raw header block; the body is passed through untouched
+                head, sep, original_subj = rewritten
+                fin = [head, sep, memoryview(raw)[body_start:]]
                 
                 # Create filename
                 fname = f"email_{i+1}.txt"
@@ -191,20 +250,224 @@ def process_original_emails(mail, id_list, kwargs, status_msg, prog_bar):
                     subj = clean_filename(original_subj)
                     fname = f"{i+1}_{subj}.txt"
                 
-                zf.writestr(fname, fin)
-                prog_bar.progress((i + 1) / len(id_list))
+                with timed(metrics, sink.stage):
+                    sink.add(fname, fin)
+                exported.append(int(uid))
+                if metrics:
+                    metrics.count_message()
+                progress.progress((i + 1) / len(id_list))
             
             except Exception as e:
                 # Log error but continue processing
                 continue
+            finally:
+                if job:
+                    job.mark_done(i, uid)
+    
+    if job:
+        job.finish()
+    progress.done()
+    _report_unfetched(progress, remaining, seen)
+    progress.success("🎉 Download Complete!")
+    
+    progress.artifact(sink, "📥 Download ZIP File", "emails_raw_pack.zip", "application/zip")
+    return exported
+
+
+def _save_attachment(store, slices, encoding, row, metrics=None):
+    """
+    Decode one attachment slice by slice into the store
+    
+    Args:
+        store: AttachmentStore
+        slices: Iterable of transfer-encoded byte slices
+        encoding: Content-Transfer-Encoding (lower case)
+        row: Manifest fields of the attachment
+        metrics: Optional RunMetrics collecting per-stage timings
+    """
+    writer = store.writer()
+    decoder = StreamDecoder(encoding)
+    try:
+        for data in slices:
+            with timed(metrics, 'parse'):
+                decoded = decoder.feed(data)
+            with timed(metrics, 'write', len(decoded)):
+                writer.write(decoded)
+        writer.write(decoder.flush())
+    except Exception:
+        writer.abort()
+        raise
+    store.record(writer, **row)
+
+
+def _slices(data, size):
+    """Split an in-memory part into decode slices"""
+    return (data[k:k + size] for k in range(0, len(data), size))
+
+
+def process_attachments(mail, id_list, progress, filters=None,
+                        chunk_size=DEFAULT_FETCH_CHUNK_SIZE, prefetched=None, output_dir=None,
+                        metrics=None, zip_settings=None, sink=None, folder=None):
+    """
+    Export the attachments of emails into a content-addressed store
+    
+    Attachments are listed from BODYSTRUCTURE and filtered by type and size
+    before anything is downloaded. Parts up to ATTACHMENT_CHUNK_BYTES are
+    fetched many messages per command; larger ones are fetched in partial
+    slices. Every slice is decoded and written to disk as it arrives, and
+    each file is stored once under its SHA-256 however often it was sent.
+    
+    Args:
+        mail: IMAP connection object
+        id_list: List of email IDs to process
+        progress: ProgressReporter receiving status, progress and the artifact
+        filters: Optional AttachmentFilter (default: every attachment)
+        chunk_size: Number of messages fetched per IMAP FETCH command
+        prefetched: Optional dict of eid -> FETCH items already downloaded
+        output_dir: Optional store directory kept across runs (files already
+            there are not written again); otherwise a ZIP download
+        metrics: Optional RunMetrics collecting per-stage timings
+        zip_settings: Optional ZipSink settings (compression, level, threads, volumes)
+        sink: Optional OutputSink to pack the download into instead of a
+            new one (e.g. the folder of a batch archive)
+        folder: Folder name recorded in the manifest
+    
+    Returns:
+        List of the UIDs whose wanted attachments were all stored (emails
+        with no matching attachment included)
+    """
+    filters = filters or AttachmentFilter()
+    file_name = "attachments.zip"
+    store_dir = output_dir or tempfile.mkdtemp(prefix='cmh1_attachments_')
+    store = AttachmentStore(store_dir)
+    skipped = 0
+    seen = set()
+    failed = set()
+    
+    try:
+        listed = fetch_attachment_lists(mail, id_list, chunk_size, prefetched)
+        if metrics:
+            listed = metrics.timed_iter('fetch', listed)
+        
+        # Enough parts per window to give every pooled connection a FETCH
+        window_size = chunk_size * max(1, len(getattr(mail, 'connections', None) or [None]))
+        window = []
+        listed_uids = []
+        for i, eid, headers, parts in listed:
+            seen.add(int(eid))
+            listed_uids.append(int(eid))
+            message = {
+                'folder': folder,
+                'uid': int(eid),
+                'message_id': headers.get('Message-ID', ''),
+                'date': headers.get('Date', ''),
+                'sender': decode_header_text(headers['From']) if headers['From'] else '',
+                'subject': decode_header_text(headers.get('Subject')),
+            }
+            for part in parts:
+                size = decoded_size(part['size'], part['encoding'])
+                if not filters.accepts(part['content_type'], part['filename'], size):
+                    skipped += 1
+                    continue
+                row = {**message, 'filename': part['filename'], 'content_type': part['content_type']}
+                if 'data' in part:
+                    try:
+                        _save_attachment(store, _slices(part['data'], ATTACHMENT_CHUNK_BYTES),
+                                         part['encoding'], row, metrics)
+                    except Exception:
+                        failed.add(int(eid))
+                else:
+                    window.append((eid, part, row))
+            if metrics:
+                metrics.count_message()
+            
+            # Download the parts of a window of messages together
+            if len(window) >= window_size:
+                failed |= _download_parts(mail, store, window, chunk_size, metrics)
+                window = []
+                progress.progress((i + 1) / len(id_list))
+        
+        failed |= _download_parts(mail, store, window, chunk_size, metrics)
+    finally:
+        store.close()
+        if output_dir:
+            store.discard()
+    
+    exported = [uid for uid in listed_uids if uid not in failed]
+    progress.done()
+    _report_unfetched(progress, id_list, seen)
+    duplicates = store.attachments - len(store.stored)
+    summary = (f"{store.attachments} attachment(s), {len(store.stored)} new file(s), "
+               f"{duplicates} duplicate(s), {skipped} filtered out")
+    
+    if output_dir:
+        progress.success(f"🎉 Exported {summary} to {output_dir}")
+        return exported
     
-    prog_bar.empty()
-    status_msg.success("🎉 Download Complete!")
+    try:
+        if sink is None:
+            sink = open_sink("zip", file_name, None, zip_settings)
+        with sink:
+            if store.attachments:
+                with timed(metrics, sink.stage):
+                    store.pack(sink, ATTACHMENT_CHUNK_BYTES)
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
     
-    st.download_button(
-        label="📥 Download ZIP File",
-        data=zip_buf.getvalue(),
-        file_name="emails_raw_pack.zip",
-        mime="application/zip",
-        use_container_width=True
-    )
+    if not store.attachments:
+        sink.discard()
+        progress.info(f"📭 No attachments to export ({skipped} filtered out)")
+        return exported
+    progress.success(f"🎉 Exported {summary}")
+    progress.artifact(sink, "📥 Download Attachments (ZIP)", file_name, "application/zip")
+    return exported
+
+
+def _download_parts(mail, store, window, chunk_size, metrics=None):
+    """
+    Fetch and store the remote attachments of a window of messages
+    
+    Args:
+        mail: IMAP connection object
+        store: AttachmentStore
+        window: List of (eid, part, manifest row)
+        chunk_size: Number of messages fetched per IMAP FETCH command
+        metrics: Optional RunMetrics collecting per-stage timings
+    
+    Returns:
+        Set of the UIDs with an attachment that could not be stored
+    """
+    failed = set()
+    small = {}
+    for eid, part, row in window:
+        if part['size'] <= ATTACHMENT_CHUNK_BYTES:
+            small.setdefault(part['section'], []).append((eid, part, row))
+            continue
+        slices = fetch_part_chunks(mail, eid, part['section'], ATTACHMENT_CHUNK_BYTES)
+        if metrics:
+            slices = metrics.timed_iter('fetch', slices, size=len)
+        try:
+            _save_attachment(store, slices, part['encoding'], row, metrics)
+        except Exception:
+            failed.add(int(eid))
+    
+    # One FETCH per chunk of messages and distinct section number
+    for section, entries in small.items():
+        by_eid = {eid: (part, row) for eid, part, row in entries}
+        fetched = fetch_batched(mail, list(by_eid), f"(BODY.PEEK[{section}])", chunk_size)
+        if metrics:
+            fetched = metrics.timed_iter('fetch', fetched)
+        stored = set()
+        for _, eid, items in fetched:
+            data = items.get(f"BODY[{section}]")
+            if not data:
+                continue
+            part, row = by_eid[eid]
+            try:
+                _save_attachment(store, _slices(data, ATTACHMENT_CHUNK_BYTES),
+                                 part['encoding'], row, metrics)
+                stored.add(eid)
+            except Exception:
+                continue
+        failed.update(int(eid) for eid in by_eid if eid not in stored)
+    return failed
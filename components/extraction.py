@@ -0,0 +1,483 @@
+"""
+Extraction Engine
+Runs an extraction job (connect, select, deduplicate, export) independently of the front end
+"""
+import email
+import imaplib
+import os
+import shutil
+import sys
+import tempfile
+
+from components.dedup_index import DedupIndex
+from components.email_processor import (
+    process_attachments,
+    process_original_emails,
+    process_text_extraction
+)
+from components.imap_pool import IMAPConnectionPool
+from components.job_store import ExtractionJob
+from components.message_cache import CachedFetcher, MessageCache, get_message_cache
+from components.output_sinks import zip_options
+from components.progress import ProgressReporter
+from components.search_index import SearchIndex, fts5_available
+from utils.attachments import AttachmentFilter
+from utils.body_structure import (
+    STRUCTURE_HEADERS_QUERY,
+    decode_text_payload,
+    fetch_text_bodies
+)
+from utils.config import (
+    DATA_DIR,
+    DEFAULT_FETCH_CHUNK_SIZE,
+    DEFAULT_PARSE_WORKERS,
+    DEFAULT_PIPELINE_DEPTH,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_SIMILARITY_THRESHOLD
+)
+from utils.email_utils import detect_duplicates
+from utils.fingerprint import fingerprint_text
+from utils.imap_fetch import (
+    DUPLICATE_CHECK_QUERY,
+    build_search_criteria,
+    fetch_batched,
+    get_item,
+    uid_search
+)
+from utils.metrics import timed
+
+
+def validate_options(kwargs):
+    """
+    Check the options of a job before connecting
+    
+    Returns:
+        Error message, or None if the options are usable
+    """
+    targets = kwargs.get('targets')
+    if targets:
+        for target in targets:
+            problem = validate_options({**kwargs, **target, 'targets': None})
+            if problem:
+                return f"{target.get('imap_user')}/{target.get('folder_name')}: {problem}"
+        if kwargs.get('extract_plain_only') and "Merged" in (kwargs.get('export_format') or '') \
+                and not kwargs.get('output_dir'):
+            return "⚠️ Batch downloads are one ZIP archive; choose Separate Files (ZIP) or a server directory"
+        return None
+    
+    if not all([kwargs.get('imap_server'), kwargs.get('imap_user'), kwargs.get('imap_pass')]):
+        return "⚠️ Please fill in all connection fields!"
+    if not kwargs.get('folder_name'):
+        return "⚠️ Please enter a folder name!"
+    if kwargs.get('start_num', 1) > kwargs.get('end_num', 1):
+        return "⚠️ Start number must be less than or equal to end number!"
+    if kwargs.get('extract_plain_only') and kwargs.get('extract_attachments'):
+        return "⚠️ Choose either plain text or attachment extraction, not both!"
+    min_kb, max_kb = kwargs.get('attachment_min_kb') or 0, kwargs.get('attachment_max_kb') or 0
+    if max_kb and min_kb > max_kb:
+        return "⚠️ Minimum attachment size must not exceed the maximum!"
+    return None
+
+
+def describe_run(kwargs):
+    """
+    Mode, folder and performance settings of a job, for run statistics
+    
+    Args:
+        kwargs: Dictionary containing all processing options
+        
+    Returns:
+        Dict suitable as extra fields of RunMetrics.to_json()
+    """
+    targets = kwargs.get('targets')
+    if kwargs.get('extract_attachments'):
+        mode = 'attachments'
+    else:
+        mode = 'text' if kwargs.get('extract_plain_only') else 'original'
+    return {
+        'mode': mode,
+        'folder': f"{len(targets)} targets" if targets else kwargs.get('folder_name'),
+        'options': {
+            'fetch_chunk_size': kwargs.get('fetch_chunk_size'),
+            'pool_size': kwargs.get('pool_size'),
+            'pipeline_depth': kwargs.get('pipeline_depth'),
+            'parse_workers': kwargs.get('parse_workers'),
+            'use_cache': kwargs.get('use_cache'),
+            'zip_method': kwargs.get('zip_method'),
+            'zip_level': kwargs.get('zip_level'),
+            'zip_workers': kwargs.get('zip_workers'),
+            'use_search_index': kwargs.get('use_search_index'),
+        },
+    }
+
+
+def run_extraction(kwargs, progress=None, metrics=None, sink=None):
+    """
+    Run one extraction job: connect, select emails, export them
+    
+    Args:
+        kwargs: Dictionary containing all processing options (the email
+            tool page's keyword arguments, or one job of a CLI job file)
+        progress: Optional ProgressReporter receiving status and the artifact
+        metrics: Optional RunMetrics collecting per-stage timings
+        sink: Optional OutputSink to export into instead of a new artifact
+        
+    Returns:
+        Dict with 'status' ('done', 'empty' or 'failed'), 'emails' (number
+        exported) and 'error' (message when failed)
+    """
+    progress = progress or ProgressReporter()
+    
+    # Extract parameters
+    imap_server = kwargs.get('imap_server')
+    imap_user = kwargs.get('imap_user')
+    imap_pass = kwargs.get('imap_pass')
+    folder_name = kwargs.get('folder_name')
+    extract_plain_only = kwargs.get('extract_plain_only')
+    extract_attachments = kwargs.get('extract_attachments', False)
+    export_format = kwargs.get('export_format')
+    chunk_size = kwargs.get('fetch_chunk_size') or DEFAULT_FETCH_CHUNK_SIZE
+    pool_size = kwargs.get('pool_size') or DEFAULT_POOL_SIZE
+    pipeline_depth = kwargs.get('pipeline_depth') or DEFAULT_PIPELINE_DEPTH
+    parse_workers = kwargs.get('parse_workers', DEFAULT_PARSE_WORKERS)
+    output_dir = kwargs.get('output_dir')
+    use_cache = kwargs.get('use_cache', False)
+    resumable = kwargs.get('resumable', False)
+    use_dedup_index = kwargs.get('use_dedup_index', False)
+    use_search_index = kwargs.get('use_search_index', False)
+    
+    # Validation
+    problem = validate_options(kwargs)
+    if problem:
+        progress.error(problem)
+        return {'status': 'failed', 'emails': 0, 'error': problem}
+    
+    pool = IMAPConnectionPool(
+        imap_server, imap_user, imap_pass, folder_name, pool_size, pipeline_depth
+    )
+    index = None
+    spool_dir = None
+    try:
+        # Connect to IMAP server
+        progress.info(f"🔌 Connecting to IMAP server and selecting folder: {folder_name}")
+        with timed(metrics, 'connect'):
+            pool.open()
+        
+        # Serve full messages from the local cache when possible
+        source = pool
+        if use_cache and pool.uidvalidity is not None:
+            scope = get_message_cache().scope(imap_server, imap_user, folder_name, pool.uidvalidity)
+            source = CachedFetcher(pool, scope)
+        elif (kwargs.get('remove_duplicates') and kwargs.get('dedup_content')
+                and not extract_plain_only and not extract_attachments):
+            # Content matching reads every message before the export does:
+            # spool them for this run so each crosses the wire only once
+            os.makedirs(DATA_DIR, exist_ok=True)
+            spool_dir = tempfile.mkdtemp(prefix='spool_', dir=DATA_DIR)
+            scope = MessageCache(spool_dir, max_bytes=sys.maxsize).scope(
+                imap_server, imap_user, folder_name, pool.uidvalidity
+            )
+            source = CachedFetcher(pool, scope)
+        
+        # Pick up an interrupted run of the same job, if any (attachment
+        # exports need no checkpoints: stored files are not written again;
+        # a shared sink such as a batch archive cannot be reopened)
+        job = None
+        if resumable and not extract_attachments and sink is None:
+            job = ExtractionJob.open(kwargs, pool.uidvalidity)
+        
+        # Record of emails exported by earlier runs
+        index = DedupIndex(imap_server, imap_user) if use_dedup_index else None
+        
+        if job and job.resuming:
+            id_list, prefetched, details = job.id_list, {}, {}
+            progress.info(
+                f"♻️ Resuming interrupted job at email {job.completed + 1} of {len(id_list)}"
+            )
+        else:
+            id_list, prefetched, details = select_email_ids(
+                pool, kwargs, progress, source, index, metrics
+            )
+            if not id_list:
+                return {'status': 'empty', 'emails': 0, 'error': None}
+            if job:
+                job.start(id_list)
+        
+        # Full-text index of the extracted bodies (plain text mode only)
+        search_index = None
+        if use_search_index and extract_plain_only:
+            if fts5_available():
+                search_index = SearchIndex(imap_server, imap_user)
+            else:
+                progress.warning("⚠️ This Python's SQLite has no FTS5; emails are not indexed for search")
+        
+        # Process based on extraction mode
+        if extract_attachments:
+            exported = process_attachments(
+                mail=source,
+                id_list=id_list,
+                progress=progress,
+                filters=AttachmentFilter(
+                    kwargs.get('attachment_types'),
+                    kwargs.get('attachment_min_kb'),
+                    kwargs.get('attachment_max_kb')
+                ),
+                chunk_size=chunk_size,
+                prefetched=prefetched,
+                output_dir=output_dir,
+                metrics=metrics,
+                zip_settings=zip_options(kwargs),
+                sink=sink,
+                folder=folder_name
+            )
+        elif extract_plain_only:
+            try:
+                exported = process_text_extraction(
+                    mail=source,
+                    id_list=id_list,
+                    export_format=export_format,
+                    name_by_subj=kwargs.get('name_by_subj'),
+                    progress=progress,
+                    chunk_size=chunk_size,
+                    prefetched=prefetched,
+                    output_dir=output_dir,
+                    job=job,
+                    workers=parse_workers,
+                    metrics=metrics,
+                    zip_settings=zip_options(kwargs),
+                    sink=sink,
+                    search_index=search_index,
+                    folder=folder_name,
+                    uidvalidity=pool.uidvalidity
+                )
+            finally:
+                if search_index:
+                    search_index.close()
+        else:
+            exported = process_original_emails(
+                mail=source,
+                id_list=id_list,
+                kwargs=kwargs,
+                progress=progress,
+                chunk_size=chunk_size,
+                prefetched=prefetched,
+                output_dir=output_dir,
+                job=job,
+                workers=parse_workers,
+                metrics=metrics,
+                zip_settings=zip_options(kwargs),
+                sink=sink
+            )
+        
+        # Remember what was written so later runs skip it; emails that
+        # failed or were never fetched stay eligible for the next run
+        if index:
+            details = {int(eid): item for eid, item in details.items()}
+            with timed(metrics, 'dedup'):
+                index.record(folder_name, pool.uidvalidity, (
+                    {**details.get(uid, {}), 'uid': uid} for uid in exported
+                ), chunk_size)
+        
+        return {'status': 'done', 'emails': len(exported), 'error': None}
+        
+    except imaplib.IMAP4.error as e:
+        progress.error(f"❌ IMAP Error: {str(e)} - check your credentials and server settings")
+        return {'status': 'failed', 'emails': 0, 'error': f"IMAP error: {e}"}
+    except Exception as e:
+        progress.error(f"❌ Error: {str(e)}")
+        progress.exception(e)
+        return {'status': 'failed', 'emails': 0, 'error': str(e)}
+    finally:
+        # Cleanup
+        if index:
+            index.close()
+        pool.close()
+        if spool_dir:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+def select_email_ids(pool, kwargs, progress, source=None, index=None, metrics=None):
+    """
+    Search the folder, apply the requested range and remove duplicates
+    
+    Args:
+        pool: Open IMAPConnectionPool
+        kwargs: Dictionary containing all processing options
+        progress: ProgressReporter
+        source: Optional fetch source (e.g. cache) used to read bodies for
+            content-based duplicate detection
+        index: Optional DedupIndex; emails exported by earlier runs are skipped
+        metrics: Optional RunMetrics timing the search and duplicate checks
+        
+    Returns:
+        Tuple of (id_list, prefetched items, email data by id), or
+        (None, None, None) if nothing to process
+    """
+    start_num = kwargs.get('start_num')
+    end_num = kwargs.get('end_num')
+    remove_duplicates = kwargs.get('remove_duplicates')
+    dedup_content = remove_duplicates and kwargs.get('dedup_content')
+    chunk_size = kwargs.get('fetch_chunk_size') or DEFAULT_FETCH_CHUNK_SIZE
+    mail = pool.primary
+    
+    # Range and filters are evaluated by the server; only matching UIDs come back
+    total_emails = pool.exists
+    
+    if not total_emails:
+        progress.error("📭 No emails found in this folder!")
+        return None, None, None
+    
+    # Calculate range
+    actual_start = max(1, min(start_num, total_emails))
+    actual_end = max(1, min(end_num, total_emails))
+    
+    progress.info("🔍 Searching for emails...")
+    charset, criteria = build_search_criteria(
+        since=kwargs.get('filter_since'),
+        before=kwargs.get('filter_before'),
+        from_addr=kwargs.get('filter_from'),
+        subject=kwargs.get('filter_subject'),
+        larger_kb=kwargs.get('filter_larger_kb'),
+        smaller_kb=kwargs.get('filter_smaller_kb')
+    )
+    with timed(metrics, 'search'):
+        id_list = uid_search(mail, actual_start, actual_end, charset, criteria)
+    
+    if not id_list:
+        progress.error("📭 No emails in this range match the filters!")
+        return None, None, None
+    
+    progress.info(f"📊 Found {total_emails} emails. Processing {len(id_list)} emails (#{actual_start} to #{actual_end})")
+    
+    # UIDs exported by earlier runs are dropped before anything is fetched
+    skipped = 0
+    if index:
+        with timed(metrics, 'dedup'):
+            known = index.known_uids(kwargs.get('folder_name'), pool.uidvalidity, id_list)
+        if known:
+            id_list = [eid for eid in id_list if int(eid) not in known]
+            skipped = len(known)
+            if not id_list:
+                progress.error(f"📭 All {skipped} emails in this range were already exported!")
+                return None, None, None
+    
+    # Items already downloaded, reused by the main pass
+    prefetched = {}
+    details = {}
+    
+    # Text and attachment exports start from BODYSTRUCTURE and a few headers;
+    # the duplicate check fetches those, so the main pass does not ask again.
+    # Original exports download whole messages and reuse nothing from here.
+    reuse = kwargs.get('extract_plain_only') or kwargs.get('extract_attachments')
+    
+    # Duplicate detection if enabled
+    if (remove_duplicates and len(id_list) > 1) or index:
+        progress.info("🔍 Checking for duplicates...")
+        email_data_list = []
+        
+        # Fetch only the headers needed for duplicate detection (batched)
+        query = STRUCTURE_HEADERS_QUERY if reuse else DUPLICATE_CHECK_QUERY
+        headers = fetch_batched(pool, id_list, query, chunk_size)
+        if metrics:
+            headers = metrics.timed_iter('dedup', headers)
+        for i, eid, items in headers:
+            try:
+                if reuse:
+                    prefetched[eid] = items
+                header_bytes = get_item(items, 'BODY[HEADER') or b''
+                email_message = email.message_from_bytes(header_bytes)
+                
+                email_data_list.append({
+                    'id': eid,
+                    'message_id': email_message.get('Message-ID', ''),
+                    'subject': email_message.get('Subject', ''),
+                    'from': email_message.get('From', '')
+                })
+                # Header check: 30% of the bar, or 10% when fingerprinting takes the next 20%
+                progress.progress((i + 1) / len(id_list) * (0.1 if dedup_content else 0.3))
+            except:
+                continue
+        
+        threshold = None
+        if dedup_content:
+            # Fingerprint the body text (only the text part of each email is fetched);
+            # a text export keeps those parts for its main pass. Original
+            # exports download whole messages anyway, so they fingerprint the
+            # RFC822 fetch, which the source keeps for the main pass.
+            progress.info("🧬 Fingerprinting email content...")
+            by_id = {item['id']: item for item in email_data_list}
+            if reuse:
+                bodies = fetch_text_bodies(source or pool, list(by_id), chunk_size, prefetched,
+                                           keep_parts=bool(kwargs.get('extract_plain_only')))
+            else:
+                bodies = (
+                    (i, eid, items, decode_text_payload(('raw', get_item(items, 'RFC822'))))
+                    for i, eid, items in fetch_batched(source or pool, list(by_id), '(RFC822)', chunk_size)
+                )
+            if metrics:
+                bodies = metrics.timed_iter('dedup', bodies)
+            for i, eid, _, body in bodies:
+                with timed(metrics, 'dedup'):
+                    by_id[eid].update(fingerprint_text(body))
+                progress.progress(0.1 + (i + 1) / len(by_id) * 0.2)
+            for item in email_data_list:
+                item.setdefault('body_hash', '')
+                item.setdefault('signature', None)
+            threshold = kwargs.get('similarity_threshold') or DEFAULT_SIMILARITY_THRESHOLD
+        
+        duplicates = []
+        
+        # Emails matching earlier exports
+        if index:
+            scope = kwargs.get('folder_name') if kwargs.get('dedup_index_scope') == 'folder' else None
+            with timed(metrics, 'dedup'):
+                exported = index.find_exported(email_data_list, scope, threshold)
+            for idx, item in enumerate(email_data_list):
+                if item['id'] in exported:
+                    duplicates.append({
+                        'index': idx + 1,
+                        'subject': item['subject'],
+                        'reason': exported[item['id']],
+                        'matched': None
+                    })
+            email_data_list = [item for item in email_data_list if item['id'] not in exported]
+        
+        # Detect duplicates
+        if remove_duplicates:
+            with timed(metrics, 'dedup'):
+                unique_emails, batch_duplicates = detect_duplicates(email_data_list, threshold)
+            duplicates += batch_duplicates
+        else:
+            unique_emails = email_data_list
+        
+        if duplicates or skipped:
+            progress.warning(
+                f"⚠️ Found {len(duplicates) + skipped} duplicate(s) "
+                f"({skipped} skipped by UID as already exported). "
+                f"Processing {len(unique_emails)} unique emails."
+            )
+            
+            # Show duplicate details
+            lines = []
+            for dup in duplicates[:20]:
+                source_note = f"(matches #{dup['matched']})" if dup['matched'] else "(earlier export)"
+                lines.append(
+                    f"Email #{dup['index']}: {dup['subject'][:50]} - {dup['reason']} "
+                    f"{source_note}"
+                )
+            if len(duplicates) > 20:
+                lines.append(f"... and {len(duplicates)-20} more")
+            progress.details(f"📋 View {len(duplicates)} Duplicates", lines)
+        else:
+            progress.success("✅ No duplicates found!")
+        
+        # Update id_list to only unique emails
+        id_list = [item['id'] for item in unique_emails]
+        prefetched = {eid: prefetched[eid] for eid in id_list if eid in prefetched}
+        details = {item['id']: item for item in unique_emails}
+        
+        if not id_list:
+            progress.error("📭 All emails were duplicates!")
+            return None, None, None
+    
+    return id_list, prefetched, details
@@ -0,0 +1,151 @@
+"""
+IMAP Connection Pool
+Opens several authenticated sessions and fetches ID shards in parallel
+"""
+import imaplib
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.config import (
+    DEFAULT_FETCH_CHUNK_SIZE,
+    DEFAULT_PIPELINE_DEPTH,
+    DEFAULT_POOL_SIZE,
+    max_connections_for
+)
+from utils.imap_fetch import chunk_ids, fetch_batched, fetch_pipelined, interrupt_fetches
+
+
+class IMAPConnectionPool:
+    """
+    Pool of IMAP sessions that all have the same folder selected
+
+    The first connection is used for commands such as SEARCH; FETCH work is
+    sharded across every connection and merged back in the original order.
+    Message IDs handled by the pool are UIDs (all fetches use UID FETCH).
+    With pipeline_depth > 1 every connection keeps that many FETCH commands
+    in flight, which hides latency on servers that allow few sessions.
+    """
+
+    def __init__(self, server, user, password, folder, size=DEFAULT_POOL_SIZE,
+                 pipeline_depth=DEFAULT_PIPELINE_DEPTH):
+        self.server = server
+        self.user = user
+        self.password = password
+        self.folder = folder
+        self.size = max(1, min(int(size or 1), max_connections_for(server)))
+        self.pipeline_depth = max(1, int(pipeline_depth or 1))
+        self.connections = []
+        self.uidvalidity = None
+        self.exists = 0
+
+    def _connect(self):
+        """Open, authenticate and select the folder on one connection"""
+        conn = imaplib.IMAP4_SSL(self.server)
+        conn.login(self.user, self.password)
+        conn.select(self.folder)
+        return conn
+
+    def open(self):
+        """
+        Open all connections of the pool
+
+        The primary connection is opened first so that bad credentials fail
+        fast; the remaining ones are opened concurrently.
+        """
+        self.connections = [self._connect()]
+
+        _, data = self.primary.response('UIDVALIDITY')
+        if data and data[0]:
+            self.uidvalidity = int(data[0])
+        _, data = self.primary.response('EXISTS')
+        if data and data[-1]:
+            self.exists = int(data[-1])
+
+        if self.size > 1:
+            with ThreadPoolExecutor(max_workers=self.size - 1) as ex:
+                futures = [ex.submit(self._connect) for _ in range(self.size - 1)]
+                for fut in futures:
+                    try:
+                        self.connections.append(fut.result())
+                    except (imaplib.IMAP4.error, OSError):
+                        # Server refused an extra session: run with fewer
+                        continue
+        return self
+
+    @property
+    def primary(self):
+        """Connection used for non-FETCH commands"""
+        return self.connections[0]
+
+    def close(self):
+        """Log out of every connection, ignoring errors"""
+        for conn in self.connections:
+            try:
+                conn.logout()
+            except Exception:
+                pass
+        self.connections = []
+
+    def interrupt(self):
+        """Abort fetches in progress on other threads; the pool must be closed afterwards"""
+        for conn in self.connections:
+            interrupt_fetches(conn)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _fetch_on(self, conn, id_list, query, chunk_size, prefetched):
+        """Fetch on one connection, pipelining commands when enabled"""
+        if self.pipeline_depth > 1:
+            return fetch_pipelined(conn, id_list, query, chunk_size, prefetched, self.pipeline_depth)
+        return fetch_batched(conn, id_list, query, chunk_size, prefetched, uid=True)
+
+    def fetch_batched(self, id_list, query='(RFC822)', chunk_size=DEFAULT_FETCH_CHUNK_SIZE,
+                      prefetched=None):
+        """
+        Fetch shards of id_list concurrently and yield them in order
+
+        At most two shards per connection are in flight, so memory stays
+        bounded by roughly 2 * pool size * pipeline depth * chunk_size
+        messages.
+
+        Args:
+            id_list: List of message UIDs
+            query: FETCH data items, e.g. '(RFC822)'
+            chunk_size: Number of messages per shard / FETCH command
+            prefetched: Optional dict of eid -> items already downloaded
+
+        Returns:
+            Generator of (index in id_list, eid, items dict) in id_list order
+        """
+        if len(self.connections) <= 1:
+            yield from self._fetch_on(self.primary, id_list, query, chunk_size, prefetched)
+            return
+
+        idle = queue.Queue()
+        for conn in self.connections:
+            idle.put(conn)
+
+        def fetch_shard(offset, shard):
+            conn = idle.get()
+            try:
+                return [(offset + j, eid, items) for j, eid, items
+                        in self._fetch_on(conn, shard, query, chunk_size, prefetched)]
+            finally:
+                idle.put(conn)
+
+        window = 2 * len(self.connections)
+        with ThreadPoolExecutor(max_workers=len(self.connections)) as ex:
+            pending = deque()
+            # A shard holds one FETCH command per pipeline slot
+            for offset, shard in chunk_ids(id_list, chunk_size * self.pipeline_depth):
+                pending.append(ex.submit(fetch_shard, offset, shard))
+                if len(pending) >= window:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
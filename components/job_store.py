@@ -0,0 +1,232 @@
+"""
+Job Store
+Checkpointed, resumable extraction jobs
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from components.output_sinks import open_sink
+from utils.config import CHECKPOINT_INTERVAL, JOBS_DIR
+
+# Options that change which emails are selected or what is written
+JOB_KEY_FIELDS = (
+    'imap_server', 'imap_user', 'folder_name', 'start_num', 'end_num',
+    'filter_since', 'filter_before', 'filter_from', 'filter_subject',
+    'filter_larger_kb', 'filter_smaller_kb',
+    'extract_plain_only', 'export_format', 'output_dir', 'remove_duplicates', 'name_by_subj',
+    'dedup_content', 'similarity_threshold', 'use_dedup_index', 'dedup_index_scope',
+    'rep_dom', 'p_from', 'std_headers', 'custom_headers_text', 'mod_eid', 'clean_auth',
+)
+
+
+def job_key(params):
+    """
+    Build a stable job identifier from the processing options
+
+    Args:
+        params: Dictionary of processing options (password is never used)
+
+    Returns:
+        Hex job ID
+    """
+    key = {field: params.get(field) for field in JOB_KEY_FIELDS}
+    raw = json.dumps(key, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:24]
+
+
+class ExtractionJob:
+    """
+    Progress of one extraction run
+
+    Output goes straight into the job's sink: the output directory, or for
+    downloads an archive kept in the job directory. id_list is written
+    once to ids.txt when the job starts. At every checkpoint the UIDs
+    written since the last one (`exported`, appended to by the processor)
+    are appended to exported.log, and state.json is replaced with the
+    cursor only: how many entries of id_list are done, the last UID, the
+    number of logged UIDs and the sink's checkpoint. A checkpoint
+    therefore costs the same at the end of a large job as at its start.
+    A resumed job reopens the sink, drops anything written (or logged)
+    after the last checkpoint and continues from there; nothing is
+    written twice.
+    """
+
+    def __init__(self, job_id, root=JOBS_DIR, interval=CHECKPOINT_INTERVAL):
+        self.job_id = job_id
+        self.path = os.path.join(root, job_id)
+        self.state_path = os.path.join(self.path, 'state.json')
+        self.ids_path = os.path.join(self.path, 'ids.txt')
+        self.log_path = os.path.join(self.path, 'exported.log')
+        self.interval = max(1, interval)
+
+        self.id_list = None
+        self.uidvalidity = None
+        self.completed = 0
+        self.last_uid = None
+        self.exported = []
+        self.sink = None
+        self.sink_state = None
+        self._flushed = 0
+        self._logged = 0
+
+    @classmethod
+    def open(cls, params, uidvalidity, root=JOBS_DIR):
+        """
+        Load the unfinished job matching these options, or start a new one
+
+        A stored job is discarded when the folder's UIDVALIDITY changed,
+        since its message numbers no longer refer to the same emails.
+
+        Args:
+            params: Dictionary of processing options
+            uidvalidity: UIDVALIDITY of the selected folder
+            root: Directory holding job state
+
+        Returns:
+            ExtractionJob instance
+        """
+        job = cls(job_key(params), root)
+        if os.path.isfile(job.state_path):
+            try:
+                with open(job.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {}
+
+            id_list = exported = None
+            if state.get('uidvalidity') == uidvalidity:
+                id_list = job._read_lines(job.ids_path)
+                exported = job._read_lines(job.log_path) or []
+            if id_list is not None and len(exported) >= state.get('exported', 0):
+                job.id_list = id_list
+                job.completed = state.get('completed', 0)
+                job.last_uid = state.get('last_uid')
+                # UIDs logged after the last state write belong to output
+                # the sink drops on reopening
+                job.exported = [int(uid) for uid in exported[:state.get('exported', 0)]]
+                job.sink_state = state.get('sink')
+                job._flushed = job.completed
+                job._logged = len(job.exported)
+                if len(exported) > job._logged:
+                    job._write_lines(job.log_path, job.exported)
+            else:
+                job.discard()
+
+        job.uidvalidity = uidvalidity
+        return job
+
+    @staticmethod
+    def _read_lines(path):
+        """Read a file of one ID per line as bytes, or None if it is missing"""
+        try:
+            with open(path, 'rb') as f:
+                return f.read().split()
+        except OSError:
+            return None
+
+    @staticmethod
+    def _write_lines(path, ids, mode='w'):
+        """Write (or append) one ID per line and make it durable"""
+        with open(path, mode, encoding='ascii') as f:
+            f.writelines(f"{eid.decode('ascii') if isinstance(eid, bytes) else eid}\n"
+                         for eid in ids)
+            f.flush()
+            os.fsync(f.fileno())
+
+    @property
+    def resuming(self):
+        """True when this job continues an interrupted run"""
+        return self.id_list is not None and self.completed > 0 and self.sink_state is not None
+
+    def start(self, id_list):
+        """
+        Begin a new job over the given email IDs
+
+        Args:
+            id_list: List of email IDs selected for this run
+        """
+        self.discard()
+        self.id_list = list(id_list)
+        self.completed = 0
+        self.exported = []
+        self.sink_state = None
+        self._flushed = 0
+        self._logged = 0
+        os.makedirs(self.path, exist_ok=True)
+        self._write_lines(self.ids_path, self.id_list)
+        self._write_lines(self.log_path, [])
+        self.checkpoint()
+
+    def open_sink(self, kind, file_name, output_dir=None, zip_settings=None):
+        """
+        Open the output of this job, positioned at the last checkpoint
+
+        Args:
+            kind: "zip" or "merged" (see open_sink())
+            file_name: Name of the downloadable artifact
+            output_dir: Optional directory on disk; downloads are written to
+                the job directory instead
+            zip_settings: Optional ZipSink settings
+
+        Returns:
+            OutputSink instance
+        """
+        self.sink = open_sink(kind, file_name, output_dir, zip_settings,
+                              work_dir=None if output_dir else os.path.join(self.path, 'output'),
+                              state=self.sink_state if self.resuming else None)
+        return self.sink
+
+    def mark_done(self, index, uid=None):
+        """
+        Record that id_list[index] has been handled
+
+        Args:
+            index: Position in id_list
+            uid: Optional UID of the message
+        """
+        self.completed = index + 1
+        if uid is not None:
+            self.last_uid = int(uid)
+        if self.completed - self._flushed >= self.interval:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Make the sink durable, log new UIDs and persist the cursor atomically"""
+        if self.sink is not None:
+            self.sink_state = self.sink.checkpoint()
+
+        os.makedirs(self.path, exist_ok=True)
+        if len(self.exported) > self._logged:
+            self._write_lines(self.log_path, self.exported[self._logged:], 'a')
+            self._logged = len(self.exported)
+
+        state = {
+            'job_id': self.job_id,
+            'uidvalidity': self.uidvalidity,
+            'completed': self.completed,
+            'last_uid': self.last_uid,
+            'exported': self._logged,
+            'sink': self.sink_state,
+            'updated': time.time(),
+        }
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+        self._flushed = self.completed
+
+    def finish(self):
+        """
+        Remove the job once its sink is closed
+
+        A download archive in the job directory stays readable through the
+        sink's open file until the sink is discarded.
+        """
+        self.discard()
+
+    def discard(self):
+        """Delete all state of this job (and a download archive in progress)"""
+        shutil.rmtree(self.path, ignore_errors=True)
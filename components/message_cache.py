@@ -0,0 +1,286 @@
+"""
+Message Cache
+On-disk LRU cache of raw RFC822 messages and body sections keyed by server/user/folder/UIDVALIDITY/UID
+"""
+import hashlib
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+
+from utils.config import DEFAULT_FETCH_CHUNK_SIZE, MESSAGE_CACHE_DIR, MESSAGE_CACHE_MAX_BYTES
+from utils.imap_fetch import chunk_ids, fetch_batched, interrupt_fetches, query_item_names
+
+_EXT = '.eml'
+# Body section numbers as used in BODY[...] (e.g. '2' or '1.2.1')
+_SECTION = re.compile(r'\d+(?:\.\d+)*')
+
+
+class MessageCache:
+    """
+    Size-bounded store of raw messages
+
+    Each account/folder gets its own directory holding one file per UID and
+    the UIDVALIDITY it was filled under. The directory is scanned once; from
+    then on the total size and an index of files in least recently used
+    order are kept in memory, and the oldest files are evicted once the
+    total exceeds max_bytes. Access time is also written to the file mtime
+    so the order survives a restart.
+    """
+
+    def __init__(self, root=MESSAGE_CACHE_DIR, max_bytes=MESSAGE_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+        self._index = None
+
+    def _files(self):
+        """Yield (path, size, mtime) for every cached message"""
+        if not os.path.isdir(self.root):
+            return
+        for scope in os.scandir(self.root):
+            if not scope.is_dir():
+                continue
+            for entry in os.scandir(scope.path):
+                if entry.name.endswith(_EXT):
+                    try:
+                        info = entry.stat()
+                    except OSError:
+                        continue
+                    yield entry.path, info.st_size, info.st_mtime
+
+    def _load(self):
+        """Build the LRU index and the total size from disk (once)"""
+        if self._index is None:
+            files = sorted(self._files(), key=lambda f: f[2])
+            self._index = OrderedDict((path, size) for path, size, _ in files)
+            self._size = sum(self._index.values())
+
+    def _touch(self, path):
+        """Mark a cached file as most recently used"""
+        with self._lock:
+            if self._index is not None and path in self._index:
+                self._index.move_to_end(path)
+
+    def _added(self, path, size):
+        """Account for a written file and evict if over the limit"""
+        with self._lock:
+            self._load()
+            self._size += size - self._index.pop(path, 0)
+            self._index[path] = size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Remove least recently used files until under 90% of the limit"""
+        target = int(self.max_bytes * 0.9)
+        while self._index and self._size > target:
+            path, size = self._index.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+    def scope(self, server, user, folder, uidvalidity):
+        """
+        Open the cache area of one mailbox folder
+
+        The area is wiped when the server reports a different UIDVALIDITY
+        than the one it was filled under.
+
+        Args:
+            server: IMAP server host
+            user: Account name
+            folder: Folder name
+            uidvalidity: UIDVALIDITY reported on SELECT
+
+        Returns:
+            MessageCacheScope instance
+        """
+        key = hashlib.sha256(f"{server}\0{user}\0{folder}".encode('utf-8')).hexdigest()[:32]
+        path = os.path.join(self.root, key)
+        marker = os.path.join(path, 'UIDVALIDITY')
+
+        with self._lock:
+            current = None
+            if os.path.isfile(marker):
+                with open(marker, 'r') as f:
+                    current = f.read().strip()
+
+            if current != str(uidvalidity):
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                    if self._index is not None:
+                        prefix = path + os.sep
+                        for stale in [p for p in self._index if p.startswith(prefix)]:
+                            self._size -= self._index.pop(stale)
+                os.makedirs(path, exist_ok=True)
+                with open(marker, 'w') as f:
+                    f.write(str(uidvalidity))
+
+        return MessageCacheScope(self, path)
+
+    def clear(self):
+        """Delete every cached message"""
+        with self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+            self._index = OrderedDict()
+            self._size = 0
+
+
+class MessageCacheScope:
+    """Cached messages of one folder under one UIDVALIDITY"""
+
+    def __init__(self, cache, path):
+        self.cache = cache
+        self.path = path
+
+    def _file(self, uid, section=None):
+        if section is None:
+            return os.path.join(self.path, f"{int(uid)}{_EXT}")
+        if not _SECTION.fullmatch(section):
+            raise ValueError(f"Invalid body section: {section!r}")
+        return os.path.join(self.path, f"{int(uid)}_{section}{_EXT}")
+
+    def get(self, uid, section=None):
+        """
+        Read a cached message or body section
+
+        Args:
+            uid: Message UID
+            section: Optional body section number (e.g. '1.2'); None for
+                the whole message
+
+        Returns:
+            Raw bytes (transfer-encoded for a section) or None on a miss
+        """
+        path = self._file(uid, section)
+        try:
+            with open(path, 'rb') as f:
+                raw = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        self.cache._touch(path)
+        return raw
+
+    def put(self, uid, raw, section=None):
+        """
+        Store a message or body section (written atomically)
+
+        Args:
+            uid: Message UID
+            raw: Raw RFC822 bytes, or the section as fetched
+            section: Optional body section number; None for the whole message
+        """
+        path = self._file(uid, section)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(raw)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        self.cache._added(path, len(raw))
+
+
+class CachedFetcher:
+    """
+    Fetch source that serves raw messages from a MessageCacheScope
+
+    Wraps an IMAPConnectionPool, so message IDs are UIDs. Full-message
+    queries are answered from the cache where possible; only misses go to
+    the server and are stored. Any other query is passed straight through;
+    text sections are read and stored by fetch_text_bodies() through
+    get_cached_part()/put_cached_part().
+    """
+
+    def __init__(self, mail, scope):
+        self.mail = mail
+        self.scope = scope
+
+    @property
+    def connections(self):
+        """Connections of the wrapped source (used to size fetch windows)"""
+        return getattr(self.mail, 'connections', None) or []
+
+    def interrupt(self):
+        """Abort fetches of the wrapped source in progress on other threads"""
+        interrupt_fetches(self.mail)
+
+    def get_cached(self, eid):
+        """
+        Return a cached raw message without touching the network
+
+        Args:
+            eid: Message UID
+
+        Returns:
+            Raw RFC822 bytes or None
+        """
+        return self.scope.get(eid)
+
+    def get_cached_part(self, eid, section):
+        """
+        Return a cached body section (as fetched, still transfer-encoded)
+
+        Args:
+            eid: Message UID
+            section: Body section number
+
+        Returns:
+            Section bytes or None
+        """
+        return self.scope.get(eid, section)
+
+    def put_cached_part(self, eid, section, data):
+        """Store a body section downloaded from the server"""
+        self.scope.put(eid, data, section)
+
+    def fetch_batched(self, id_list, query='(RFC822)', chunk_size=DEFAULT_FETCH_CHUNK_SIZE,
+                      prefetched=None):
+        """
+        Same contract as utils.imap_fetch.fetch_batched()
+        """
+        if query_item_names(query) != ['RFC822']:
+            yield from fetch_batched(self.mail, id_list, query, chunk_size, prefetched)
+            return
+
+        # Give a connection pool enough misses per window to keep every session busy
+        window = chunk_size * max(1, len(self.connections))
+
+        for offset, chunk in chunk_ids(id_list, window):
+            found = {}
+            for eid in chunk:
+                raw = self.scope.get(eid)
+                if raw is not None:
+                    found[eid] = {'UID': eid, 'RFC822': raw}
+
+            missing = [eid for eid in chunk if eid not in found]
+            if missing:
+                for _, eid, items in fetch_batched(self.mail, missing, query,
+                                                   chunk_size, prefetched):
+                    if items.get('RFC822') is not None:
+                        self.scope.put(eid, items['RFC822'])
+                    found[eid] = items
+
+            for j, eid in enumerate(chunk):
+                items = found.pop(eid, None)
+                if items:
+                    yield offset + j, eid, items
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_message_cache():
+    """Return the process-wide MessageCache shared by all sessions"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = MessageCache()
+        return _shared_cache
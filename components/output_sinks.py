@@ -0,0 +1,545 @@
+"""
+Output Sinks
+Incremental writers for ZIP, merged text and plain directory exports
+"""
+import os
+import struct
+import tempfile
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.config import (
+    DEFAULT_ZIP_WORKERS,
+    PIPELINE_MAX_BYTES,
+    SPOOL_MEMORY_THRESHOLD,
+    ZIP_METHODS
+)
+
+MERGED_SEPARATOR = b"\n__SEP__\n"
+
+
+def as_chunks(data):
+    """Normalize entry content (str, bytes or list of chunks) to a list of chunks"""
+    if isinstance(data, str):
+        return [data.encode('utf-8')]
+    if isinstance(data, (list, tuple)):
+        return list(data)
+    return [data]
+
+
+def _spooled_file():
+    """Temporary file kept in memory until it grows past the spool threshold"""
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_THRESHOLD, mode='w+b')
+
+
+class OutputSink:
+    """
+    Base class for export targets
+
+    Entries are written one at a time with add(); nothing is accumulated in
+    Python lists. After close(), file-backed sinks expose the artifact via
+    open_download() or, when written to disk, via path.
+    """
+
+    # Name of the run-metrics stage that add() time is reported under
+    stage = 'write'
+
+    def __init__(self, fileobj=None, path=None):
+        self.fileobj = fileobj
+        self.path = path
+        self.count = 0
+        self.closed = False
+
+    def add(self, name, data):
+        """
+        Write one entry
+
+        Args:
+            name: Entry file name
+            data: Entry content as bytes or str, or a list of byte chunks
+                (e.g. header block + memoryview of the body) written in order
+                without being concatenated first
+        """
+        self._write(name, as_chunks(data))
+        self.count += 1
+
+    def add_file(self, name, path, chunk_size):
+        """
+        Write one entry from a file on disk without loading it into memory
+
+        Args:
+            name: Entry file name
+            path: File to copy
+            chunk_size: Read size
+        """
+        with open(path, 'rb') as f:
+            self._write(name, iter(lambda: f.read(chunk_size), b''))
+        self.count += 1
+
+    def _write(self, name, chunks):
+        raise NotImplementedError
+
+    def close(self):
+        """Finalize the artifact"""
+        if self.path and self.fileobj is not None and not self.closed:
+            self.fileobj.close()
+        self.closed = True
+
+    def checkpoint(self):
+        """
+        Make the entries written so far durable
+
+        Returns:
+            JSON-serializable state from which resume() continues after a
+            restart
+        """
+        return {'count': self.count}
+
+    def resume(self, state):
+        """
+        Continue a sink reopened on the output of an interrupted run
+
+        Anything written after the checkpoint is dropped.
+
+        Args:
+            state: Dict returned by checkpoint()
+        """
+        self.count = state['count']
+
+    def _sync(self):
+        """Flush the underlying file to disk"""
+        self.fileobj.flush()
+        os.fsync(self.fileobj.fileno())
+
+    def open_download(self):
+        """
+        Return a readable file object positioned at the start of the artifact
+
+        Returns:
+            Binary file object, or None for sinks without a single artifact
+        """
+        if self.path:
+            return open(self.path, 'rb') if os.path.isfile(self.path) else None
+        if self.fileobj is None:
+            return None
+        self.fileobj.seek(0)
+        return self.fileobj
+
+    def downloads(self, file_name):
+        """
+        Return the downloadable parts of the artifact
+
+        Args:
+            file_name: Download name of the artifact
+
+        Returns:
+            List of (file name, binary file object) tuples
+        """
+        data = self.open_download()
+        return [(file_name, data)] if data is not None else []
+
+    def discard(self):
+        """Release the underlying temporary file"""
+        if self.fileobj is not None and self.path is None:
+            self.fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.closed:
+            self.close()
+        return False
+
+
+def _compress_entry(chunks, compression, compresslevel):
+    """
+    Compress one ZIP entry (runs on a compression thread)
+
+    zlib, bz2 and lzma release the GIL while they work, so entries
+    compressed on several threads use several cores.
+
+    Returns:
+        Tuple of (list of compressed chunks, CRC-32, uncompressed size)
+    """
+    compressor = zipfile._get_compressor(compression, compresslevel)
+    crc = 0
+    size = 0
+    out = []
+    for chunk in chunks:
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+        out.append(compressor.compress(chunk) if compressor else chunk)
+    if compressor:
+        out.append(compressor.flush())
+    return out, crc, size
+
+
+def _compress_file(f, chunk_size, compression, compresslevel):
+    """
+    Compress an open file chunk by chunk into a spooled temporary file
+
+    Returns:
+        Tuple of (temporary file positioned at the start, CRC-32,
+        uncompressed size, compressed size)
+    """
+    compressor = zipfile._get_compressor(compression, compresslevel)
+    out = _spooled_file()
+    crc = 0
+    size = 0
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+        out.write(compressor.compress(chunk) if compressor else chunk)
+    if compressor:
+        out.write(compressor.flush())
+    compress_size = out.tell()
+    out.seek(0)
+    return out, crc, size, compress_size
+
+
+def _local_entries(fileobj, end):
+    """
+    Rebuild the ZipInfo records of an archive from its local file headers
+
+    Used to reopen an archive written by ZipSink whose central directory
+    was never written (interrupted run); entries carry their sizes in the
+    local header, so the data can be skipped.
+
+    Args:
+        fileobj: Archive file object
+        end: Offset where the last complete entry ends
+
+    Returns:
+        List of ZipInfo records in archive order
+    """
+    entries = []
+    pos = 0
+    while pos < end:
+        fileobj.seek(pos)
+        header = struct.unpack(zipfile.structFileHeader, fileobj.read(zipfile.sizeFileHeader))
+        flags, method, dostime, dosdate, crc, compress_size, file_size, name_len, extra_len = header[3:]
+        name = fileobj.read(name_len).decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = fileobj.read(extra_len)
+        if compress_size == 0xFFFFFFFF or file_size == 0xFFFFFFFF:
+            # ZIP64 extra field: uncompressed, then compressed size
+            file_size, compress_size = struct.unpack('<QQ', extra[4:20])
+        zinfo = zipfile.ZipInfo(name, ((dosdate >> 9) + 1980, (dosdate >> 5) & 0xF, dosdate & 0x1F,
+                                       dostime >> 11, (dostime >> 5) & 0x3F, (dostime & 0x1F) * 2))
+        zinfo.compress_type = method
+        zinfo.external_attr = 0o600 << 16
+        zinfo.CRC = crc
+        zinfo.file_size = file_size
+        zinfo.compress_size = compress_size
+        zinfo.header_offset = pos
+        entries.append(zinfo)
+        pos += zipfile.sizeFileHeader + name_len + extra_len + compress_size
+    return entries
+
+
+class ZipSink(OutputSink):
+    """
+    Writes each entry as a separate file in a ZIP archive
+
+    Entries are compressed on a thread pool while later entries arrive and
+    written to the archive strictly in the order they were added. With a
+    volume_size the export is split into several self-contained archives
+    of at most that many bytes (an entry larger than a volume gets one of
+    its own); ZIP64 records are used as soon as an archive needs them.
+    volume_factory(number, mode) opens volume number `number` (1-based).
+    """
+
+    stage = 'compress'
+
+    def __init__(self, fileobj, path=None, compression=zipfile.ZIP_DEFLATED, compresslevel=None,
+                 workers=0, volume_size=0, volume_factory=None):
+        super().__init__(fileobj, path)
+        self.compression = compression
+        self.compresslevel = compresslevel
+        self.volume_size = volume_size
+        self.volume_factory = volume_factory or (lambda number, mode='w+b': _spooled_file())
+        self.volumes = [fileobj]
+        self.zf = self._open_archive(fileobj)
+        self._directory_size = 0
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='zip') if workers > 0 else None
+        self.max_pending = 4 * workers
+        self.pending = deque()
+        self.pending_bytes = 0
+
+    def _open_archive(self, fileobj):
+        return zipfile.ZipFile(fileobj, "w", self.compression, allowZip64=True,
+                               compresslevel=self.compresslevel)
+
+    def _write(self, name, chunks):
+        if self.executor is None:
+            self._write_entry(name, *_compress_entry(chunks, self.compression, self.compresslevel))
+            return
+        size = sum(len(chunk) for chunk in chunks)
+        future = self.executor.submit(_compress_entry, chunks, self.compression, self.compresslevel)
+        self.pending.append((name, future, size))
+        self.pending_bytes += size
+        while self.pending and (len(self.pending) > self.max_pending
+                                or self.pending_bytes > PIPELINE_MAX_BYTES):
+            self._write_next()
+
+    def _write_next(self):
+        name, future, size = self.pending.popleft()
+        self.pending_bytes -= size
+        self._write_entry(name, *future.result())
+
+    def add_file(self, name, path, chunk_size):
+        # Compressed into a temporary file (memory up to the spool
+        # threshold, then disk) so neither copy is held in memory; entries
+        # still being compressed are written first to keep the order
+        while self.pending:
+            self._write_next()
+        with open(path, 'rb') as f:
+            out, crc, size, compress_size = _compress_file(f, chunk_size, self.compression,
+                                                           self.compresslevel)
+        with out:
+            self._write_entry(name, iter(lambda: out.read(chunk_size), b''), crc, size,
+                              compress_size)
+        self.count += 1
+
+    def _write_entry(self, name, data, crc, size, compress_size=None):
+        zinfo = zipfile.ZipInfo(name, time.localtime(time.time())[:6])
+        zinfo.compress_type = self.compression
+        zinfo.external_attr = 0o600 << 16
+        zinfo.file_size = size
+        if compress_size is None:
+            compress_size = sum(len(chunk) for chunk in data)
+        zinfo.compress_size = compress_size
+        zinfo.CRC = crc
+        zip64 = size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+        name_size = len(zinfo.filename.encode('utf-8'))
+
+        # Local header + data, central directory record, end records
+        if self.volume_size and self.zf.filelist:
+            needed = (30 + name_size + 20 + zinfo.compress_size
+                      + self._directory_size + 46 + name_size + 28 + 98)
+            if self.zf.fp.tell() + needed > self.volume_size:
+                self._next_volume()
+
+        # Same steps as ZipFile.writestr(), with the data already compressed
+        zf = self.zf
+        zf._writecheck(zinfo)
+        zf._didModify = True
+        zinfo.header_offset = zf.fp.tell()
+        zf.fp.write(zinfo.FileHeader(zip64))
+        for chunk in data:
+            zf.fp.write(chunk)
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+        zf.start_dir = zf.fp.tell()
+        self._directory_size += 46 + name_size + (28 if zip64 else 0)
+
+    def _next_volume(self):
+        self.zf.close()
+        self.fileobj.flush()
+        self.fileobj = self.volume_factory(len(self.volumes) + 1)
+        self.volumes.append(self.fileobj)
+        self.zf = self._open_archive(self.fileobj)
+        self._directory_size = 0
+
+    def checkpoint(self):
+        while self.pending:
+            self._write_next()
+        self._sync()
+        return {'count': self.count, 'volumes': len(self.volumes), 'offset': self.zf.start_dir}
+
+    def resume(self, state):
+        # Drop the empty archive opened by __init__ without writing to the file
+        self.zf._didModify = False
+        self.zf.close()
+        for number in range(2, state['volumes'] + 1):
+            self.volumes.append(self.volume_factory(number, 'r+b'))
+        self.fileobj = self.volumes[-1]
+
+        # Earlier volumes are complete; the last one continues after its
+        # last checkpointed entry
+        offset = state['offset']
+        self.fileobj.truncate(offset)
+        entries = _local_entries(self.fileobj, offset)
+        self.fileobj.seek(offset)
+        self.zf = self._open_archive(self.fileobj)
+        for zinfo in entries:
+            self.zf.filelist.append(zinfo)
+            self.zf.NameToInfo[zinfo.filename] = zinfo
+            zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+            self._directory_size += 46 + len(zinfo.filename.encode('utf-8')) + (28 if zip64 else 0)
+        super().resume(state)
+
+    def close(self):
+        if not self.closed:
+            try:
+                while self.pending:
+                    self._write_next()
+            finally:
+                if self.executor is not None:
+                    self.executor.shutdown(cancel_futures=True)
+            self.zf.close()
+            self.fileobj.flush()
+        super().close()
+
+    def downloads(self, file_name):
+        if len(self.volumes) == 1:
+            return super().downloads(file_name)
+        stem, ext = os.path.splitext(file_name)
+        parts = []
+        for number, volume in enumerate(self.volumes, 1):
+            volume.seek(0)
+            parts.append((f"{stem}.part{number:03d}{ext}", volume))
+        return parts
+
+    def discard(self):
+        if self.path is None:
+            for volume in self.volumes:
+                volume.close()
+
+
+class MergedTextSink(OutputSink):
+    """Concatenates all entries into one file separated by __SEP__"""
+
+    def __init__(self, fileobj, path=None, separator=MERGED_SEPARATOR):
+        super().__init__(fileobj, path)
+        self.separator = separator
+
+    def _write(self, name, chunks):
+        if self.count:
+            self.fileobj.write(self.separator)
+        for chunk in chunks:
+            self.fileobj.write(chunk)
+
+    def checkpoint(self):
+        self._sync()
+        return {'count': self.count, 'offset': self.fileobj.tell()}
+
+    def resume(self, state):
+        self.fileobj.truncate(state['offset'])
+        self.fileobj.seek(state['offset'])
+        super().resume(state)
+
+    def close(self):
+        if not self.closed:
+            self.fileobj.flush()
+        super().close()
+
+
+class DirectorySink(OutputSink):
+    """Writes each entry as a plain file inside a directory"""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(None, directory)
+
+    def _write(self, name, chunks):
+        with open(os.path.join(self.path, os.path.basename(name)), 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+
+class PrefixedSink(OutputSink):
+    """
+    Writes entries into a directory of another, shared sink
+
+    Several extractions (e.g. the folders of a batch) write into one archive
+    through their own PrefixedSink; the lock serializes their writes. Closing
+    the view leaves the shared sink open for its owner to close.
+    """
+
+    def __init__(self, target, prefix, lock):
+        super().__init__()
+        self.target = target
+        self.prefix = prefix.strip('/')
+        self.lock = lock
+        self.stage = target.stage
+
+    def _write(self, name, chunks):
+        with self.lock:
+            self.target.add(f"{self.prefix}/{name}", chunks)
+
+    def add_file(self, name, path, chunk_size):
+        with self.lock:
+            self.target.add_file(f"{self.prefix}/{name}", path, chunk_size)
+        self.count += 1
+
+    def close(self):
+        self.closed = True
+
+    def discard(self):
+        pass
+
+
+def zip_options(kwargs):
+    """
+    ZipSink settings from the processing options
+
+    Args:
+        kwargs: Dictionary with optional 'zip_method' (key of ZIP_METHODS),
+            'zip_level', 'zip_workers' and 'zip_volume_mb' (0 = one archive)
+
+    Returns:
+        Dict of ZipSink keyword arguments
+    """
+    compression = ZIP_METHODS[kwargs.get('zip_method') or 'deflated']
+    level = kwargs.get('zip_level')
+    if level is not None and compression == zipfile.ZIP_BZIP2:
+        level = max(1, level)
+    return {
+        'compression': compression,
+        'compresslevel': level,
+        'workers': kwargs.get('zip_workers', DEFAULT_ZIP_WORKERS),
+        'volume_size': int((kwargs.get('zip_volume_mb') or 0) * 1024 * 1024),
+    }
+
+
+def _work_volumes(work_dir, file_name):
+    """Volume factory opening numbered archive files in a work directory"""
+    stem, ext = os.path.splitext(file_name)
+    return lambda number, mode='w+b': open(os.path.join(work_dir, f"{stem}.part{number:03d}{ext}"), mode)
+
+
+def open_sink(kind, file_name, output_dir=None, zip_settings=None, work_dir=None, state=None):
+    """
+    Create an output sink
+
+    Args:
+        kind: "zip" for one file per entry, "merged" for a single text file
+        file_name: Name of the downloadable artifact
+        output_dir: Optional directory on disk; ZIP-style exports become a
+            plain directory of files and merged exports are written there
+        zip_settings: Optional ZipSink keyword arguments (see zip_options())
+        work_dir: Optional directory holding a download that must survive a
+            restart (resumable jobs); by default downloads are spooled to
+            temporary files
+        state: Optional checkpoint() state of an interrupted run to continue
+
+    Returns:
+        OutputSink instance
+    """
+    mode = 'r+b' if state else 'w+b'
+    if output_dir:
+        if kind == "merged":
+            os.makedirs(output_dir, exist_ok=True)
+            path = os.path.join(output_dir, file_name)
+            sink = MergedTextSink(open(path, mode), path)
+        else:
+            sink = DirectorySink(output_dir)
+    elif work_dir:
+        os.makedirs(work_dir, exist_ok=True)
+        if kind == "merged":
+            sink = MergedTextSink(open(os.path.join(work_dir, file_name), mode))
+        else:
+            volume = _work_volumes(work_dir, file_name)
+            sink = ZipSink(volume(1, mode), volume_factory=volume, **(zip_settings or {}))
+    elif kind == "merged":
+        sink = MergedTextSink(_spooled_file())
+    else:
+        sink = ZipSink(_spooled_file(), **(zip_settings or {}))
+
+    if state:
+        sink.resume(state)
+    return sink
@@ -0,0 +1,292 @@
+"""
+Processing Pipeline
+Overlaps network fetch, CPU-bound parsing in worker processes and ordered output writing
+"""
+import multiprocessing
+import os
+import pickle
+import queue
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from utils.config import PIPELINE_MAX_BYTES, PIPELINE_MAX_PENDING
+from utils.metrics import timed_call
+
+_DONE = object()
+
+# Run contexts loaded by a worker process, by file (see _contextual())
+_contexts = OrderedDict()
+_CONTEXT_CACHE_SIZE = 8
+
+
+class _Failed:
+    """Carries an exception raised by the fetch stage to the consumer"""
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+
+
+class _Immediate:
+    """Future-like result of a transform run in the calling thread"""
+    __slots__ = ('value', 'error')
+
+    def __init__(self, func, *args):
+        self.value = self.error = None
+        try:
+            self.value = func(*args)
+        except Exception as e:
+            self.error = e
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def cancel(self):
+        return False
+
+
+class ByteBudget:
+    """
+    Bounded amount of payload bytes in flight between pipeline stages
+
+    A single item larger than the limit is still admitted when nothing
+    else is in flight, so oversized messages cannot deadlock the pipeline.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, size, stop):
+        """
+        Wait until size bytes fit in the budget
+
+        Returns:
+            False if stop was set while waiting
+        """
+        with self._cond:
+            while self.used and self.used + size > self.limit:
+                if stop.is_set():
+                    return False
+                self._cond.wait(0.2)
+            self.used += size
+            return not stop.is_set()
+
+    def release(self, size):
+        with self._cond:
+            self.used -= size
+            self._cond.notify_all()
+
+
+def _put(q, item, stop):
+    """Put into a bounded queue without blocking forever once stopped"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.2)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce(source, q, budget, stop):
+    """Fetch stage: drain the source generator into the bounded queue"""
+    try:
+        for key, payload, size in source:
+            if not budget.acquire(size, stop) or not _put(q, (key, payload, size), stop):
+                return
+    except BaseException as e:
+        _put(q, _Failed(e), stop)
+    finally:
+        _put(q, _DONE, stop)
+        close = getattr(source, 'close', None)
+        if close:
+            close()
+
+
+def _share_context(context):
+    """Pickle a run's transform context once to a private temp file for the workers"""
+    # Unique name: workers cache contexts by path across runs
+    fd, path = tempfile.mkstemp(prefix=f'cmh1_context_{uuid.uuid4().hex}_', suffix='.pickle')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(context, f, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _contextual(transform, path, payload):
+    """
+    Run transform(context, payload) in a worker process
+
+    The context is read from its file the first time a worker sees it and
+    kept, so it crosses the process boundary once per worker and run
+    instead of with every item.
+    """
+    context = _contexts.get(path)
+    if context is None:
+        with open(path, 'rb') as f:
+            context = pickle.load(f)
+        _contexts[path] = context
+        while len(_contexts) > _CONTEXT_CACHE_SIZE:
+            _contexts.popitem(last=False)
+    return transform(context, payload)
+
+
+_executor = None
+_executor_workers = 0
+_executor_users = 0
+_executor_lock = threading.Lock()
+
+
+def get_worker_pool(workers):
+    """
+    Acquire the shared process pool used for parsing
+
+    Worker processes are started with 'spawn' so they never inherit the
+    threads and sockets of the app process, and are kept for later runs.
+    The pool is reference-counted: it is only resized while no run is
+    using it, so a run asking for a different size while another is in
+    progress shares the existing pool instead of shutting it down under
+    the other run. Every call must be paired with release_worker_pool().
+    """
+    global _executor, _executor_workers, _executor_users
+    with _executor_lock:
+        if _executor is None or (_executor_workers != workers and not _executor_users):
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _executor_workers = workers
+        _executor_users += 1
+        return _executor
+
+
+def release_worker_pool(executor):
+    """Give back a pool acquired with get_worker_pool(); the processes are kept"""
+    global _executor_users
+    with _executor_lock:
+        # A pool replaced after it broke is no longer counted
+        if executor is _executor and _executor_users:
+            _executor_users -= 1
+
+
+def _reset_worker_pool():
+    """Drop a broken process pool so the next run starts a fresh one"""
+    global _executor, _executor_users
+    with _executor_lock:
+        _executor = None
+        _executor_users = 0
+
+
+def pipelined(source, transform, workers=0, max_pending=PIPELINE_MAX_PENDING,
+              max_bytes=PIPELINE_MAX_BYTES, metrics=None, stage='parse', interrupt=None,
+              context=None):
+    """
+    Run fetch, transform and consume as overlapping stages
+
+    The source generator runs in a fetch thread. Each item is transformed
+    in the shared process pool (or inline when workers is 0) while later
+    items are still being downloaded, and results are yielded to the
+    caller, the writer stage, strictly in source order. The number of items
+    and payload bytes in flight are bounded, so a slow writer throttles the
+    fetch stage instead of buffering the whole mailbox. Compression is the
+    stage after the writer: ZipSink deflates entries on its own threads
+    (zlib releases the GIL) and keeps the archive in order.
+
+    Args:
+        source: Iterable of (key, payload, payload size in bytes)
+        transform: Picklable module-level function applied to each payload,
+            called as transform(context, payload) when context is given
+        workers: Number of worker processes (0 = transform in this thread)
+        max_pending: Maximum number of items fetched but not yet written
+        max_bytes: Maximum payload bytes fetched but not yet written
+        metrics: Optional RunMetrics; transform time (measured where the
+            transform runs, including worker processes) is added to stage
+        stage: Metrics stage name of the transform
+        interrupt: Optional callable that aborts the source's blocking I/O
+            (e.g. shuts its sockets down). It is called when the caller
+            stops early, so the fetch thread is never left using a
+            connection that is about to be closed.
+        context: Optional picklable object shared by every item of the run
+            (e.g. compiled options); sent to each worker once
+
+    Returns:
+        Generator of (key, result) in source order; result is the exception
+        instance when the transform failed for that item
+    """
+    max_pending = max(1, int(max_pending))
+    executor = get_worker_pool(workers) if workers else None
+    context_file = None
+    if context is not None:
+        if executor:
+            context_file = _share_context(context)
+            transform = partial(_contextual, transform, context_file)
+        else:
+            transform = partial(transform, context)
+    budget = ByteBudget(max_bytes)
+    stop = threading.Event()
+    q = queue.Queue(maxsize=max_pending)
+    producer = threading.Thread(target=_produce, args=(source, q, budget, stop), daemon=True)
+    producer.start()
+
+    pending = deque()
+    finished = False
+    try:
+        while not finished or pending:
+            # Keep the workers fed; only block on the fetch stage when idle
+            while not finished and len(pending) < max_pending:
+                try:
+                    item = q.get(block=not pending)
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    finished = True
+                    break
+                if isinstance(item, _Failed):
+                    raise item.error
+
+                key, payload, size = item
+                if metrics:
+                    func, args = timed_call, (transform, payload)
+                else:
+                    func, args = transform, (payload,)
+                future = executor.submit(func, *args) if executor else _Immediate(func, *args)
+                pending.append((key, future, size))
+
+            if not pending:
+                continue
+
+            key, future, size = pending.popleft()
+            try:
+                result = future.result()
+                if metrics:
+                    result, wall, cpu = result
+                    metrics.record(stage, wall, cpu, size)
+            except BrokenProcessPool:
+                _reset_worker_pool()
+                raise
+            except Exception as e:
+                result = e
+            budget.release(size)
+            yield key, result
+    finally:
+        stop.set()
+        for _, future, _ in pending:
+            future.cancel()
+        # Stopped early: the fetch thread may be blocked on the server
+        if not finished and interrupt and producer.is_alive():
+            interrupt()
+        producer.join()
+        if executor:
+            release_worker_pool(executor)
+        if context_file:
+            os.remove(context_file)
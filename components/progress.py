@@ -0,0 +1,171 @@
+"""
+Progress Reporting
+Callback interface between the extraction engine and its front end (Streamlit page or console)
+"""
+import sys
+import threading
+import time
+
+
+class ProgressReporter:
+    """
+    Receives status, progress and results from the extraction engine
+
+    The engine only talks to this interface, so the same code runs behind
+    the Streamlit page, the command line and background jobs. The base
+    class ignores everything; front ends override what they display.
+    """
+
+    def info(self, message):
+        """Report a status message"""
+
+    def success(self, message):
+        """Report a successful step"""
+
+    def warning(self, message):
+        """Report a non-fatal problem"""
+
+    def error(self, message):
+        """Report a failure"""
+
+    def exception(self, error):
+        """Report an unexpected exception"""
+
+    def progress(self, fraction):
+        """Report overall completion (0.0 - 1.0)"""
+
+    def done(self):
+        """Processing finished; clear progress indicators"""
+
+    def details(self, title, lines):
+        """
+        Report a list of details (e.g. skipped duplicates)
+
+        Args:
+            title: Heading of the list
+            lines: List of strings
+        """
+
+    def artifact(self, sink, label, file_name, mime):
+        """
+        Hand over a finished export
+
+        Args:
+            sink: Closed OutputSink
+            label: Download label
+            file_name: Download file name
+            mime: Download MIME type
+        """
+        if sink.path:
+            self.success(f"💾 Saved {sink.count} file(s) to {sink.path}")
+
+
+class StreamlitProgress(ProgressReporter):
+    """
+    Reports into Streamlit placeholders and offers artifacts as downloads
+
+    Streamlit is imported on first use, so the console front end and the
+    background jobs load this module without it.
+    """
+
+    def __init__(self, status_msg=None, prog_bar=None):
+        import streamlit as st
+        self.st = st
+        self.status_msg = status_msg if status_msg is not None else st.empty()
+        self.prog_bar = prog_bar if prog_bar is not None else st.progress(0)
+
+    def info(self, message):
+        self.status_msg.info(message)
+
+    def success(self, message):
+        self.status_msg.success(message)
+
+    def warning(self, message):
+        self.status_msg.warning(message)
+
+    def error(self, message):
+        self.status_msg.error(message)
+
+    def exception(self, error):
+        self.st.exception(error)
+
+    def progress(self, fraction):
+        self.prog_bar.progress(min(1.0, max(0.0, fraction)))
+
+    def done(self):
+        self.prog_bar.empty()
+
+    def details(self, title, lines):
+        with self.st.expander(title):
+            for line in lines:
+                self.st.caption(line)
+
+    def artifact(self, sink, label, file_name, mime):
+        if sink.path:
+            super().artifact(sink, label, file_name, mime)
+            return
+        parts = sink.downloads(file_name)
+        for name, data in parts:
+            self.st.download_button(
+                label=label if len(parts) == 1 else f"{label} – {name}",
+                data=data,
+                file_name=name,
+                mime=mime,
+                use_container_width=True
+            )
+
+
+class ConsoleProgress(ProgressReporter):
+    """
+    Writes one line per event to a stream, prefixed with the job name
+
+    Progress is printed in steps of `step` (10% by default) so log files
+    stay short; several reporters may share one stream from different
+    threads.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, name='', stream=None, step=0.1, verbose=True):
+        self.prefix = f"[{name}] " if name else ''
+        self.stream = stream or sys.stderr
+        self.step = step
+        self.verbose = verbose
+        self._next = step
+
+    def _write(self, level, message):
+        line = f"{time.strftime('%H:%M:%S')} {level:<5} {self.prefix}{message}\n"
+        with self._lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+    def info(self, message):
+        if self.verbose:
+            self._write('INFO', message)
+
+    def success(self, message):
+        self._write('OK', message)
+
+    def warning(self, message):
+        self._write('WARN', message)
+
+    def error(self, message):
+        self._write('ERROR', message)
+
+    def exception(self, error):
+        self._write('ERROR', f"{type(error).__name__}: {error}")
+
+    def progress(self, fraction):
+        if self.verbose and fraction >= self._next:
+            self._write('INFO', f"{fraction:.0%} done")
+            while self._next <= fraction:
+                self._next += self.step
+
+    def done(self):
+        self._next = self.step
+
+    def details(self, title, lines):
+        if self.verbose:
+            self._write('INFO', title)
+            for line in lines:
+                self._write('INFO', f"  {line}")
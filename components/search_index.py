@@ -0,0 +1,200 @@
+"""
+Search Index
+Local SQLite FTS5 full-text index of extracted message bodies and headers
+"""
+import hashlib
+import os
+import sqlite3
+import time
+from urllib.parse import quote
+
+from utils.config import SEARCH_INDEX_BATCH, SEARCH_INDEX_DIR
+from utils.email_utils import decode_header_text
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    folder TEXT NOT NULL,
+    uidvalidity INTEGER,
+    uid INTEGER NOT NULL,
+    message_id TEXT,
+    date TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_uid ON messages (folder, uidvalidity, uid);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    subject, sender, recipients, body,
+    tokenize = 'unicode61 remove_diacritics 1'
+);
+"""
+
+# bm25 weights of the FTS columns: subject, sender, recipients, body
+_RANK = "bm25(messages_fts, 8.0, 4.0, 2.0, 1.0)"
+
+
+def fts5_available():
+    """Whether the sqlite3 module was built with FTS5"""
+    try:
+        sqlite3.connect(':memory:').execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def index_path(server, user, root=SEARCH_INDEX_DIR):
+    """Path of the index database of an account (it may not exist yet)"""
+    key = hashlib.sha256(f"{server}\0{user}".encode('utf-8')).hexdigest()[:32]
+    return os.path.join(root, f"{key}.sqlite3")
+
+
+def _decoded(value):
+    """Decoded header value, or '' when the header is missing"""
+    return decode_header_text(value) if value else ''
+
+
+def _quote_terms(query):
+    """Turn free text into an FTS5 query matching every word literally"""
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+class SearchIndex:
+    """
+    Full-text index of the extracted emails of one account
+
+    One SQLite database per account (like DedupIndex). Each message is a
+    row of `messages` (folder, UIDVALIDITY, UID, Message-ID, date) and a
+    row of the FTS5 table with the same rowid holding the decoded Subject,
+    From, To/Cc and the body text. add() buffers messages and writes them
+    in one transaction per batch; re-indexing a UID replaces its entry.
+    With read_only=True an existing database is opened for searching only;
+    a missing one raises sqlite3.OperationalError instead of being created.
+    """
+
+    def __init__(self, server, user, root=SEARCH_INDEX_DIR, batch_size=SEARCH_INDEX_BATCH,
+                 read_only=False):
+        self.path = index_path(server, user, root)
+        self.batch_size = max(1, batch_size)
+        self.pending = []
+        if read_only:
+            self.conn = sqlite3.connect(f"file:{quote(self.path)}?mode=ro", uri=True, timeout=30)
+            return
+        os.makedirs(root, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        """Write buffered messages and close the database"""
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add(self, folder, uidvalidity, uid, headers, body):
+        """
+        Queue one message for indexing
+
+        Args:
+            folder: Folder name
+            uidvalidity: UIDVALIDITY of the folder (may be None)
+            uid: Message UID
+            headers: email.message.Message holding at least the header fields
+            body: Extracted body text
+        """
+        recipients = ', '.join(_decoded(v) for v in
+                               (headers.get_all('To') or []) + (headers.get_all('Cc') or []))
+        self.pending.append((
+            folder, uidvalidity, int(uid),
+            headers.get('Message-ID', ''), headers.get('Date', ''),
+            _decoded(headers.get('Subject')),
+            _decoded(headers.get('From')),
+            recipients, body or ''
+        ))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered messages in one transaction"""
+        if not self.pending:
+            return
+        now = time.time()
+        with self.conn:
+            for folder, uidvalidity, uid, message_id, date, subject, sender, recipients, body in self.pending:
+                row = self.conn.execute(
+                    "SELECT id FROM messages WHERE folder = ? AND uidvalidity IS ? AND uid = ?",
+                    (folder, uidvalidity, uid)
+                ).fetchone()
+                if row:
+                    rowid = row[0]
+                    self.conn.execute("DELETE FROM messages_fts WHERE rowid = ?", (rowid,))
+                    self.conn.execute(
+                        "UPDATE messages SET message_id = ?, date = ?, indexed_at = ? WHERE id = ?",
+                        (message_id, date, now, rowid)
+                    )
+                else:
+                    rowid = self.conn.execute(
+                        "INSERT INTO messages (folder, uidvalidity, uid, message_id, date, indexed_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (folder, uidvalidity, uid, message_id, date, now)
+                    ).lastrowid
+                self.conn.execute(
+                    "INSERT INTO messages_fts (rowid, subject, sender, recipients, body) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (rowid, subject, sender, recipients, body)
+                )
+        self.pending = []
+
+    def search(self, query, folder=None, limit=50):
+        """
+        Ranked full-text search
+
+        The query uses FTS5 syntax (phrases, AND/OR/NOT, prefix*, column
+        filters such as subject:invoice); if it does not parse, every word
+        is matched literally instead.
+
+        Args:
+            query: Search text
+            folder: Optional folder to search in (None = whole account)
+            limit: Maximum number of hits
+
+        Returns:
+            List of dicts with folder, uid, uidvalidity, subject, sender,
+            date, snippet and score (lower is better), best first
+        """
+        if not query.strip():
+            return []
+        clause, params = ('', []) if folder is None else (' AND m.folder = ?', [folder])
+        sql = (
+            "SELECT m.folder, m.uid, m.uidvalidity, f.subject, f.sender, m.date, "
+            "snippet(messages_fts, 3, '**', '**', ' … ', 16), " + _RANK + " AS score "
+            "FROM messages_fts f JOIN messages m ON m.id = f.rowid "
+            "WHERE messages_fts MATCH ?" + clause + " ORDER BY score LIMIT ?"
+        )
+        try:
+            rows = self.conn.execute(sql, [query] + params + [limit]).fetchall()
+        except sqlite3.OperationalError:
+            rows = self.conn.execute(sql, [_quote_terms(query)] + params + [limit]).fetchall()
+        keys = ('folder', 'uid', 'uidvalidity', 'subject', 'sender', 'date', 'snippet', 'score')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def folders(self):
+        """Names of the indexed folders"""
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT folder FROM messages ORDER BY folder")]
+
+    def count(self, folder=None):
+        """Number of indexed messages (in one folder or the whole account)"""
+        if folder is None:
+            return self.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM messages WHERE folder = ?", (folder,)).fetchone()[0]
+
+    def clear(self, folder=None):
+        """Forget indexed messages (of one folder or the whole account)"""
+        clause, params = ('', []) if folder is None else (' WHERE folder = ?', [folder])
+        with self.conn:
+            self.conn.execute(f"DELETE FROM messages_fts WHERE rowid IN (SELECT id FROM messages{clause})", params)
+            self.conn.execute(f"DELETE FROM messages{clause}", params)
@@ -0,0 +1,117 @@
+"""
+Transform Profiles
+Named, saved TransformPlans for original-format exports
+"""
+import hashlib
+import json
+import os
+import re
+
+from utils.config import PROFILES_DIR
+from utils.header_rewriter import TransformPlan
+
+
+def _profile_path(name, root):
+    """
+    Map a profile name to its JSON file
+
+    The readable part of the file name is lossy ("a b" and "a_b" both give
+    "a_b"), so a hash of the exact name keeps every name on its own file;
+    the name itself is stored inside the file.
+    """
+    name = name.strip()
+    if not name:
+        raise ValueError("Profile name is empty")
+    safe = re.sub(r'[^A-Za-z0-9_\-]+', '_', name)[:60]
+    digest = hashlib.sha256(name.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(root, f"{safe}-{digest}.json")
+
+
+def _legacy_path(name, root):
+    """
+    File of a profile saved before names were hashed, if it holds this name
+
+    Returns:
+        Path, or None
+    """
+    safe = re.sub(r'[^A-Za-z0-9_\-]+', '_', name.strip())[:60]
+    path = os.path.join(root, f"{safe}.json")
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if json.load(f).get('name') == name.strip():
+                return path
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def list_profiles(root=PROFILES_DIR):
+    """
+    List saved profile names
+
+    Returns:
+        Sorted list of profile names
+    """
+    if not os.path.isdir(root):
+        return []
+    names = []
+    for fname in os.listdir(root):
+        if fname.endswith('.json'):
+            try:
+                with open(os.path.join(root, fname), 'r', encoding='utf-8') as f:
+                    names.append(json.load(f).get('name', fname[:-5]))
+            except (OSError, ValueError):
+                continue
+    return sorted(names, key=str.lower)
+
+
+def save_profile(name, plan, root=PROFILES_DIR):
+    """
+    Save a plan under a name (overwrites an existing profile)
+
+    Args:
+        name: Profile name
+        plan: TransformPlan to save
+    """
+    path = _profile_path(name, root)
+    os.makedirs(root, exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'name': name.strip(), 'plan': plan.to_dict()}, f, indent=2)
+    os.replace(tmp, path)
+    legacy = _legacy_path(name, root)
+    if legacy:
+        os.remove(legacy)
+
+
+def load_profile(name, root=PROFILES_DIR):
+    """
+    Load a saved plan
+
+    Args:
+        name: Profile name
+
+    Returns:
+        TransformPlan, or None if the profile does not exist
+    """
+    try:
+        path = _profile_path(name, root)
+        if not os.path.isfile(path):
+            path = _legacy_path(name, root) or path
+        with open(path, 'r', encoding='utf-8') as f:
+            return TransformPlan.from_dict(json.load(f).get('plan', {}))
+    except (OSError, ValueError):
+        return None
+
+
+def delete_profile(name, root=PROFILES_DIR):
+    """Delete a saved profile if it exists"""
+    try:
+        paths = [_profile_path(name, root), _legacy_path(name, root)]
+    except ValueError:
+        return
+    for path in filter(None, paths):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -4,15 +4,17 @@ Renders the cmh1-pro.html interface
 """
 import streamlit as st
 import streamlit.components.v1 as components
-import os
+from utils.config import MINIFY_HTML_ASSETS, PRECOMPRESS_HTML_ASSETS
+from utils.html_assets import get_html_asset
 
 def render():
     """Render the CMH-1 Pro page"""
     cmh1_html_path = "cmh1-pro.html"
     
-    if os.path.exists(cmh1_html_path):
-        with open(cmh1_html_path, "r", encoding="utf-8") as f:
-            cmh1_html_code = f.read()
+    # Served from the process-wide cache; re-read only when the file changes
+    asset = get_html_asset(cmh1_html_path)
+    if asset is not None:
+        cmh1_html_code = asset.variant(MINIFY_HTML_ASSETS, PRECOMPRESS_HTML_ASSETS)
         
         # Render HTML component with scrolling enabled
         components.html(cmh1_html_code, height=920, scrolling=True)
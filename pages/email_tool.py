@@ -3,20 +3,63 @@ IMAP Email Tool Page
 Advanced email extraction and processing tool with duplicate detection
 """
 import streamlit as st
-import email
+import html
 import imaplib
-import zipfile
-import io
-from utils.email_utils import (
-    decode_header_text, 
-    clean_filename, 
-    get_email_body_text,
-    detect_duplicates
-)
-from components.email_processor import (
-    process_text_extraction,
-    process_original_emails
+import os
+import time
+from components.background_jobs import JobLimitError, get_job_manager
+from components.batch import run_batch
+from components.dedup_index import DedupIndex
+from components.extraction import run_extraction, validate_options
+from components.imap_pool import IMAPConnectionPool
+from components.search_index import SearchIndex, fts5_available, index_path
+from components.transform_profiles import list_profiles, load_profile, save_profile
+from utils.config import (
+    DEFAULT_CONNECTION_BUDGET,
+    DEFAULT_FETCH_CHUNK_SIZE,
+    DEFAULT_PARSE_WORKERS,
+    DEFAULT_PIPELINE_DEPTH,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_SIMILARITY_THRESHOLD,
+    DEFAULT_ZIP_LEVEL,
+    DEFAULT_ZIP_WORKERS,
+    EXPORT_ROOT,
+    JOB_POLL_INTERVAL,
+    max_connections_for,
+    resolve_export_dir
 )
+from utils.header_rewriter import TransformPlan
+from utils.metrics import RunMetrics
+
+# Prefix of the widget keys kept while another page is shown (see app.py)
+WIDGET_KEY_PREFIX = 'opt_'
+
+# Session-state keys and defaults of the header transformation widgets
+TRANSFORM_WIDGET_DEFAULTS = {
+    'opt_rep_dom': False,
+    'opt_p_from': 'yourdomain.com',
+    'opt_std_headers': False,
+    'opt_mod_eid': False,
+    'opt_clean_auth': False,
+    'opt_custom_headers_text': ''
+}
+
+# ZIP compression methods (keys of ZIP_METHODS) as shown in the options
+ZIP_METHOD_LABELS = {
+    'deflated': "Deflate (standard)",
+    'stored': "Store (no compression)",
+    'bzip2': "BZIP2",
+    'lzma': "LZMA",
+}
+
+# Headings of the background job states
+JOB_STATE_LABELS = {
+    'queued': "⏳ Queued",
+    'running': "⚙️ Running",
+    'done': "✅ Finished",
+    'empty': "📭 Nothing to export",
+    'failed': "❌ Failed",
+}
 
 
 def render():
@@ -33,24 +76,28 @@ def render():
         st.markdown("#### 🔐 Connection Settings")
         imap_server = st.text_input(
             "IMAP Server", 
+            key="opt_imap_server",
             value="imap.gmail.com",
             help="Enter your IMAP server address (e.g., imap.gmail.com)"
         )
         
         imap_user = st.text_input(
             "Email Address",
+            key="opt_imap_user",
             placeholder="your.email@example.com",
             help="Your email address for authentication"
         )
         
         imap_pass = st.text_input(
             "Password", 
+            key="opt_imap_pass",
             type="password",
             help="Your email password or app-specific password"
         )
         
         folder_name = st.text_input(
             "Folder Name", 
+            key="opt_folder_name",
             value="INBOX",
             help="Email folder to extract from (e.g., INBOX, Sent, Drafts)"
         )
@@ -64,6 +111,7 @@ def render():
         with col_range1:
             start_num = st.number_input(
                 "Start Email #", 
+                key="opt_start_num",
                 min_value=1, 
                 value=1,
                 help="First email number to extract"
@@ -71,6 +119,7 @@ def render():
         with col_range2:
             end_num = st.number_input(
                 "End Email #", 
+                key="opt_end_num",
                 min_value=1, 
                 value=20,
                 help="Last email number to extract"
@@ -79,6 +128,7 @@ def render():
         # Processing mode
         extract_plain_only = st.checkbox(
             "📄 Extract Plain Text Only",
+            key="opt_extract_plain_only",
             value=False,
             help="Extract only email body text without headers"
         )
@@ -88,66 +138,355 @@ def render():
             export_format = st.radio(
                 "Export Format:",
                 ["Separate Files (ZIP)", "Merged Single File"],
+                key="opt_export_format",
                 help="Choose how to organize extracted text"
             )
         
+        extract_attachments = st.checkbox(
+            "📎 Extract Attachments Only",
+            key="opt_extract_attachments",
+            value=False,
+            disabled=extract_plain_only,
+            help="Export only the attachments, each distinct file once (named by its "
+                 "SHA-256), with a manifest.csv mapping emails to files"
+        )
+        
+        # Attachment filters, applied before anything is downloaded
+        attachment_types, attachment_min_kb, attachment_max_kb = '', 0, 0
+        if extract_attachments:
+            attachment_types = st.text_input(
+                "Attachment Types",
+                key="opt_attachment_types",
+                placeholder="pdf, docx, image/*",
+                help="File extensions or MIME types (wildcards allowed); empty = all"
+            )
+            col_a1, col_a2 = st.columns(2)
+            with col_a1:
+                attachment_min_kb = st.number_input(
+                    "Min Size (KB)", min_value=0, value=0, key="opt_attachment_min_kb"
+                )
+            with col_a2:
+                attachment_max_kb = st.number_input(
+                    "Max Size (KB)", min_value=0, value=0, help="0 = no limit",
+                    key="opt_attachment_max_kb"
+                )
+        
         # Duplicate detection
         remove_duplicates = st.checkbox(
             "🔍 Remove Duplicates",
+            key="opt_remove_duplicates",
             value=True,
             help="Automatically detect and remove duplicate emails"
         )
+        
+        dedup_content = st.checkbox(
+            "🧬 Match by Content",
+            key="opt_dedup_content",
+            value=False,
+            disabled=not remove_duplicates,
+            help="Compare body fingerprints instead of Subject+From, catching re-sent "
+                 "copies and keeping distinct emails that share a subject "
+                 "(downloads the text parts during the duplicate check)"
+        )
+        
+        similarity_threshold = st.slider(
+            "Similarity Threshold",
+            key="opt_similarity_threshold",
+            min_value=0.5,
+            max_value=1.0,
+            value=DEFAULT_SIMILARITY_THRESHOLD,
+            step=0.01,
+            disabled=not (remove_duplicates and dedup_content),
+            help="Bodies at least this similar are treated as near-duplicates"
+        )
+    
+    # Server-side filters (evaluated by the IMAP server with UID SEARCH)
+    with st.expander("🔎 Server-side Filters"):
+        col_f1, col_f2 = st.columns(2)
+        
+        with col_f1:
+            use_since = st.checkbox("Received on or after", value=False, key="opt_use_since")
+            filter_since = st.date_input("Since Date", disabled=not use_since, key="opt_filter_since")
+            
+            filter_from = st.text_input(
+                "From contains",
+                key="opt_filter_from",
+                help="Only emails whose From header contains this text"
+            )
+            
+            filter_larger_kb = st.number_input(
+                "Larger than (KB)",
+                key="opt_filter_larger_kb",
+                min_value=0,
+                value=0,
+                help="0 = no minimum size"
+            )
+        
+        with col_f2:
+            use_before = st.checkbox("Received before", value=False, key="opt_use_before")
+            filter_before = st.date_input("Before Date", disabled=not use_before, key="opt_filter_before")
+            
+            filter_subject = st.text_input(
+                "Subject contains",
+                key="opt_filter_subject",
+                help="Only emails whose Subject contains this text"
+            )
+            
+            filter_smaller_kb = st.number_input(
+                "Smaller than (KB)",
+                key="opt_filter_smaller_kb",
+                min_value=0,
+                value=0,
+                help="0 = no maximum size"
+            )
     
     # Advanced options in an expander
     with st.expander("🛠️ Advanced Options (For Original Email Format)"):
         st.markdown("*These options only apply when NOT extracting plain text*")
         
+        # Header options are kept in session state so saved profiles can fill them
+        for key, default in TRANSFORM_WIDGET_DEFAULTS.items():
+            st.session_state.setdefault(key, default)
+        
+        render_profile_loader()
+        
         col_adv1, col_adv2 = st.columns(2)
         
         with col_adv1:
             name_by_subj = st.checkbox(
                 "Name files by Subject",
+                key="opt_name_by_subj",
                 value=True,
                 help="Use email subject as filename instead of numbers"
             )
             
             rep_dom = st.checkbox(
                 "Replace Domain in From",
-                value=False,
+                key="opt_rep_dom",
                 help="Replace the domain part of sender email"
             )
             
             if rep_dom:
                 p_from = st.text_input(
                     "New Domain", 
-                    value="yourdomain.com",
+                    key="opt_p_from",
                     help="New domain to replace in From header"
                 )
             
             std_headers = st.checkbox(
                 "Standardize To/Date Headers",
-                value=False,
+                key="opt_std_headers",
                 help="Replace To and Date with placeholders"
             )
         
         with col_adv2:
             mod_eid = st.checkbox(
                 "Modify Message-ID",
-                value=False,
+                key="opt_mod_eid",
                 help="Add [EID] marker to Message-ID"
             )
             
             clean_auth = st.checkbox(
                 "Remove Auth Headers",
-                value=False,
+                key="opt_clean_auth",
                 help="Remove DKIM, SPF, and authentication headers"
             )
             
             custom_headers_text = st.text_area(
                 "Custom Headers (key:value per line)",
+                key="opt_custom_headers_text",
                 placeholder="X-Custom-Header: value\nX-Another: data",
                 help="Add custom headers to emails (one per line)"
             )
+        
+        render_profile_saver(TransformPlan.from_options({
+            'rep_dom': rep_dom,
+            'p_from': p_from if rep_dom else '',
+            'std_headers': std_headers,
+            'custom_headers_text': custom_headers_text,
+            'mod_eid': mod_eid,
+            'clean_auth': clean_auth
+        }))
+    
+    # Performance tuning
+    with st.expander("⚡ Performance Options"):
+        fetch_chunk_size = st.number_input(
+            "Fetch Batch Size",
+            key="opt_fetch_chunk_size",
+            min_value=1,
+            max_value=5000,
+            value=DEFAULT_FETCH_CHUNK_SIZE,
+            help="Number of emails requested per IMAP FETCH command (higher = fewer round-trips, more memory)"
+        )
+        
+        pool_size = st.number_input(
+            "Parallel Connections",
+            key="opt_pool_size",
+            min_value=1,
+            max_value=max_connections_for(imap_server),
+            value=DEFAULT_POOL_SIZE,
+            help="Number of IMAP sessions fetching at the same time (capped per server)"
+        )
+        
+        pipeline_depth = st.number_input(
+            "Commands in Flight",
+            key="opt_pipeline_depth",
+            min_value=1,
+            max_value=16,
+            value=DEFAULT_PIPELINE_DEPTH,
+            help="FETCH commands sent ahead on each connection without waiting for the "
+                 "previous reply; hides latency when the server allows few sessions"
+        )
+        
+        parse_workers = st.number_input(
+            "Parse Workers",
+            key="opt_parse_workers",
+            min_value=0,
+            max_value=max(1, os.cpu_count() or 1),
+            value=DEFAULT_PARSE_WORKERS,
+            help="Worker processes parsing and rewriting emails while the next ones "
+                 "download (0 = parse in the app process)"
+        )
+        
+        zip_method = st.selectbox(
+            "ZIP Compression",
+            list(ZIP_METHOD_LABELS),
+            key="opt_zip_method",
+            format_func=ZIP_METHOD_LABELS.get,
+            help="Compression method of ZIP downloads (Store is fastest, LZMA smallest)"
+        )
+        
+        zip_level = st.slider(
+            "Compression Level",
+            key="opt_zip_level",
+            min_value=0,
+            max_value=9,
+            value=DEFAULT_ZIP_LEVEL,
+            disabled=zip_method in ('stored', 'lzma'),
+            help="Higher = smaller archive, slower (Deflate and BZIP2 only)"
+        )
+        
+        zip_workers = st.number_input(
+            "Compression Threads",
+            key="opt_zip_workers",
+            min_value=0,
+            max_value=max(1, os.cpu_count() or 1),
+            value=DEFAULT_ZIP_WORKERS,
+            help="Threads compressing ZIP entries in parallel (0 = compress while writing)"
+        )
+        
+        zip_volume_mb = st.number_input(
+            "Split ZIP Into Volumes (MB)",
+            key="opt_zip_volume_mb",
+            min_value=0,
+            value=0,
+            step=100,
+            help="Split ZIP downloads into several archives of at most this size (0 = one archive). "
+                 "Large downloads are served from disk as links"
+        )
+        
+        output_dir = st.text_input(
+            "Save to Server Directory (optional)",
+            key="opt_output_dir",
+            placeholder="inbox",
+            help=f"Write files straight to this directory under {EXPORT_ROOT} "
+                 "instead of offering a download"
+        )
+        
+        use_cache = st.checkbox(
+            "💾 Use Local Message Cache",
+            key="opt_use_cache",
+            value=False,
+            help="Keep downloaded emails on disk so re-runs with other options need no download"
+        )
+        
+        resumable = st.checkbox(
+            "♻️ Resumable Job",
+            key="opt_resumable",
+            value=True,
+            help="Checkpoint progress to disk so an interrupted run continues where it stopped"
+        )
+        
+        profile_run = st.checkbox(
+            "🧪 Profile This Run",
+            key="opt_profile_run",
+            value=False,
+            help="Capture a cProfile report and tracemalloc allocation snapshot in the "
+                 "run statistics (slows processing down)"
+        )
+    
+    # Persistent record of exported emails (cross-run duplicate detection)
+    with st.expander("🗂️ Export History"):
+        use_dedup_index = st.checkbox(
+            "⏭️ Skip Previously Exported",
+            key="opt_use_dedup_index",
+            value=False,
+            help="Remember exported emails (UID, Message-ID and content fingerprint) "
+                 "and skip them in later runs"
+        )
+        
+        dedup_index_scope = st.radio(
+            "Match Against:",
+            ["This folder", "Whole account"],
+            key="opt_dedup_index_scope",
+            horizontal=True,
+            help="Compare Message-IDs and content with exports of this folder only, "
+                 "or of every folder of the account"
+        )
+        dedup_index_scope = 'folder' if dedup_index_scope == "This folder" else 'account'
+        
+        # The history database is only opened (and created) once it is in use
+        if use_dedup_index and imap_server and imap_user:
+            with DedupIndex(imap_server, imap_user) as history:
+                scope_folder = folder_name if dedup_index_scope == 'folder' else None
+                st.caption(f"{history.count(scope_folder)} exported email(s) recorded")
+                if st.button("🗑️ Clear Export History"):
+                    history.clear(scope_folder)
+                    st.success("Export history cleared")
+    
+    # Local full-text index of extracted bodies, searchable offline
+    with st.expander("🔎 Search Extracted Emails"):
+        use_search_index = st.checkbox(
+            "🗃️ Index for Search",
+            key="opt_use_search_index",
+            value=False,
+            disabled=not extract_plain_only,
+            help="Store the extracted body text and headers of every email in a local "
+                 "full-text index (plain text mode only)"
+        )
+        
+        if imap_server and imap_user:
+            render_search_panel(imap_server, imap_user, imap_pass, folder_name)
+    
+    # Several folders and/or accounts in one run
+    with st.expander("📚 Batch Mode"):
+        batch_mode = st.checkbox(
+            "Run a Batch of Folders",
+            key="opt_batch_mode",
+            value=False,
+            help="Extract every row below concurrently into one archive laid out by "
+                 "account and folder (the folder and range above are ignored)"
+        )
+        
+        st.caption("Empty Server, Email, Password, Start or End cells use the values above")
+        batch_rows = st.data_editor(
+            [{'Server': '', 'Email': '', 'Password': '', 'Folder': 'INBOX', 'Start': None, 'End': None}],
+            num_rows="dynamic",
+            use_container_width=True,
+            disabled=not batch_mode,
+            key="batch_targets"
+        )
+        
+        connection_budget = st.number_input(
+            "Connection Budget",
+            key="opt_connection_budget",
+            min_value=1,
+            max_value=64,
+            value=DEFAULT_CONNECTION_BUDGET,
+            disabled=not batch_mode,
+            help="IMAP connections shared by all rows; each row uses up to "
+                 "'Parallel Connections' of them, within every server's own limit"
+        )
     
     # Process button
     st.markdown("---")
@@ -161,150 +500,403 @@ def render():
             end_num=end_num,
             extract_plain_only=extract_plain_only,
             export_format=export_format if extract_plain_only else None,
+            extract_attachments=extract_attachments and not extract_plain_only,
+            attachment_types=attachment_types.strip(),
+            attachment_min_kb=attachment_min_kb,
+            attachment_max_kb=attachment_max_kb,
             remove_duplicates=remove_duplicates,
+            dedup_content=dedup_content,
+            similarity_threshold=similarity_threshold,
             name_by_subj=name_by_subj,
             rep_dom=rep_dom,
             p_from=p_from if rep_dom else None,
             std_headers=std_headers,
             mod_eid=mod_eid,
             clean_auth=clean_auth,
-            custom_headers_text=custom_headers_text
+            custom_headers_text=custom_headers_text,
+            filter_since=filter_since if use_since else None,
+            filter_before=filter_before if use_before else None,
+            filter_from=filter_from.strip(),
+            filter_subject=filter_subject.strip(),
+            filter_larger_kb=filter_larger_kb,
+            filter_smaller_kb=filter_smaller_kb,
+            fetch_chunk_size=fetch_chunk_size,
+            pool_size=pool_size,
+            pipeline_depth=pipeline_depth,
+            parse_workers=parse_workers,
+            zip_method=zip_method,
+            zip_level=zip_level,
+            zip_workers=zip_workers,
+            zip_volume_mb=zip_volume_mb,
+            output_dir=output_dir.strip() or None,
+            use_cache=use_cache,
+            resumable=resumable,
+            use_dedup_index=use_dedup_index,
+            dedup_index_scope=dedup_index_scope,
+            use_search_index=use_search_index and extract_plain_only,
+            profile_run=profile_run,
+            targets=batch_targets(batch_rows, imap_server, imap_user, imap_pass,
+                                  start_num, end_num) if batch_mode else None,
+            connection_budget=connection_budget
         )
+    
+    render_jobs()
+    render_run_metrics()
 
 
-def process_emails(**kwargs):
+def account_key(imap_server, imap_user):
+    """Identify an account the same way background jobs name their owner"""
+    return f"{imap_user}@{imap_server}".strip().lower()
+
+
+def verify_login(imap_server, imap_user, imap_pass, folder_name):
     """
-    Main email processing function
-    Handles IMAP connection, email fetching, and processing
+    Log in to an account once and remember it for this session
+    
+    Returns:
+        True if the server accepted the credentials
+    """
+    try:
+        with IMAPConnectionPool(imap_server, imap_user, imap_pass, folder_name, size=1):
+            pass
+    except (imaplib.IMAP4.error, OSError) as e:
+        st.error(f"❌ Login failed: {e}")
+        return False
+    st.session_state.setdefault('verified_accounts', set()).add(account_key(imap_server, imap_user))
+    return True
+
+
+def render_search_panel(imap_server, imap_user, imap_pass, folder_name):
     """
-    # Extract parameters
-    imap_server = kwargs.get('imap_server')
-    imap_user = kwargs.get('imap_user')
-    imap_pass = kwargs.get('imap_pass')
-    folder_name = kwargs.get('folder_name')
-    start_num = kwargs.get('start_num')
-    end_num = kwargs.get('end_num')
-    extract_plain_only = kwargs.get('extract_plain_only')
-    export_format = kwargs.get('export_format')
-    remove_duplicates = kwargs.get('remove_duplicates')
+    Search the local full-text index of an account
     
-    # Validation
-    if not all([imap_server, imap_user, imap_pass]):
-        st.error("⚠️ Please fill in all connection fields!")
+    The index is only shown after this session logged in to the account
+    (with the button below or through a finished extraction), and it is
+    opened read-only, so browsing never creates a database.
+    """
+    if not fts5_available():
+        st.caption("Full-text search needs SQLite with FTS5, which this Python lacks")
         return
     
-    if start_num > end_num:
-        st.error("⚠️ Start number must be less than or equal to end number!")
-        return
+    verified = st.session_state.get('verified_accounts', set())
+    if account_key(imap_server, imap_user) not in verified:
+        st.caption("Log in to search the emails indexed for this account")
+        if not st.button("🔓 Log In to Search", disabled=not imap_pass):
+            return
+        if not verify_login(imap_server, imap_user, imap_pass, folder_name):
+            return
     
-    # Progress indicators
-    status_msg = st.empty()
-    prog_bar = st.progress(0)
+    if not os.path.exists(index_path(imap_server, imap_user)):
+        st.caption(f"No emails indexed for {imap_user} yet")
+        return
     
-    try:
-        # Connect to IMAP server
-        status_msg.info("🔌 Connecting to IMAP server...")
-        mail = imaplib.IMAP4_SSL(imap_server)
-        mail.login(imap_user, imap_pass)
-        
-        status_msg.info(f"📂 Selecting folder: {folder_name}")
-        mail.select(folder_name)
-        
-        # Search for emails
-        status_msg.info("🔍 Searching for emails...")
-        _, data = mail.search(None, 'ALL')
-        all_ids = data[0].split()
-        
-        if not all_ids:
-            status_msg.error("📭 No emails found in this folder!")
-            mail.logout()
+    with SearchIndex(imap_server, imap_user, read_only=True) as index:
+        total = index.count()
+        st.caption(f"{total} email(s) indexed for {imap_user}")
+        if not total:
             return
         
-        # Calculate range
-        total_emails = len(all_ids)
-        actual_start = max(1, min(start_num, total_emails))
-        actual_end = max(1, min(end_num, total_emails))
-        
-        # Get IDs for the range
-        id_list = all_ids[actual_start-1:actual_end]
+        col_query, col_folder = st.columns([3, 1])
+        with col_query:
+            query = st.text_input(
+                "Search",
+                placeholder='invoice march, "exact phrase", subject:report, deploy*',
+                help="Words, \"phrases\", OR / NOT, prefix* and column filters "
+                     "(subject:, sender:, recipients:, body:)"
+            )
+        with col_folder:
+            folder = st.selectbox("Folder", ["All folders"] + index.folders())
         
-        status_msg.info(f"📊 Found {total_emails} emails. Processing {len(id_list)} emails (#{actual_start} to #{actual_end})")
+        if query.strip():
+            started = time.perf_counter()
+            hits = index.search(query, None if folder == "All folders" else folder)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            st.caption(f"{len(hits)} hit(s) in {elapsed_ms:.1f} ms")
+            for hit in hits:
+                st.markdown(f"**{hit['subject'] or '(no subject)'}** — {hit['sender']}")
+                st.caption(f"{hit['folder']} · UID {hit['uid']} · {hit['date']}")
+                st.markdown(hit['snippet'])
         
-        # Duplicate detection if enabled
-        if remove_duplicates and len(id_list) > 1:
-            status_msg.info("🔍 Checking for duplicates...")
-            email_data_list = []
-            
-            # Fetch basic info for duplicate detection
-            for i, eid in enumerate(id_list):
-                try:
-                    _, msg_data = mail.fetch(eid, '(RFC822)')
-                    raw_bytes = msg_data[0][1]
-                    email_message = email.message_from_bytes(raw_bytes)
-                    
-                    email_data_list.append({
-                        'id': eid,
-                        'message_id': email_message.get('Message-ID', ''),
-                        'subject': email_message.get('Subject', ''),
-                        'from': email_message.get('From', '')
-                    })
-                    prog_bar.progress((i + 1) / len(id_list) * 0.3)  # 30% for duplicate check
-                except:
-                    continue
-            
-            # Detect duplicates
-            unique_emails, duplicates = detect_duplicates(email_data_list)
-            
-            if duplicates:
-                status_msg.warning(
-                    f"⚠️ Found {len(duplicates)} duplicate(s). "
-                    f"Processing {len(unique_emails)} unique emails."
-                )
-                
-                # Show duplicate details
-                with st.expander(f"📋 View {len(duplicates)} Duplicates"):
-                    for dup in duplicates[:20]:
-                        st.caption(
-                            f"Email #{dup['index']}: {dup['subject'][:50]} - {dup['reason']}"
-                        )
-                    if len(duplicates) > 20:
-                        st.caption(f"... and {len(duplicates)-20} more")
+        if st.button("🗑️ Clear Search Index"):
+            with SearchIndex(imap_server, imap_user) as writable:
+                writable.clear()
+            st.success("Search index cleared")
+
+
+def render_profile_loader():
+    """Render the saved-profile picker that fills the header options"""
+    profiles = list_profiles()
+    if not profiles:
+        return
+    
+    col_p1, col_p2 = st.columns([3, 1])
+    with col_p1:
+        selected = st.selectbox("Saved Profile", profiles, key="profile_selected")
+    with col_p2:
+        st.write("")
+        if st.button("📂 Load", use_container_width=True):
+            plan = load_profile(selected)
+            if plan:
+                st.session_state.update({
+                    'opt_rep_dom': plan.rep_dom,
+                    'opt_p_from': plan.p_from or TRANSFORM_WIDGET_DEFAULTS['opt_p_from'],
+                    'opt_std_headers': plan.std_headers,
+                    'opt_mod_eid': plan.mod_eid,
+                    'opt_clean_auth': plan.clean_auth,
+                    'opt_custom_headers_text': plan.custom_headers_text
+                })
+
+
+def render_profile_saver(plan):
+    """Render the controls that save the current header options as a profile"""
+    col_s1, col_s2 = st.columns([3, 1])
+    with col_s1:
+        profile_name = st.text_input(
+            "Profile Name",
+            placeholder="e.g. newsletter-cleanup",
+            help="Save the header options above as a reusable profile"
+        )
+    with col_s2:
+        st.write("")
+        if st.button("💾 Save Profile", use_container_width=True):
+            if profile_name.strip():
+                save_profile(profile_name, plan)
+                st.success(f"✅ Profile '{profile_name.strip()}' saved")
             else:
-                status_msg.success("✅ No duplicates found!")
-            
-            # Update id_list to only unique emails
-            id_list = [item['id'] for item in unique_emails]
-            
-            if not id_list:
-                st.error("📭 All emails were duplicates!")
-                mail.logout()
-                return
+                st.warning("⚠️ Enter a profile name first")
+
+
+def batch_targets(rows, imap_server, imap_user, imap_pass, start_num, end_num):
+    """
+    Turn the rows of the batch table into extraction targets
+    
+    Args:
+        rows: Edited batch table (DataFrame or list of dicts)
+        imap_server, imap_user, imap_pass, start_num, end_num: Values of the
+            main form used for empty cells
         
-        # Process based on extraction mode
-        if extract_plain_only:
-            process_text_extraction(
-                mail=mail,
-                id_list=id_list,
-                export_format=export_format,
-                name_by_subj=kwargs.get('name_by_subj'),
-                status_msg=status_msg,
-                prog_bar=prog_bar
+    Returns:
+        List of target dicts (rows without a folder are skipped)
+    """
+    if hasattr(rows, 'to_dict'):
+        rows = rows.to_dict('records')
+    
+    def cell(row, column, default):
+        value = row.get(column)
+        # Empty cells come back as None, '' or NaN
+        if value is None or value != value or str(value).strip() == '':
+            return default
+        return value.strip() if isinstance(value, str) else value
+    
+    targets = []
+    for row in rows:
+        folder = cell(row, 'Folder', '')
+        if not folder:
+            continue
+        targets.append({
+            'imap_server': cell(row, 'Server', imap_server),
+            'imap_user': cell(row, 'Email', imap_user),
+            'imap_pass': cell(row, 'Password', imap_pass),
+            'folder_name': folder,
+            'start_num': int(cell(row, 'Start', start_num)),
+            'end_num': int(cell(row, 'End', end_num)),
+        })
+    return targets
+
+
+def process_emails(**kwargs):
+    """
+    Main email processing function
+    Submits the extraction as a background job tracked in the session
+    """
+    if kwargs.get('targets') == []:
+        st.error("⚠️ Add at least one folder to the batch!")
+        return
+    problem = validate_options(kwargs)
+    if problem:
+        st.error(problem)
+        return
+    
+    # Browser users may only write below the export root
+    if kwargs.get('output_dir'):
+        output_dir = resolve_export_dir(kwargs['output_dir'])
+        if output_dir is None:
+            st.error(f"⚠️ The server directory must be inside {EXPORT_ROOT}!")
+            return
+        kwargs['output_dir'] = output_dir
+    
+    # Per-stage timings of this run (optionally with cProfile/tracemalloc)
+    metrics = RunMetrics(profile=kwargs.get('profile_run', False))
+    owner = account_key(kwargs['imap_server'], kwargs['imap_user'])
+    try:
+        runner = run_batch if kwargs.get('targets') else run_extraction
+        job = get_job_manager().submit(owner, kwargs, metrics, runner)
+    except JobLimitError as e:
+        st.warning(f"⏳ {e}. Wait for it to finish before starting another one.")
+        return
+    st.session_state.setdefault('email_jobs', []).append(job.id)
+
+
+def save_run_metrics(job):
+    """
+    Keep the statistics of a finished job for the stats panel
+    
+    Args:
+        job: Finished BackgroundJob
+    """
+    metrics = job.metrics
+    st.session_state['last_run_metrics'] = {
+        'summary': {**job.run_info, **metrics.to_dict()},
+        'json': metrics.to_json(**job.run_info),
+        'profile': metrics.profile_text,
+        'memory': metrics.memory_text,
+    }
+
+
+def render_jobs():
+    """Show the background jobs of this session; poll while any is running"""
+    manager = get_job_manager()
+    manager.sweep()
+    job_ids = st.session_state.get('email_jobs', [])
+    jobs = [job for job in map(manager.get, job_ids) if job is not None]
+    st.session_state['email_jobs'] = [job.id for job in jobs]
+    if not jobs:
+        return
+    
+    # Jobs whose statistics are already in the stats panel
+    recorded = st.session_state.get('recorded_jobs', set()) & set(st.session_state['email_jobs'])
+    st.session_state['recorded_jobs'] = recorded
+    for job in jobs:
+        render_job(manager, job)
+        if not job.active and job.id not in recorded:
+            recorded.add(job.id)
+            save_run_metrics(job)
+            # A single-account run that got past the login unlocks its search index
+            if job.state in ('done', 'empty') and not job.kwargs.get('targets'):
+                st.session_state.setdefault('verified_accounts', set()).add(job.owner)
+    
+    if any(job.active for job in jobs):
+        time.sleep(JOB_POLL_INTERVAL)
+        st.rerun()
+
+
+def render_job(manager, job):
+    """Render status, progress and downloads of one background job"""
+    snap = job.progress.snapshot()
+    run = job.run_info
+    st.markdown(f"**{JOB_STATE_LABELS.get(job.state, job.state)}** · "
+                f"{run['mode']} export of `{run['folder']}` · job `{job.id}`")
+    
+    if job.active:
+        st.progress(snap['fraction'])
+    if snap['status']:
+        level, message = snap['status']
+        getattr(st, level)(message)
+    if snap['traceback']:
+        with st.expander("Error details"):
+            st.code(snap['traceback'], language=None)
+    for title, lines in snap['details']:
+        with st.expander(title):
+            for line in lines:
+                st.caption(line)
+    
+    # Downloads are built once the job is finished, not on every poll
+    if not job.active:
+        for artifact in snap['artifacts']:
+            render_artifact(manager, job, artifact)
+    if not job.active:
+        if snap['artifacts']:
+            st.caption(f"Kept for {manager.ttl // 60} minutes or until downloaded")
+        if st.button("✖️ Dismiss", key=f"dismiss_{job.id}"):
+            manager.release(job.id)
+            st.rerun()
+
+
+def render_artifact(manager, job, artifact):
+    """
+    Offer the download of one job artifact
+    
+    Large artifacts were published to the static file route by the job and
+    are plain links, so the file is streamed by the server instead of being
+    read into memory; small ones use download buttons.
+    """
+    label = artifact['label']
+    if artifact['links']:
+        links = artifact['links']
+        for name, url in links.items():
+            text = label if len(links) == 1 else f"{label} – {name}"
+            st.markdown(
+                f'<a href="{html.escape(url)}" download="{html.escape(name)}">'
+                f'{html.escape(text)}</a>',
+                unsafe_allow_html=True
             )
-        else:
-            process_original_emails(
-                mail=mail,
-                id_list=id_list,
-                kwargs=kwargs,
-                status_msg=status_msg,
-                prog_bar=prog_bar
+        return
+    
+    parts = artifact['sink'].downloads(artifact['file_name'])
+    for name, data in parts:
+        if name in job.downloaded:
+            continue
+        st.download_button(
+            label=label if len(parts) == 1 else f"{label} – {name}",
+            data=data,
+            file_name=name,
+            mime=artifact['mime'],
+            use_container_width=True,
+            key=f"download_{job.id}_{name}",
+            on_click=manager.downloaded,
+            args=(job.id, name)
+        )
+
+
+def render_run_metrics():
+    """Show the statistics of the last run, if any"""
+    last = st.session_state.get('last_run_metrics')
+    if not last:
+        return
+    
+    summary = last['summary']
+    with st.expander("📈 Run Statistics"):
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Emails", summary['messages'])
+        col2.metric("Duration", f"{summary['elapsed_s']:.2f} s")
+        col3.metric("Emails / s", f"{summary['messages_per_s']:.1f}")
+        col4.metric("Fetched", f"{summary['bytes_fetched'] / 1048576:.1f} MB")
+        
+        if summary['process_peak_rss_mb'] is not None:
+            # The process peak covers every run of the app; the run figures
+            # are sampled during this run only (Linux)
+            run_memory = ''
+            if summary['run_peak_rss_mb'] is not None:
+                run_memory = (f"Memory this run: peak {summary['run_peak_rss_mb']} MB "
+                              f"(+{summary['run_rss_growth_mb']} MB) · ")
+            st.caption(
+                f"{run_memory}Process peak {summary['process_peak_rss_mb']} MB · "
+                f"{summary['bytes_per_s'] / 1048576:.2f} MB/s downloaded · mode: {summary['mode']}"
             )
         
-        # Cleanup
-        mail.logout()
+        st.table([
+            {
+                'Stage': name,
+                'Wall (s)': f"{stage['wall_s']:.3f}",
+                'CPU (s)': f"{stage['cpu_s']:.3f}",
+                'Calls': stage['calls'],
+                'MB': f"{stage['bytes'] / 1048576:.2f}",
+            }
+            for name, stage in summary['stages'].items()
+        ])
+        st.caption("Stages overlap, so their wall times can add up to more than the run duration")
+        
+        st.download_button(
+            label="📥 Download Statistics (.json)",
+            data=last['json'],
+            file_name="run_metrics.json",
+            mime="application/json"
+        )
         
-    except imaplib.IMAP4.error as e:
-        status_msg.error(f"❌ IMAP Error: {str(e)}")
-        st.error("Check your credentials and server settings")
-    except Exception as e:
-        status_msg.error(f"❌ Error: {str(e)}")
-        st.exception(e)
+        if last['profile']:
+            st.markdown("**cProfile (top 30 by cumulative time)**")
+            st.code(last['profile'], language=None)
+        if last['memory']:
+            st.markdown("**tracemalloc (top allocations)**")
+            st.code(last['memory'], language=None)
+
@@ -4,15 +4,17 @@ Renders the V6.html HTML editor interface
 """
 import streamlit as st
 import streamlit.components.v1 as components
-import os
+from utils.config import MINIFY_HTML_ASSETS, PRECOMPRESS_HTML_ASSETS
+from utils.html_assets import get_html_asset
 
 def render():
     """Render the HTML Fusion Editor page"""
     html_file_path = "V6.html"
     
-    if os.path.exists(html_file_path):
-        with open(html_file_path, "r", encoding="utf-8") as f:
-            html_code = f.read()
+    # Served from the process-wide cache; re-read only when the file changes
+    asset = get_html_asset(html_file_path)
+    if asset is not None:
+        html_code = asset.variant(MINIFY_HTML_ASSETS, PRECOMPRESS_HTML_ASSETS)
         
         # Render HTML component with scrolling enabled
         components.html(html_code, height=920, scrolling=True)
@@ -0,0 +1,55 @@
+"""
+Headless imports
+The CLI, the benchmarks and the job runner must load without Streamlit installed
+"""
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Makes any import of streamlit fail, as on a machine without it
+_BLOCK_STREAMLIT = """
+import sys
+
+class BlockStreamlit:
+    def find_spec(self, name, path=None, target=None):
+        if name == 'streamlit' or name.startswith('streamlit.'):
+            raise ModuleNotFoundError("No module named 'streamlit'", name=name)
+        return None
+
+sys.meta_path.insert(0, BlockStreamlit())
+"""
+
+
+def _import_without_streamlit(*modules):
+    code = _BLOCK_STREAMLIT + ''.join(f"import {module}\n" for module in modules)
+    return subprocess.run([sys.executable, '-c', code], cwd=ROOT,
+                          capture_output=True, text=True, timeout=120)
+
+
+class HeadlessImportTest(unittest.TestCase):
+
+    def test_cli_imports_without_streamlit(self):
+        result = _import_without_streamlit('cli')
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_engine_imports_without_streamlit(self):
+        result = _import_without_streamlit(
+            'benchmarks.run', 'components.background_jobs', 'components.batch',
+            'components.progress', 'utils', 'components'
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_cli_help_without_streamlit(self):
+        code = _BLOCK_STREAMLIT + "import runpy; sys.argv = ['cli.py', '--help']\n" \
+                                  "runpy.run_path('cli.py', run_name='__main__')\n"
+        result = subprocess.run([sys.executable, '-c', code], cwd=ROOT,
+                                capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('usage', result.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
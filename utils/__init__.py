@@ -1,5 +1,6 @@
-"""Utils package for CMH1 Fusion"""
-from .config import setup_page
-from .styles import load_custom_css
+"""
+Utils package for CMH1 Fusion
 
-__all__ = ['setup_page', 'load_custom_css']
+Nothing is imported here: the helpers are shared with the headless CLI,
+which must load without Streamlit (Streamlit-only code lives in styles.py).
+"""
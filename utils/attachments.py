@@ -0,0 +1,112 @@
+"""
+Attachment helpers
+Size/type filters and incremental transfer decoding of attachment parts
+"""
+import binascii
+import fnmatch
+import os
+import re
+
+from utils.email_utils import decode_header_text
+
+_BASE64_JUNK = re.compile(rb'[^A-Za-z0-9+/=]')
+
+
+def attachment_name(value):
+    """Decode an attachment file name (encoded words) to a plain string"""
+    if not value:
+        return ''
+    name = decode_header_text(str(value)) if '=?' in str(value) else str(value)
+    return name.replace('\r', '').replace('\n', '').strip()
+
+
+def decoded_size(size, encoding):
+    """
+    Estimate the decoded size of a part from its transfer-encoded size
+
+    Base64 carries 57 bytes per 78-byte line (76 characters plus CRLF);
+    other encodings are counted as they are.
+    """
+    if encoding == 'base64':
+        return size * 57 // 78
+    return size
+
+
+class AttachmentFilter:
+    """
+    Decides from the part metadata alone whether an attachment is wanted
+
+    Type patterns are MIME types, optionally with wildcards ('image/*',
+    'application/pdf'), or file extensions ('pdf', '.docx'). Sizes are in
+    KB of decoded content; 0 means no limit.
+    """
+
+    def __init__(self, types='', min_kb=0, max_kb=0):
+        patterns = [p.strip().lower() for p in re.split(r'[,;\s]+', types or '') if p.strip()]
+        self.mime_patterns = [p for p in patterns if '/' in p]
+        self.extensions = {'.' + p.lstrip('*').lstrip('.') for p in patterns if '/' not in p}
+        self.min_bytes = int((min_kb or 0) * 1024)
+        self.max_bytes = int((max_kb or 0) * 1024)
+
+    def accepts(self, content_type, filename, size):
+        """
+        Check one attachment
+
+        Args:
+            content_type: Lower-case MIME type, e.g. 'application/pdf'
+            filename: Decoded file name ('' if none)
+            size: Decoded size in bytes (estimated)
+
+        Returns:
+            True if the attachment should be exported
+        """
+        if size < self.min_bytes or (self.max_bytes and size > self.max_bytes):
+            return False
+        if not self.mime_patterns and not self.extensions:
+            return True
+        if any(fnmatch.fnmatchcase(content_type, p) for p in self.mime_patterns):
+            return True
+        return os.path.splitext(filename)[1].lower() in self.extensions
+
+
+class StreamDecoder:
+    """
+    Incremental Content-Transfer-Encoding decoder
+
+    feed() accepts the encoded part in arbitrary slices and returns the
+    bytes decodable so far; input that ends mid-quantum (base64) or mid-line
+    (quoted-printable) is held back until the next slice or flush().
+    """
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.tail = b''
+
+    def feed(self, data):
+        if self.encoding == 'base64':
+            data = self.tail + _BASE64_JUNK.sub(b'', bytes(data))
+            usable = len(data) - len(data) % 4
+            self.tail = data[usable:]
+            return self._base64(data[:usable])
+        if self.encoding == 'quoted-printable':
+            data = self.tail + bytes(data)
+            cut = data.rfind(b'\n') + 1
+            self.tail = data[cut:]
+            return binascii.a2b_qp(data[:cut])
+        return bytes(data)
+
+    def flush(self):
+        tail, self.tail = self.tail, b''
+        if self.encoding == 'base64':
+            # Tolerate missing padding at the very end
+            return self._base64(tail + b'=' * (-len(tail) % 4)) if tail.strip(b'=') else b''
+        if self.encoding == 'quoted-printable':
+            return binascii.a2b_qp(tail)
+        return tail
+
+    @staticmethod
+    def _base64(data):
+        try:
+            return binascii.a2b_base64(data)
+        except binascii.Error:
+            return b''
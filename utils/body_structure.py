@@ -0,0 +1,368 @@
+"""
+BODYSTRUCTURE-driven text and attachment extraction
+Locates the best text part (or the attachments) on the server and fetches only those sections
+"""
+import email
+from urllib.parse import unquote
+
+from utils.attachments import attachment_name
+from utils.config import DEFAULT_FETCH_CHUNK_SIZE
+from utils.email_utils import clean_html_to_plain
+from utils.header_rewriter import split_message
+from utils.imap_fetch import chunk_ids, fetch_batched, get_item
+from utils.mime_walker import decode_part, find_body_text, iter_raw_attachments
+
+# Structure plus the Subject header (for file names), no body bytes
+STRUCTURE_QUERY = '(BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (SUBJECT)])'
+# Same, with the headers kept by the full-text search index
+STRUCTURE_HEADERS_QUERY = '(BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (SUBJECT FROM TO CC DATE MESSAGE-ID)])'
+
+
+def _text(value):
+    """Decode a BODYSTRUCTURE atom/string to lower-case str"""
+    if isinstance(value, bytes):
+        return value.decode('ascii', 'ignore').lower()
+    return ''
+
+
+def _params(value):
+    """Turn a BODYSTRUCTURE parameter list into a dict"""
+    if not isinstance(value, list):
+        return {}
+    return {_text(value[k]): value[k + 1] for k in range(0, len(value) - 1, 2)}
+
+
+def _disposition_field(part):
+    """Return the (type, parameters) disposition list of a single-part BODYSTRUCTURE"""
+    ctype = _text(part[0])
+    # Extension data starts after the type-specific fields
+    if ctype == 'text':
+        idx = 9
+    elif ctype == 'message' and _text(part[1]) == 'rfc822':
+        idx = 11
+    else:
+        idx = 8
+    if len(part) > idx and isinstance(part[idx], list) and part[idx]:
+        return part[idx]
+    return []
+
+
+def _disposition(part):
+    """Return the disposition type of a single-part BODYSTRUCTURE"""
+    field = _disposition_field(part)
+    return _text(field[0]) if field else ''
+
+
+def _filename(part):
+    """Return the file name of a single-part BODYSTRUCTURE ('' if none)"""
+    field = _disposition_field(part)
+    candidates = [_params(field[1]) if len(field) > 1 else {}, _params(part[2])]
+    for params, key in ((candidates[0], 'filename'), (candidates[1], 'name')):
+        value = params.get(key)
+        if isinstance(value, bytes):
+            return attachment_name(value.decode('utf-8', 'replace'))
+        # RFC 2231 form, e.g. filename*=utf-8''r%C3%A9sum%C3%A9.pdf
+        value = params.get(key + '*')
+        if isinstance(value, bytes):
+            charset, _, text = value.decode('ascii', 'replace').partition("''")
+            if not text:
+                charset, text = 'utf-8', charset
+            try:
+                return attachment_name(unquote(text, charset or 'utf-8', 'replace'))
+            except LookupError:
+                return attachment_name(unquote(text))
+    return ''
+
+
+def iter_parts(structure, section=''):
+    """
+    Walk a parsed BODYSTRUCTURE and yield its leaf parts
+
+    Args:
+        structure: Nested list as parsed from the FETCH response
+        section: Section number of this node ('' for the message itself)
+
+    Returns:
+        Generator of (section number, leaf structure list)
+    """
+    if not isinstance(structure, list) or not structure:
+        return
+    if isinstance(structure[0], list):
+        n = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            n += 1
+            yield from iter_parts(child, f"{section}.{n}" if section else str(n))
+    else:
+        yield section or '1', structure
+
+
+def find_text_part(structure):
+    """
+    Choose the part get_email_body_text() would use
+
+    The first non-attachment text/plain part wins; otherwise the first
+    text/html part is used.
+
+    Args:
+        structure: Parsed BODYSTRUCTURE
+
+    Returns:
+        Dict with section, subtype, encoding and charset, or None
+    """
+    html_part = None
+    for section, part in iter_parts(structure):
+        if _text(part[0]) != 'text' or _disposition(part) == 'attachment':
+            continue
+        if len(part) > 6 and part[6] in (b'0', 0):
+            continue
+
+        subtype = _text(part[1])
+        params = _params(part[2])
+        info = {
+            'section': section,
+            'subtype': subtype,
+            'encoding': _text(part[5]) if len(part) > 5 else '',
+            'charset': _text(params.get('charset')) or None,
+        }
+        if subtype == 'plain':
+            return info
+        if subtype == 'html' and html_part is None:
+            html_part = info
+    return html_part
+
+
+def find_attachments(structure):
+    """
+    List the attachments of a message from its BODYSTRUCTURE
+
+    A leaf part is an attachment when its disposition is 'attachment' or
+    it carries a file name (as in mime_walker.iter_raw_attachments()).
+
+    Args:
+        structure: Parsed BODYSTRUCTURE
+
+    Returns:
+        List of dicts with section, content_type, filename, encoding and
+        size (transfer-encoded bytes as reported by the server)
+    """
+    found = []
+    for section, part in iter_parts(structure):
+        filename = _filename(part)
+        if _disposition(part) != 'attachment' and not filename:
+            continue
+        try:
+            size = int(part[6])
+        except (IndexError, TypeError, ValueError):
+            size = 0
+        found.append({
+            'section': section,
+            'content_type': f"{_text(part[0])}/{_text(part[1])}",
+            'filename': filename,
+            'encoding': _text(part[5]) if len(part) > 5 else '',
+            'size': size,
+        })
+    return found
+
+
+def _headers(items):
+    """Parse the header block of a HEADER.FIELDS item"""
+    # Items merged with prefetched ones may hold an earlier, narrower
+    # header block first; the one fetched last has every wanted field
+    blocks = [value for name, value in items.items() if name.startswith('BODY[HEADER')]
+    return email.message_from_bytes(blocks[-1] if blocks else b'')
+
+
+def decode_text_payload(payload):
+    """
+    Turn a payload from fetch_text_bodies(decode=False) into body text
+
+    Module-level and free of connection state, so it can run in a worker
+    process.
+
+    Args:
+        payload: ('raw', message bytes), ('part', data, encoding, charset,
+            subtype) or None
+
+    Returns:
+        Body text string
+    """
+    if not payload:
+        return ""
+    if payload[0] == 'raw':
+        return find_body_text(payload[1])
+    _, data, encoding, charset, subtype = payload
+    text = decode_part(data, encoding, charset)
+    if subtype == 'html':
+        text = clean_html_to_plain(text)
+    return text
+
+
+def payload_size(payload):
+    """Size in bytes of the data carried by a text payload"""
+    return len(payload[1]) if payload else 0
+
+
+def _part_payload(part, data):
+    """Text payload for a downloaded section of the part find_text_part() chose"""
+    return ('part', data, part['encoding'], part['charset'], part['subtype'])
+
+
+def fetch_text_bodies(mail, id_list, chunk_size=DEFAULT_FETCH_CHUNK_SIZE, prefetched=None,
+                      decode=True, with_headers=False, keep_parts=False):
+    """
+    Fetch only the text body of each message
+
+    BODYSTRUCTURE is fetched in bulk first; then, per chunk, one FETCH per
+    distinct section number retrieves just the chosen text parts. Messages
+    already held by a local cache (get_cached() on the source) are parsed
+    from the cached copy without any network I/O; a source that also has
+    get_cached_part()/put_cached_part() serves text parts it has seen
+    before and keeps the ones downloaded here.
+
+    Args:
+        mail: IMAP connection, pool or cached fetch source
+        id_list: List of message IDs
+        chunk_size: Number of messages per FETCH command
+        prefetched: Optional dict of eid -> items already downloaded
+            (structure, headers or text parts)
+        decode: Decode bodies here; with False the undecoded payload is
+            yielded for decode_text_payload() to handle elsewhere
+        with_headers: Yield the parsed headers (Subject, From, To, Cc,
+            Date, Message-ID) as an email.message.Message instead of the
+            subject
+        keep_parts: Store the downloaded text parts in prefetched, so a
+            later pass over the same messages does not fetch them again
+
+    Returns:
+        Generator of (index in id_list, eid, subject or headers, body text
+        or payload) in order
+    """
+    structure_query = STRUCTURE_HEADERS_QUERY if with_headers else STRUCTURE_QUERY
+    get_cached = getattr(mail, 'get_cached', None)
+    get_cached_part = getattr(mail, 'get_cached_part', None)
+    put_cached_part = getattr(mail, 'put_cached_part', None)
+    # Give a connection pool enough work per window to keep every session busy
+    window = chunk_size * max(1, len(getattr(mail, 'connections', None) or [None]))
+
+    for offset, chunk in chunk_ids(id_list, window):
+        results = {}
+
+        remote = []
+        for eid in chunk:
+            raw = get_cached(eid) if get_cached else None
+            if raw is None:
+                remote.append(eid)
+                continue
+            headers = email.message_from_bytes(split_message(raw)[0])
+            results[eid] = (headers if with_headers else headers.get('Subject', 'no_subject'),
+                            ('raw', raw))
+
+        # Pick the text section of every remote message, grouped by section
+        wanted = {}
+        for _, eid, items in fetch_batched(mail, remote, structure_query, chunk_size, prefetched):
+            part = find_text_part(items.get('BODYSTRUCTURE'))
+            headers = _headers(items)
+            results[eid] = (headers if with_headers else headers.get('Subject', 'no_subject'), None)
+            if not part:
+                continue
+            data = get_cached_part(eid, part['section']) if get_cached_part else None
+            if data is not None:
+                results[eid] = (results[eid][0], _part_payload(part, data))
+            else:
+                wanted.setdefault(part['section'], []).append((eid, part))
+
+        for section, entries in wanted.items():
+            parts = dict(entries)
+            query = f"(BODY.PEEK[{section}])"
+            item = f"BODY[{section}]"
+            for _, eid, items in fetch_batched(mail, list(parts), query, chunk_size, prefetched):
+                data = items.get(item)
+                if not data:
+                    continue
+                if keep_parts:
+                    prefetched.setdefault(eid, {})[item] = data
+                if put_cached_part:
+                    put_cached_part(eid, section, data)
+                results[eid] = (results[eid][0], _part_payload(parts[eid], data))
+
+        for j, eid in enumerate(chunk):
+            if eid in results:
+                subject, payload = results.pop(eid)
+                yield offset + j, eid, subject, decode_text_payload(payload) if decode else payload
+
+
+def fetch_attachment_lists(mail, id_list, chunk_size=DEFAULT_FETCH_CHUNK_SIZE, prefetched=None):
+    """
+    List the attachments of each message without downloading them
+
+    Remote messages cost one BODYSTRUCTURE + header FETCH per chunk;
+    messages held by a local cache are walked in place.
+
+    Args:
+        mail: IMAP connection, pool or cached fetch source
+        id_list: List of message IDs
+        chunk_size: Number of messages per FETCH command
+        prefetched: Optional dict of eid -> items already downloaded
+
+    Returns:
+        Generator of (index in id_list, eid, headers Message, attachments)
+        in order. Attachments are dicts with content_type, filename
+        (decoded), encoding and size (transfer-encoded bytes), plus
+        'section' for remote parts or 'data' (memoryview of the encoded
+        body) for cached ones.
+    """
+    get_cached = getattr(mail, 'get_cached', None)
+    window = chunk_size * max(1, len(getattr(mail, 'connections', None) or [None]))
+
+    for offset, chunk in chunk_ids(id_list, window):
+        results = {}
+
+        remote = []
+        for eid in chunk:
+            raw = get_cached(eid) if get_cached else None
+            if raw is None:
+                remote.append(eid)
+                continue
+            parts = [{**part, 'filename': attachment_name(part['filename'])}
+                     for part in iter_raw_attachments(raw)]
+            results[eid] = (email.message_from_bytes(split_message(raw)[0]), parts)
+
+        for _, eid, items in fetch_batched(mail, remote, STRUCTURE_HEADERS_QUERY, chunk_size, prefetched):
+            results[eid] = (_headers(items), find_attachments(items.get('BODYSTRUCTURE')))
+
+        for j, eid in enumerate(chunk):
+            if eid in results:
+                headers, parts = results.pop(eid)
+                yield offset + j, eid, headers, parts
+
+
+def fetch_part_chunks(mail, eid, section, chunk_bytes):
+    """
+    Download one body section in slices with partial FETCHes
+
+    Each request asks for BODY.PEEK[section]<offset.chunk_bytes>, so no
+    more than one slice of the part is held in memory.
+
+    Args:
+        mail: IMAP connection, pool or cached fetch source
+        eid: Message ID
+        section: Section number, e.g. '2' or '1.3'
+        chunk_bytes: Bytes per request
+
+    Returns:
+        Generator of transfer-encoded byte slices, in order
+    """
+    offset = 0
+    while True:
+        query = f"(BODY.PEEK[{section}]<{offset}.{chunk_bytes}>)"
+        data = None
+        for _, _, items in fetch_batched(mail, [eid], query, 1):
+            data = get_item(items, f"BODY[{section}]")
+        if not data:
+            return
+        yield data
+        if len(data) < chunk_bytes:
+            return
+        offset += len(data)
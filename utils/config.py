@@ -1,17 +1,134 @@
 """
-Configuration module for page setup and constants
+Configuration constants
+Shared by the Streamlit app and the headless CLI, so it must not import Streamlit
 """
-import streamlit as st
-
-def setup_page():
-    """Configure Streamlit page settings"""
-    st.set_page_config(
-        page_title="CMH1 Fusion",
-        page_icon="🚀",
-        layout="wide",
-        initial_sidebar_state="collapsed"
-    )
+import os
+import zipfile
 
 # Application constants
 APP_NAME = "CMH1 Fusion"
 APP_VERSION = "2.0"
+
+# IMAP fetch settings
+DEFAULT_FETCH_CHUNK_SIZE = 500
+
+# Parallel IMAP connections (providers reject sessions above their limit)
+DEFAULT_POOL_SIZE = 1
+# FETCH commands kept in flight per connection (1 = wait for each reply)
+DEFAULT_PIPELINE_DEPTH = 1
+DEFAULT_MAX_CONNECTIONS = 4
+MAX_CONNECTIONS_PER_SERVER = {
+    'imap.gmail.com': 10,
+    'outlook.office365.com': 8,
+    'imap-mail.outlook.com': 8,
+    'imap.mail.yahoo.com': 5,
+    'imap.aol.com': 5,
+    'imap.mail.me.com': 5,
+}
+
+
+def max_connections_for(server):
+    """Return the maximum number of concurrent IMAP sessions for a server"""
+    return MAX_CONNECTIONS_PER_SERVER.get((server or '').strip().lower(), DEFAULT_MAX_CONNECTIONS)
+
+# Batch extraction: IMAP connections shared by all targets of a batch
+DEFAULT_CONNECTION_BUDGET = 8
+
+# Processing pipeline: worker processes for parsing and in-flight limits
+DEFAULT_PARSE_WORKERS = min(4, (os.cpu_count() or 1) - 1)
+PIPELINE_MAX_PENDING = 64
+PIPELINE_MAX_BYTES = 64 * 1024 * 1024
+
+# Output spooling: archives stay in memory up to this size, then move to disk
+SPOOL_MEMORY_THRESHOLD = 32 * 1024 * 1024
+
+# ZIP archives: compression methods offered and threads compressing entries;
+# at least one, so deflate runs as its own stage beside fetch and writing
+ZIP_METHODS = {
+    'deflated': zipfile.ZIP_DEFLATED,
+    'stored': zipfile.ZIP_STORED,
+    'bzip2': zipfile.ZIP_BZIP2,
+    'lzma': zipfile.ZIP_LZMA,
+}
+DEFAULT_ZIP_LEVEL = 6
+DEFAULT_ZIP_WORKERS = max(1, min(8, (os.cpu_count() or 1) - 1))
+
+# Attachment export: bytes per partial FETCH / decode slice; smaller parts
+# are fetched whole, many messages per command
+ATTACHMENT_CHUNK_BYTES = 1024 * 1024
+
+# Local data directory (message cache, indexes, job state)
+DATA_DIR = os.environ.get(
+    'CMH1_DATA_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'cmh1_fusion')
+)
+
+# Server directories the web page may write exports to (CLI jobs are not
+# restricted)
+EXPORT_ROOT = os.environ.get('CMH1_EXPORT_ROOT', os.path.join(DATA_DIR, 'exports'))
+
+
+def resolve_export_dir(name):
+    """
+    Resolve a server directory typed into the page inside EXPORT_ROOT
+
+    Args:
+        name: Directory relative to EXPORT_ROOT (or absolute within it)
+
+    Returns:
+        Absolute real path, or None if it would lie outside EXPORT_ROOT
+    """
+    root = os.path.realpath(EXPORT_ROOT)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root:
+        return None
+    return path
+
+# Raw message cache
+MESSAGE_CACHE_DIR = os.path.join(DATA_DIR, 'messages')
+MESSAGE_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# HTML tool pages: minify and/or send gzip-compressed (inflated by the browser)
+MINIFY_HTML_ASSETS = os.environ.get('CMH1_MINIFY_HTML', '0') == '1'
+PRECOMPRESS_HTML_ASSETS = os.environ.get('CMH1_PRECOMPRESS_HTML', '0') == '1'
+
+# Resumable extraction jobs
+JOBS_DIR = os.path.join(DATA_DIR, 'jobs')
+CHECKPOINT_INTERVAL = 100
+
+# Background extraction jobs: shared executor size, running jobs per account,
+# how long finished downloads are kept, and the page's polling interval (s)
+MAX_BACKGROUND_JOBS = 4
+MAX_JOBS_PER_USER = 1
+JOB_ARTIFACT_TTL = 60 * 60
+JOB_POLL_INTERVAL = 1.0
+
+# Job downloads larger than this are not pushed through st.download_button
+# (which reads them into memory on every rerun) but linked from Streamlit's
+# static file route (server.enableStaticServing, see .streamlit/config.toml)
+DOWNLOAD_BUTTON_MAX_BYTES = 32 * 1024 * 1024
+STATIC_DOWNLOAD_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'downloads'
+)
+STATIC_DOWNLOAD_URL = 'app/static/downloads'
+
+# Persistent index of exported emails (cross-run duplicate detection)
+DEDUP_INDEX_DIR = os.path.join(DATA_DIR, 'dedup')
+
+# Local full-text search index of extracted emails (messages per transaction)
+SEARCH_INDEX_DIR = os.path.join(DATA_DIR, 'search')
+SEARCH_INDEX_BATCH = 500
+
+# Run statistics log (one JSON line per extraction run)
+METRICS_DIR = os.path.join(DATA_DIR, 'metrics')
+
+# Saved benchmark results (python -m benchmarks.run --save NAME)
+BENCHMARK_DIR = os.path.join(DATA_DIR, 'benchmarks')
+
+# Saved header transformation profiles
+PROFILES_DIR = os.path.join(DATA_DIR, 'profiles')
+
+# Content-based duplicate detection
+FINGERPRINT_SIZE = 64
+SHINGLE_SIZE = 3
+DEFAULT_SIMILARITY_THRESHOLD = 0.9
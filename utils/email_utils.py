@@ -3,6 +3,9 @@ Email processing utilities for IMAP tool
 """
 import re
 from email.header import decode_header
+from utils.fingerprint import NearDuplicateIndex
+from utils.html_text import html_to_text
+from utils.mime_walker import decode_part, find_body_text
 
 def decode_header_text(header_value):
     """
@@ -57,33 +60,39 @@ def clean_filename(subject):
     return clean.strip().replace(' ', '_')[:60]
 
 
-def clean_html_to_plain(html_content):
+def clean_html_to_plain(html_content, max_chars=None):
     """
-    Strip HTML tags and convert to plain text using regex
+    Convert HTML to plain text with a streaming tokenizer
+    
+    Script/style/head content is dropped, entities are decoded and block
+    elements are kept as line and paragraph breaks.
     
     Args:
         html_content: HTML string to clean
+        max_chars: Optional cap on the output length; parsing stops early
         
     Returns:
         Plain text string
     """
-    # Remove HTML tags
-    clean = re.sub(r'<[^>]+>', ' ', html_content)
-    # Collapse whitespace
-    clean = re.sub(r'\s+', ' ', clean).strip()
-    return clean
+    return html_to_text(html_content, max_chars)
 
 
 def get_email_body_text(msg_obj):
     """
     Extract plain text body from email message, preferring plain text over HTML
     
+    Raw message bytes are handled by the lazy MIME walker, which never
+    builds the message tree or decodes attachments.
+    
     Args:
-        msg_obj: email.message.Message object
+        msg_obj: email.message.Message object or raw RFC822 bytes
         
     Returns:
         Extracted body text as string
     """
+    if isinstance(msg_obj, (bytes, bytearray, memoryview)):
+        return find_body_text(msg_obj)
+    
     body_text = ""
     
     if msg_obj.is_multipart():
@@ -92,8 +101,10 @@ def get_email_body_text(msg_obj):
             ctype = part.get_content_type()
             cdispo = str(part.get('Content-Disposition'))
             
-            # Skip attachments
-            if 'attachment' in cdispo:
+            # Skip attachments and non-text parts before decoding anything
+            if 'attachment' in cdispo or ctype not in ('text/plain', 'text/html'):
+                continue
+            if ctype == 'text/html' and body_text:
                 continue
             
             try:
@@ -101,11 +112,11 @@ def get_email_body_text(msg_obj):
                 if not payload:
                     continue
                 
-                decoded_payload = payload.decode('utf-8', 'ignore')
+                decoded_payload = decode_part(payload, '', part.get_content_charset())
                 
                 if ctype == 'text/plain':
                     return decoded_payload  # Best case, return immediately
-                elif ctype == 'text/html' and not body_text:
+                else:
                     # Store HTML as fallback
                     body_text = clean_html_to_plain(decoded_payload)
             except:
@@ -115,7 +126,7 @@ def get_email_body_text(msg_obj):
         try:
             payload = msg_obj.get_payload(decode=True)
             if payload:
-                decoded = payload.decode('utf-8', 'ignore')
+                decoded = decode_part(payload, '', msg_obj.get_content_charset())
                 
                 if msg_obj.get_content_type() == 'text/plain':
                     body_text = decoded
@@ -127,18 +138,28 @@ def get_email_body_text(msg_obj):
     return body_text
 
 
-def detect_duplicates(email_list):
+def detect_duplicates(email_list, threshold=None):
     """
     Detect duplicate emails based on Message-ID or Subject+From combination
     
+    When the entries carry content fingerprints ('body_hash' and
+    'signature' from utils.fingerprint), content replaces the Subject+From
+    rule: identical bodies and bodies at least `threshold` similar are
+    duplicates, while distinct messages sharing a subject are kept.
+    
     Args:
         email_list: List of email data dictionaries
+        threshold: Near-duplicate similarity threshold (0-1) for
+            fingerprinted entries; None disables near-duplicate matching
         
     Returns:
-        Tuple of (unique_emails, duplicates)
+        Tuple of (unique_emails, duplicates); each duplicate reports the
+        reason and the index of the email it matched
     """
-    seen_ids = set()
-    seen_combos = set()
+    seen_ids = {}
+    seen_combos = {}
+    seen_hashes = {}
+    near_index = NearDuplicateIndex(threshold) if threshold else None
     unique_emails = []
     duplicates = []
     
@@ -146,32 +167,50 @@ def detect_duplicates(email_list):
         msg_id = email_data.get('message_id', '')
         subject = email_data.get('subject', '')
         from_addr = email_data.get('from', '')
+        content_hash = email_data.get('body_hash')
+        signature = email_data.get('signature')
+        by_content = 'body_hash' in email_data
         
         # Create unique identifier
         combo = f"{subject}|{from_addr}"
         
-        is_duplicate = False
+        matched = None
         reason = ""
         
         # Check Message-ID if available
         if msg_id and msg_id in seen_ids:
-            is_duplicate = True
+            matched = seen_ids[msg_id]
             reason = "Duplicate Message-ID"
+        elif by_content:
+            # Check the body content
+            if content_hash and content_hash in seen_hashes:
+                matched = seen_hashes[content_hash]
+                reason = "Identical body"
+            elif near_index is not None and signature:
+                found = near_index.query(signature)
+                if found:
+                    matched = found[0]
+                    reason = f"Near-duplicate body ({found[1]:.0%} similar)"
         # Check Subject+From combination
         elif combo in seen_combos:
-            is_duplicate = True
+            matched = seen_combos[combo]
             reason = "Duplicate Subject+From"
         
-        if is_duplicate:
+        if matched is not None:
             duplicates.append({
                 'index': idx + 1,
                 'subject': subject,
-                'reason': reason
+                'reason': reason,
+                'matched': matched + 1
             })
         else:
             unique_emails.append(email_data)
             if msg_id:
-                seen_ids.add(msg_id)
-            seen_combos.add(combo)
+                seen_ids[msg_id] = idx
+            seen_combos.setdefault(combo, idx)
+            if content_hash:
+                seen_hashes.setdefault(content_hash, idx)
+            if near_index is not None and signature:
+                near_index.add(idx, signature)
     
     return unique_emails, duplicates
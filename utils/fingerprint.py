@@ -0,0 +1,200 @@
+"""
+Content fingerprints for duplicate detection
+Exact body hashes plus MinHash signatures with an LSH index for near-duplicates
+"""
+import hashlib
+import re
+import zlib
+
+from utils.config import FINGERPRINT_SIZE, SHINGLE_SIZE
+
+_WORDS = re.compile(r'\w+')
+_MASK = (1 << 64) - 1
+# Signature slots left empty by short texts
+_EMPTY = _MASK
+
+
+def normalize_text(text):
+    """
+    Normalize body text before fingerprinting
+
+    Case, punctuation and whitespace differences are ignored.
+
+    Args:
+        text: Body text
+
+    Returns:
+        List of lower-case words
+    """
+    return _WORDS.findall((text or '').lower())
+
+
+def body_hash(words):
+    """
+    Exact fingerprint of a normalized body
+
+    Args:
+        words: Output of normalize_text()
+
+    Returns:
+        Hex digest string, or '' for an empty body
+    """
+    if not words:
+        return ''
+    return hashlib.sha1(' '.join(words).encode('utf-8')).hexdigest()
+
+
+def _shingle_hashes(words, size):
+    """Stable 64-bit hashes of the word n-grams of a text"""
+    if len(words) < size:
+        size = len(words)
+    crc = zlib.crc32
+    hashes = set()
+    for k in range(len(words) - size + 1):
+        data = ' '.join(words[k:k + size]).encode('utf-8')
+        hashes.add((crc(data) << 32) | crc(data, 0x9E3779B9))
+    return hashes
+
+
+def minhash_signature(words, num_perm=FINGERPRINT_SIZE, shingle_size=SHINGLE_SIZE):
+    """
+    MinHash signature of a normalized body
+
+    Uses one-permutation hashing: every shingle is hashed once and falls
+    into one of num_perm bins keeping the bin minimum, so the cost is linear
+    in the text length instead of num_perm passes. Empty bins borrow the
+    value of the next non-empty bin (densification) so signatures of short
+    texts remain comparable.
+
+    Args:
+        words: Output of normalize_text()
+        num_perm: Signature length
+        shingle_size: Words per shingle
+
+    Returns:
+        Tuple of num_perm integers, or None when the text is empty
+    """
+    hashes = _shingle_hashes(words, shingle_size)
+    if not hashes:
+        return None
+
+    bins = [_EMPTY] * num_perm
+    for h in hashes:
+        slot = h % num_perm
+        value = h // num_perm
+        if value < bins[slot]:
+            bins[slot] = value
+
+    if _EMPTY in bins:
+        filled = [k for k, v in enumerate(bins) if v != _EMPTY]
+        for k in range(num_perm):
+            if bins[k] == _EMPTY:
+                # Next filled bin, wrapping around; the offset keeps donors distinct
+                donor = next((f for f in filled if f > k), filled[0])
+                bins[k] = bins[donor] + ((donor - k) % num_perm) * (1 << 58)
+    return tuple(bins)
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures"""
+    same = sum(1 for a, b in zip(sig_a, sig_b) if a == b)
+    return same / len(sig_a)
+
+
+def _lsh_params(threshold, num_perm):
+    """
+    Choose (bands, rows) so the LSH S-curve crosses around the threshold
+
+    The crossing point (1/b)^(1/r) is kept at or slightly below the
+    threshold, favouring recall; candidates are verified afterwards.
+    """
+    best = (num_perm, 1)
+    best_err = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if bands < 1:
+            break
+        crossing = (1 / bands) ** (1 / rows)
+        err = threshold - crossing
+        if err < 0:
+            err = -err * 2
+        if best_err is None or err < best_err:
+            best, best_err = (bands, rows), err
+    return best
+
+
+class NearDuplicateIndex:
+    """
+    Locality-sensitive hashing index over MinHash signatures
+
+    Signatures are split into bands; two messages become candidates when
+    any band hashes alike, and candidates are verified against the
+    threshold. Lookups stay close to constant time per message, so a batch
+    of n messages costs O(n) instead of O(n²) pairwise comparisons.
+    """
+
+    def __init__(self, threshold, num_perm=FINGERPRINT_SIZE):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = _lsh_params(threshold, num_perm)
+        self._buckets = [{} for _ in range(self.bands)]
+        self._signatures = {}
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        for band in range(self.bands):
+            yield band, hash(signature[band * rows:(band + 1) * rows])
+
+    def query(self, signature):
+        """
+        Find the most similar indexed message
+
+        Args:
+            signature: MinHash signature
+
+        Returns:
+            Tuple of (key, similarity) or None if nothing reaches the threshold
+        """
+        seen = set()
+        best = None
+        for band, key in self._band_keys(signature):
+            for candidate in self._buckets[band].get(key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                score = similarity(signature, self._signatures[candidate])
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (candidate, score)
+        return best
+
+    def add(self, key, signature):
+        """
+        Index a signature
+
+        Args:
+            key: Identifier reported by query()
+            signature: MinHash signature
+        """
+        self._signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, []).append(key)
+
+    def __len__(self):
+        return len(self._signatures)
+
+
+def fingerprint_text(text):
+    """
+    Compute the content fingerprint of a body text
+
+    Args:
+        text: Body text
+
+    Returns:
+        Dict with 'body_hash' and 'signature' (None for empty bodies)
+    """
+    words = normalize_text(text)
+    return {
+        'body_hash': body_hash(words),
+        'signature': minhash_signature(words),
+    }
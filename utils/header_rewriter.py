@@ -0,0 +1,253 @@
+"""
+Byte-level header rewriting for original-format exports
+Edits the raw header block in one pass without parsing or re-serializing the message
+"""
+import re
+from dataclasses import dataclass, field
+
+# Headers removed by the "Remove Auth Headers" option
+AUTH_HEADERS = (
+    'DKIM-Signature',
+    'Authentication-Results',
+    'Received',
+    'Received-SPF',
+    'ARC-Authentication-Results',
+    'ARC-Message-Signature',
+    'ARC-Seal',
+)
+
+_FROM_DOMAIN = re.compile(rb'@[a-zA-Z0-9.-]+')
+_FOLD = re.compile(rb'\r?\n(?=[ \t])')
+
+
+def parse_custom_headers(custom_headers_text):
+    """
+    Parse the "Custom Headers" text box into (name, value) pairs
+
+    Args:
+        custom_headers_text: One "Name: value" per line
+
+    Returns:
+        List of (name, value) string tuples, in input order
+    """
+    headers = []
+    for line in (custom_headers_text or '').split('\n'):
+        if ":" in line:
+            k, v = line.split(":", 1)
+            if k.strip():
+                headers.append((k.strip(), v.strip()))
+    return headers
+
+
+def split_message(raw):
+    """
+    Split a raw message into header block, separator and body
+
+    Args:
+        raw: Raw RFC822 bytes
+
+    Returns:
+        Tuple of (head bytes, separator bytes, body memoryview)
+    """
+    sep = b'\r\n\r\n'
+    idx = raw.find(sep)
+    if idx == -1:
+        sep = b'\n\n'
+        idx = raw.find(sep)
+
+    if idx == -1:
+        return raw, b'', memoryview(b'')
+    return raw[:idx], sep, memoryview(raw)[idx + len(sep):]
+
+
+def iter_fields(head):
+    """
+    Iterate over the header fields of a raw header block
+
+    Continuation lines stay attached to their field and are not unfolded.
+
+    Args:
+        head: Raw header block (without the blank separator line)
+
+    Returns:
+        Generator of (lower-case name bytes, raw field bytes)
+    """
+    eol = b'\r\n' if b'\r\n' in head else b'\n'
+    lines = None
+    for line in head.split(eol):
+        if lines is not None and line[:1] in (b' ', b'\t'):
+            lines.append(line)
+            continue
+        if lines is not None:
+            raw = eol.join(lines)
+            yield raw.split(b':', 1)[0].strip().lower(), raw
+        lines = [line]
+    if lines is not None:
+        raw = eol.join(lines)
+        yield raw.split(b':', 1)[0].strip().lower(), raw
+
+
+def header_value(raw_field):
+    """Return the unfolded, stripped value of a raw header field"""
+    value = raw_field.split(b':', 1)[1] if b':' in raw_field else b''
+    return _FOLD.sub(b'', value).strip()
+
+
+@dataclass(frozen=True)
+class TransformPlan:
+    """
+    Immutable, precompiled set of header options for original-format exports
+
+    Built once per run (or loaded from a saved profile) and applied to every
+    message; it holds no per-run state, so it can be shared across threads
+    and pickled to worker processes.
+    """
+    rep_dom: bool = False
+    p_from: str = ''
+    std_headers: bool = False
+    custom_headers: tuple = ()
+    mod_eid: bool = False
+    clean_auth: bool = False
+
+    # Compiled forms, derived from the options above
+    to_set: dict = field(init=False, repr=False, compare=False)
+    dropped: frozenset = field(init=False, repr=False, compare=False)
+    new_from: object = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        custom = tuple((str(k), str(v)) for k, v in self.custom_headers)
+        object.__setattr__(self, 'custom_headers', custom)
+
+        # Headers to set, later entries win (same precedence as the options order)
+        to_set = {}
+        if self.std_headers:
+            to_set[b'to'] = b'To: [*to]'
+            to_set[b'date'] = b'Date: [*date]'
+        for name, value in custom:
+            to_set[name.lower().encode('utf-8')] = f"{name}: {value}".encode('utf-8')
+
+        if self.mod_eid and b'message-id' in to_set:
+            to_set[b'message-id'] = to_set[b'message-id'].replace(b'@', b'[EID]@', 1)
+
+        dropped = frozenset()
+        if self.clean_auth:
+            dropped = frozenset(h.lower().encode('ascii') for h in AUTH_HEADERS)
+
+        object.__setattr__(self, 'to_set', to_set)
+        object.__setattr__(self, 'dropped', dropped)
+        new_from = b'@' + self.p_from.encode('utf-8') if self.rep_dom else None
+        object.__setattr__(self, 'new_from', new_from)
+
+    @classmethod
+    def from_options(cls, options):
+        """
+        Compile a plan from the processing options dictionary
+
+        Args:
+            options: Dictionary with rep_dom, p_from, std_headers,
+                custom_headers_text, mod_eid and clean_auth
+
+        Returns:
+            TransformPlan instance
+        """
+        return cls(
+            rep_dom=bool(options.get('rep_dom')),
+            p_from=options.get('p_from') or '',
+            std_headers=bool(options.get('std_headers')),
+            custom_headers=tuple(parse_custom_headers(options.get('custom_headers_text', ''))),
+            mod_eid=bool(options.get('mod_eid')),
+            clean_auth=bool(options.get('clean_auth')),
+        )
+
+    def to_dict(self):
+        """Serializable form of the plan options (used for saved profiles)"""
+        return {
+            'rep_dom': self.rep_dom,
+            'p_from': self.p_from,
+            'std_headers': self.std_headers,
+            'custom_headers': [list(pair) for pair in self.custom_headers],
+            'mod_eid': self.mod_eid,
+            'clean_auth': self.clean_auth,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a plan from to_dict() output"""
+        return cls(
+            rep_dom=bool(data.get('rep_dom')),
+            p_from=data.get('p_from') or '',
+            std_headers=bool(data.get('std_headers')),
+            custom_headers=tuple(tuple(pair) for pair in data.get('custom_headers', [])),
+            mod_eid=bool(data.get('mod_eid')),
+            clean_auth=bool(data.get('clean_auth')),
+        )
+
+    @property
+    def custom_headers_text(self):
+        """Custom headers in the "Name: value" per line form used by the UI"""
+        return '\n'.join(f"{k}: {v}" for k, v in self.custom_headers)
+
+    def apply(self, raw):
+        """
+        Apply the plan to a raw message
+
+        Untouched header fields are copied byte for byte, including folding
+        and line endings. Rewritten fields keep their position; headers that
+        must be set but are missing are appended to the header block. The
+        body is not copied: it is returned as a memoryview into raw.
+
+        Args:
+            raw: Raw RFC822 bytes
+
+        Returns:
+            Tuple of (list of byte chunks forming the message, subject string)
+        """
+        head, sep, body = split_message(raw)
+        eol = sep[:len(sep) // 2] or b'\r\n'
+
+        to_set = self.to_set
+        dropped = self.dropped
+        new_from = self.new_from
+
+        out = []
+        subject = None
+        emitted = set()
+
+        for name, raw_field in iter_fields(head):
+            if name == b'subject' and subject is None:
+                subject = header_value(raw_field).decode('utf-8', 'replace')
+
+            if name in dropped:
+                continue
+            if name in to_set:
+                if name not in emitted:
+                    out.append(to_set[name])
+                    emitted.add(name)
+                continue
+            if name == b'from' and new_from is not None:
+                raw_field = _FROM_DOMAIN.sub(lambda m: new_from, raw_field)
+            elif name == b'message-id' and self.mod_eid and b'@' in raw_field.split(b':', 1)[-1]:
+                k, v = raw_field.split(b':', 1)
+                raw_field = k + b':' + v.replace(b'@', b'[EID]@', 1)
+            out.append(raw_field)
+
+        for name, raw_field in to_set.items():
+            if name not in emitted and name not in dropped:
+                out.append(raw_field)
+
+        return [eol.join(out), sep or eol + eol, body], subject or 'no_subject'
+
+
+def rewrite_headers(raw, rep_dom=False, p_from='', std_headers=False, custom_headers=(),
+                    mod_eid=False, clean_auth=False):
+    """
+    Apply the original-format header options to a raw message
+
+    Convenience wrapper compiling a one-off TransformPlan; loops should
+    compile the plan once and call plan.apply() instead.
+
+    Returns:
+        Tuple of (list of byte chunks forming the message, subject string)
+    """
+    plan = TransformPlan(rep_dom, p_from, std_headers, tuple(custom_headers), mod_eid, clean_auth)
+    return plan.apply(raw)
@@ -0,0 +1,336 @@
+"""
+Streaming HTML-to-text conversion
+Linear-time conversion with a chunked tokenizer; stops early once a character cap is reached
+"""
+import re
+from html import unescape
+from itertools import repeat
+
+# Elements whose content is never visible
+SKIP_ELEMENTS = frozenset({
+    'script', 'style', 'head', 'title', 'noscript', 'template', 'svg', 'iframe',
+})
+
+# Elements that start a new paragraph / a new line / a new cell
+PARAGRAPH_ELEMENTS = frozenset({
+    'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'pre', 'table', 'hr',
+})
+LINE_ELEMENTS = frozenset({
+    'br', 'div', 'li', 'tr', 'ul', 'ol', 'dl', 'dt', 'dd', 'section', 'article',
+    'header', 'footer', 'nav', 'aside', 'center', 'form', 'address', 'figure',
+    'figcaption', 'main', 'tbody', 'thead', 'tfoot', 'caption',
+})
+CELL_ELEMENTS = frozenset({'td', 'th'})
+
+# Frequent inline tags, mapped to nothing without a fallback lookup
+INLINE_ELEMENTS = frozenset({
+    'a', 'b', 'i', 'u', 's', 'em', 'strong', 'span', 'font', 'img', 'small', 'big',
+    'sub', 'sup', 'code', 'html', 'body', 'meta', 'link', 'o', 'v', 'label',
+})
+
+
+def _any_case(name):
+    """Regex for a tag name in any letter case, e.g. '[hH][eE][aA][dD]'"""
+    return ''.join(f'[{c}{c.upper()}]' if c.isalpha() else c for c in name)
+
+
+# Hidden elements are searched in the lower-cased markup when it is ASCII
+# (lower() is cheap there and literal patterns scan fastest); other markup
+# is searched with the letter cases spelled out, since lower-casing
+# non-ASCII text costs more than the search itself
+_SKIP_START_LOWER = re.compile(r'<!--|<(%s)[\s/>]' % '|'.join(sorted(SKIP_ELEMENTS)))
+_SKIP_START = re.compile(
+    r'<!--|<(%s)[\s/>]' % '|'.join(_any_case(name) for name in sorted(SKIP_ELEMENTS))
+)
+_SKIP_END_LOWER = {name: re.compile(rf'</{name}\s*>') for name in SKIP_ELEMENTS}
+_SKIP_END = {name: re.compile(rf'</{_any_case(name)}\s*>') for name in SKIP_ELEMENTS}
+_SKIP_END_LOWER['--'] = _SKIP_END['--'] = re.compile(r'-->')
+# An unclosed <head> ends where the body starts
+_BODY_START_LOWER = re.compile(r'<body[\s>]')
+_BODY_START = re.compile(r'<%s[\s>]' % _any_case('body'))
+
+# Line breaks are marked with NUL while converting and become newlines at
+# the very end; NULs in the input are dropped first, so they cannot collide
+_BREAK = '\x00'
+
+
+class _BreakMap(dict):
+    """Tag name -> breaks, looked up in C for known names of either case"""
+
+    def __missing__(self, name):
+        return self.get(name.lower(), '')
+
+
+_BREAKS = _BreakMap(dict.fromkeys(INLINE_ELEMENTS, ''))
+_BREAKS.update(dict.fromkeys(PARAGRAPH_ELEMENTS, _BREAK * 2))
+_BREAKS.update(dict.fromkeys(LINE_ELEMENTS, _BREAK))
+_BREAKS.update(dict.fromkeys(CELL_ELEMENTS, ' '))
+_BREAKS.update({name.upper(): value for name, value in _BREAKS.items()})
+# Closing tags break the same way as opening ones
+_BREAKS.update({'/' + name: value for name, value in _BREAKS.items()})
+
+# The capture keeps a leading '/', '!' or '?'; unknown names map to nothing
+_TAG_SPLIT = re.compile(r'<([/!?]?[a-zA-Z0-9]*)[^>]*>')
+_TAG_NAME = re.compile(r'[/!?]?[a-zA-Z0-9]*')
+
+# Whole tags (between '<' and '>') remembered with their breaks; mail
+# repeats the same few tags thousands of times, so most lookups are hits
+_TAG_CACHE_SIZE = 4096
+
+
+class _TagBreakMap(dict):
+    """Tag contents (e.g. 'td class="x"') -> breaks"""
+
+    def __missing__(self, tag):
+        value = _BREAKS[_TAG_NAME.match(tag).group()]
+        if len(self) < _TAG_CACHE_SIZE:
+            self[tag] = value
+        return value
+
+
+_TAG_BREAKS = _TagBreakMap()
+
+
+def _unescape(text):
+    """html.unescape() with a fast path for the entities most mail uses"""
+    # Decoded to a space, which is how whitespace collapsing treats U+00A0
+    text = text.replace('&nbsp;', ' ')
+    if '&' not in text:
+        return text
+    if text.count('&') == text.count('&amp;'):
+        return text.replace('&amp;', '&')
+    return unescape(text)
+
+
+def _find_hidden(buf, lowered, pos):
+    """
+    Locate the next hidden element or comment at or after pos
+
+    Args:
+        buf: Markup
+        lowered: buf.lower() for ASCII markup, else None
+        pos: Search start
+
+    Returns:
+        Tuple of (start, end of the opening tag, element name, '--' for a
+        comment or None for a self-closing tag), or None
+    """
+    if lowered is None:
+        m = _SKIP_START.search(buf, pos)
+    else:
+        m = _SKIP_START_LOWER.search(lowered, pos)
+    if not m:
+        return None
+    name = m.group(1)
+    if name is None:
+        return m.start(), m.end(), '--'
+    gt = buf.find('>', m.end() - 1)
+    if gt == -1:
+        # The tag is incomplete; nothing later can match
+        return None
+    return m.start(), gt + 1, None if buf[gt - 1] == '/' else name.lower()
+
+
+def _find_end(buf, lowered, pos, name):
+    """
+    Locate the end of the hidden element or comment open at pos
+
+    Returns:
+        Position after the closing tag, or -1 if it is not in buf yet
+    """
+    if lowered is None:
+        text, closing, body_start = buf, _SKIP_END[name], _BODY_START
+    else:
+        text, closing, body_start = lowered, _SKIP_END_LOWER[name], _BODY_START_LOWER
+    m = closing.search(text, pos)
+    if name == 'head':
+        body = body_start.search(text, pos, m.start() if m else len(text))
+        if body:
+            return body.start()
+    return m.end() if m else -1
+
+
+def _strip_tags(segment):
+    """
+    Replace the tags of well-formed markup with their breaks
+
+    Splitting on both brackets with str methods is much cheaper than a
+    regex scan of every attribute; the tokens are only trusted if they
+    alternate text, tag, text... exactly as in the segment.
+
+    Returns:
+        Text with break markers, or None if a stray '<' or '>' is present
+    """
+    tokens = segment.replace('>', '<').split('<')
+    n = len(tokens)
+    if n % 2 == 0:
+        return None
+    check = tokens * 2
+    check[0::2] = tokens
+    check[1::2] = ['<', '>'] * (n // 2) + ['']
+    if ''.join(check) != segment:
+        return None
+    tokens[1::2] = map(_TAG_BREAKS.__getitem__, tokens[1::2])
+    return ''.join(tokens)
+
+
+def _convert_segment(segment):
+    """
+    Convert markup that contains no hidden elements to text
+
+    Tags become break markers or nothing (split with str methods, or in one
+    regex pass when brackets are unbalanced), and whitespace is collapsed
+    with str.split().
+    """
+    text = _strip_tags(segment) if '<' in segment else segment
+    if text is None:
+        parts = _TAG_SPLIT.split(segment)
+        parts[1::2] = map(_BREAKS.__getitem__, parts[1::2])
+        text = ''.join(parts)
+
+    if '&' in text:
+        text = _unescape(text)
+
+    collapsed = ' '.join(text.split())
+    if text[:1].isspace():
+        collapsed = ' ' + collapsed
+    if text[-1:].isspace() and collapsed != ' ':
+        collapsed += ' '
+    return collapsed
+
+
+def _safe_end(buf, pos, final):
+    """End of the part of buf that can be converted without more data"""
+    if final:
+        return len(buf)
+    end = len(buf)
+    lt = buf.rfind('<', pos)
+    if lt > buf.rfind('>', pos):
+        end = lt  # incomplete tag
+    amp = buf.rfind('&', pos, end)
+    if amp != -1 and end - amp < 12 and buf.find(';', amp, end) == -1:
+        end = amp  # incomplete entity
+    return end
+
+
+class HtmlTextExtractor:
+    """
+    Incremental HTML to plain text converter
+
+    Feed markup in chunks of any size. The tokenizer jumps from one hidden
+    element (script, style, head, comments...) to the next and converts the
+    visible markup in between with a few C-level passes, so the cost is
+    linear in the input and hidden content is never scanned for tags.
+    Entities are decoded and block elements become line or paragraph
+    breaks. With max_chars set, `done` turns True as soon as enough text
+    has been produced and the rest of the document is ignored.
+    """
+
+    def __init__(self, max_chars=None):
+        self.max_chars = max_chars
+        self.done = False
+        self._buf = ''
+        self._skip = None
+        self._out = []
+        self._count = 0
+
+    def _emit(self, segment):
+        """Convert a visible segment and account for the output size"""
+        if not segment:
+            return
+        text = _convert_segment(segment)
+        if text[:1] == ' ' and self._out and self._out[-1][-1:] == ' ':
+            text = text[1:]
+        self._out.append(text)
+        self._count += len(text)
+        if self.max_chars and self._count >= self.max_chars:
+            self.done = True
+
+    def feed(self, chunk, final=False):
+        """
+        Process the next piece of markup
+
+        Args:
+            chunk: HTML text
+            final: True when no more data will follow
+        """
+        if self.done:
+            return
+        if _BREAK in chunk:
+            chunk = chunk.replace(_BREAK, '')
+        buf = self._buf + chunk if self._buf else chunk
+        pos = 0
+        # Visible markup between hidden elements, converted in one go
+        visible = []
+        n = len(buf)
+        lowered = buf.lower() if buf.isascii() else None
+
+        while pos < n:
+            if self._skip:
+                end = _find_end(buf, lowered, pos, self._skip)
+                if end == -1:
+                    # Keep a short tail in case the closing tag is split
+                    pos = n if final else max(pos, n - 16)
+                    break
+                pos = end
+                self._skip = None
+                continue
+
+            hidden = _find_hidden(buf, lowered, pos)
+            if not hidden:
+                end = _safe_end(buf, pos, final)
+                visible.append(buf[pos:end])
+                pos = end
+                break
+
+            start, end, self._skip = hidden
+            visible.append(buf[pos:start])
+            pos = end
+
+        self._emit(''.join(visible))
+        self._buf = '' if self.done else buf[pos:]
+
+    def close(self):
+        """
+        Finish the document and return the extracted text
+
+        Returns:
+            Plain text with single spaces, line breaks and at most one blank
+            line between paragraphs
+        """
+        if self._buf and not self.done:
+            self.feed('', final=True)
+        text = ''.join(self._out)
+        # Trim every line, then collapse each run of two or more breaks
+        # into one blank line; split/strip/join keep this in C even for
+        # thousands of lines
+        text = _BREAK.join(map(str.strip, text.split(_BREAK)))
+        blocks = map(str.strip, text.split(_BREAK * 2), repeat(_BREAK))
+        text = '\n\n'.join(filter(None, blocks)).replace(_BREAK, '\n')
+        if self.max_chars:
+            text = text[:self.max_chars]
+        return text
+
+
+def html_to_text(html_content, max_chars=None, chunk_size=8192):
+    """
+    Convert an HTML document to plain text
+
+    Args:
+        html_content: HTML string
+        max_chars: Optional cap on the output length; conversion stops early
+        chunk_size: Characters handed to the tokenizer per step
+
+    Returns:
+        Plain text string
+    """
+    extractor = HtmlTextExtractor(max_chars)
+    if not max_chars:
+        # Without a cap there is nothing to stop early for
+        extractor.feed(html_content, final=True)
+        return extractor.close()
+    for start in range(0, len(html_content), chunk_size):
+        extractor.feed(html_content[start:start + chunk_size])
+        if extractor.done:
+            break
+    return extractor.close()
@@ -0,0 +1,553 @@
+"""
+Batched IMAP FETCH helpers
+Groups message IDs into message-set chunks and parses multi-message replies
+"""
+import re
+import socket
+from collections import deque
+
+from utils.config import DEFAULT_FETCH_CHUNK_SIZE
+
+_RECORD_START = re.compile(rb'^(\d+) \(')
+_LITERAL_TAIL = re.compile(rb'\{(\d+)\}$')
+
+# Header-only query used by the duplicate pre-pass (never downloads bodies)
+DUPLICATE_CHECK_QUERY = '(BODY.PEEK[HEADER.FIELDS (MESSAGE-ID SUBJECT FROM)])'
+
+_OPEN = object()
+_CLOSE = object()
+
+
+class _Literal:
+    """Marker for a literal payload inside a tokenized FETCH response"""
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+
+def interrupt_fetches(mail):
+    """
+    Unblock fetches running on other threads by shutting the sockets down
+
+    Reads in progress fail at once instead of waiting for the server; the
+    connections cannot be used afterwards and only need closing.
+
+    Args:
+        mail: IMAP connection, or a pool / fetch source with interrupt()
+    """
+    interrupt = getattr(mail, 'interrupt', None)
+    if interrupt:
+        interrupt()
+        return
+    sock = getattr(mail, 'sock', None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def chunk_ids(id_list, chunk_size=DEFAULT_FETCH_CHUNK_SIZE):
+    """
+    Split a list of message IDs into consecutive chunks
+
+    Args:
+        id_list: List of message IDs (bytes, str or int)
+        chunk_size: Maximum number of IDs per chunk
+
+    Returns:
+        Generator of (offset, chunk) tuples
+    """
+    chunk_size = max(1, int(chunk_size or 1))
+    for offset in range(0, len(id_list), chunk_size):
+        yield offset, id_list[offset:offset + chunk_size]
+
+
+def build_message_set(ids):
+    """
+    Build a compact IMAP message-set string (e.g. '1:500,502,510:520')
+
+    Args:
+        ids: Iterable of message IDs
+
+    Returns:
+        Message-set string
+    """
+    numbers = [int(x) for x in ids]
+    if not numbers:
+        return ''
+
+    ranges = []
+    start = prev = numbers[0]
+    for n in numbers[1:]:
+        if n == prev + 1:
+            prev = n
+            continue
+        ranges.append((start, prev))
+        start = prev = n
+    ranges.append((start, prev))
+
+    return ','.join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+
+def _tokenize(segment, tokens):
+    """Tokenize one text segment of a FETCH response into tokens"""
+    i = 0
+    n = len(segment)
+    while i < n:
+        c = segment[i:i + 1]
+        if c in (b' ', b'\r', b'\n'):
+            i += 1
+        elif c == b'(':
+            tokens.append(_OPEN)
+            i += 1
+        elif c == b')':
+            tokens.append(_CLOSE)
+            i += 1
+        elif c == b'"':
+            i += 1
+            buf = bytearray()
+            while i < n and segment[i:i + 1] != b'"':
+                if segment[i:i + 1] == b'\\':
+                    i += 1
+                buf += segment[i:i + 1]
+                i += 1
+            tokens.append(bytes(buf))
+            i += 1
+        else:
+            start = i
+            depth = 0
+            while i < n:
+                c = segment[i:i + 1]
+                if c == b'[':
+                    depth += 1
+                elif c == b']':
+                    depth -= 1
+                elif depth == 0 and c in (b' ', b'(', b')'):
+                    break
+                i += 1
+            atom = segment[start:i]
+            tokens.append(None if atom.upper() == b'NIL' else atom)
+
+
+def _build(tokens, pos):
+    """Build a nested list from tokens starting after an opening parenthesis"""
+    out = []
+    while pos < len(tokens):
+        tok = tokens[pos]
+        if tok is _OPEN:
+            sub, pos = _build(tokens, pos + 1)
+            out.append(sub)
+            continue
+        if tok is _CLOSE:
+            return out, pos + 1
+        out.append(tok.data if isinstance(tok, _Literal) else tok)
+        pos += 1
+    return out, pos
+
+
+def _parse_record(segments):
+    """
+    Parse the segments of a single FETCH response into a data-item dict
+
+    Args:
+        segments: List of (text, literal_or_None) for one message
+
+    Returns:
+        Tuple of (sequence number, dict of item name -> value)
+    """
+    tokens = []
+    for text, literal in segments:
+        if literal is not None:
+            text = _LITERAL_TAIL.sub(b'', text.rstrip())
+        _tokenize(text, tokens)
+        if literal is not None:
+            tokens.append(_Literal(literal))
+
+    seq = int(tokens[0])
+    parsed, _ = _build(tokens, 2)
+
+    items = {}
+    for k in range(0, len(parsed) - 1, 2):
+        name = parsed[k]
+        if isinstance(name, bytes):
+            items[name.decode('ascii', 'ignore').upper()] = parsed[k + 1]
+    return seq, items
+
+
+def iter_fetch_responses(data):
+    """
+    Stream-parse the response list returned by imaplib for a FETCH command
+
+    Args:
+        data: Response data list as returned by IMAP4.fetch()/uid('FETCH')
+
+    Returns:
+        Generator of (sequence number, items dict) tuples, one per message
+    """
+    segments = []
+    for part in data:
+        if part is None:
+            continue
+        if isinstance(part, tuple):
+            text, literal = part[0], part[1]
+        else:
+            text, literal = part, None
+
+        if _RECORD_START.match(text) and segments:
+            try:
+                yield _parse_record(segments)
+            except (ValueError, IndexError):
+                pass
+            segments = []
+        segments.append((text, literal))
+
+    if segments:
+        try:
+            yield _parse_record(segments)
+        except (ValueError, IndexError):
+            pass
+
+
+def get_item(items, prefix):
+    """
+    Get a FETCH data item by name prefix (e.g. 'BODY[HEADER' or 'RFC822')
+
+    Args:
+        items: Items dict from iter_fetch_responses()
+        prefix: Upper-case item name or name prefix
+
+    Returns:
+        Item value or None
+    """
+    if prefix in items:
+        return items[prefix]
+    if '[' not in prefix:
+        return None
+    for name, value in items.items():
+        if name.startswith(prefix):
+            return value
+    return None
+
+
+def query_item_names(query):
+    """
+    List the response item names a FETCH query will produce
+
+    Args:
+        query: FETCH data items, e.g. '(UID BODY.PEEK[1])'
+
+    Returns:
+        List of upper-case item names (BODY.PEEK is reported as BODY)
+    """
+    tokens = []
+    _tokenize(query.encode('ascii') if isinstance(query, str) else query, tokens)
+    names = []
+    for tok in tokens:
+        if isinstance(tok, bytes):
+            name = tok.decode('ascii').upper().replace('BODY.PEEK[', 'BODY[')
+            names.append(name.split('<', 1)[0])
+    return names
+
+
+def _has_items(items, names):
+    """Check whether an items dict already holds every requested item"""
+    return all(get_item(items, name.split(' ', 1)[0]) is not None for name in names)
+
+
+def _fetch_command(mail, ids, query, uid):
+    """
+    Run one FETCH command
+
+    Returns:
+        Tuple of (True if the server answered OK, response data)
+    """
+    try:
+        if uid:
+            typ, data = mail.uid('FETCH', build_message_set(ids), query)
+        else:
+            typ, data = mail.fetch(build_message_set(ids), query)
+    except mail.abort:
+        raise
+    except mail.error:
+        # BAD completion; the connection itself is still usable
+        return False, []
+    return typ == 'OK', data
+
+
+def _refetch(mail, ids, query, uid):
+    """
+    Fetch the messages of a chunk the server answered with NO or BAD
+
+    The chunk is sent once more as a whole (servers answer NO for transient
+    conditions); if it fails again the messages are fetched one by one, so
+    only the messages the server really cannot return are missing.
+
+    Returns:
+        List of (sequence number, items dict) tuples
+    """
+    ok, data = _fetch_command(mail, ids, query, uid)
+    if ok:
+        return list(iter_fetch_responses(data))
+
+    responses = []
+    if len(ids) > 1:
+        for eid in ids:
+            ok, data = _fetch_command(mail, [eid], query, uid)
+            if ok:
+                responses.extend(iter_fetch_responses(data))
+    return responses
+
+
+def fetch_batched(mail, id_list, query='(RFC822)', chunk_size=DEFAULT_FETCH_CHUNK_SIZE,
+                  prefetched=None, uid=False):
+    """
+    Fetch many messages with one FETCH command per chunk of IDs
+
+    Only one chunk of responses is held in memory at a time. A chunk the
+    server refuses (NO/BAD) is retried, then fetched message by message.
+    Messages the server still did not return (e.g. expunged) are not
+    yielded; callers compare the yielded IDs with id_list to report them.
+
+    Args:
+        mail: IMAP connection object, or a connection pool providing its
+            own fetch_batched() method
+        id_list: List of message sequence numbers (UIDs when uid=True)
+        query: FETCH data items, e.g. '(RFC822)'
+        chunk_size: Number of messages per FETCH command
+        prefetched: Optional dict of eid -> items from an earlier pass;
+            messages that already hold every requested item are not
+            fetched again
+        uid: Use UID FETCH and treat id_list as UIDs
+
+    Returns:
+        Generator of (index in id_list, eid, items dict) in id_list order
+    """
+    if hasattr(mail, 'fetch_batched'):
+        yield from mail.fetch_batched(id_list, query, chunk_size, prefetched)
+        return
+
+    names = query_item_names(query)
+    prefetched = prefetched or {}
+
+    for offset, chunk in chunk_ids(id_list, chunk_size):
+        missing = [eid for eid in chunk
+                   if not _has_items(prefetched.get(eid, {}), names)]
+
+        by_seq = {}
+        if missing:
+            ok, data = _fetch_command(mail, missing, query, uid)
+            responses = iter_fetch_responses(data) if ok else _refetch(mail, missing, query, uid)
+            for seq, items in responses:
+                key = int(items['UID']) if uid and items.get('UID') else seq
+                by_seq.setdefault(key, {}).update(items)
+            del data, responses
+
+        for j, eid in enumerate(chunk):
+            items = by_seq.pop(int(eid), None)
+            known = prefetched.get(eid)
+            if known:
+                items = {**known, **items} if items else known
+            if items and _has_items(items, names):
+                yield offset + j, eid, items
+
+
+def fetch_pipelined(mail, id_list, query='(RFC822)', chunk_size=DEFAULT_FETCH_CHUNK_SIZE,
+                    prefetched=None, depth=4):
+    """
+    UID FETCH with several tagged commands in flight on one connection
+
+    imaplib waits for each tagged completion before sending the next
+    command. Here up to `depth` UID FETCH commands are sent back to back
+    (through imaplib's own _command/_command_complete), so the server
+    streams one chunk while the next requests are already queued; the
+    round-trip latency is paid once per window instead of once per chunk.
+    Untagged FETCH responses are matched back to their command by UID.
+    When a command is answered with NO or BAD, the commands behind it are
+    completed first and the refused chunk is then retried like in
+    fetch_batched().
+
+    Args:
+        mail: imaplib connection with a folder selected
+        id_list: List of message UIDs
+        query: FETCH data items, e.g. '(RFC822)'
+        chunk_size: Number of messages per FETCH command
+        prefetched: Optional dict of eid -> items already downloaded
+        depth: Maximum number of FETCH commands in flight
+
+    Returns:
+        Generator of (index in id_list, eid, items dict) in id_list order
+    """
+    names = query_item_names(query)
+    prefetched = prefetched or {}
+    depth = max(1, int(depth or 1))
+
+    # Responses that arrived while completing an earlier command are kept
+    received = {}
+    inflight = deque()
+
+    def collect(tag):
+        try:
+            typ, _ = mail._command_complete('UID', tag)
+        except mail.abort:
+            raise
+        except mail.error:
+            typ = 'BAD'
+        # Keep whatever the server did return, even for a refused command
+        _, data = mail._untagged_response('OK', None, 'FETCH')
+        for _, items in iter_fetch_responses(data or []):
+            if items.get('UID'):
+                received.setdefault(int(items['UID']), {}).update(items)
+        return typ == 'OK'
+
+    def complete(offset, chunk, tag):
+        if tag is not None and not collect(tag):
+            # Drain the commands queued behind this one before sending more
+            refused = [chunk]
+            for k, (queued_offset, queued_chunk, queued_tag) in enumerate(inflight):
+                if queued_tag is not None:
+                    if not collect(queued_tag):
+                        refused.append(queued_chunk)
+                    inflight[k] = (queued_offset, queued_chunk, None)
+            for refused_chunk in refused:
+                retry = [eid for eid in refused_chunk if int(eid) not in received
+                         and not _has_items(prefetched.get(eid, {}), names)]
+                for _, items in (_refetch(mail, retry, query, True) if retry else []):
+                    if items.get('UID'):
+                        received.setdefault(int(items['UID']), {}).update(items)
+
+        for j, eid in enumerate(chunk):
+            items = received.pop(int(eid), None)
+            known = prefetched.get(eid)
+            if known:
+                items = {**known, **items} if items else known
+            if items and _has_items(items, names):
+                yield offset + j, eid, items
+
+    try:
+        for offset, chunk in chunk_ids(id_list, chunk_size):
+            missing = [eid for eid in chunk
+                       if not _has_items(prefetched.get(eid, {}), names)]
+            tag = mail._command('UID', 'FETCH', build_message_set(missing), query) if missing else None
+            inflight.append((offset, chunk, tag))
+
+            if len(inflight) >= depth:
+                yield from complete(*inflight.popleft())
+
+        while inflight:
+            yield from complete(*inflight.popleft())
+    finally:
+        # Consume the replies of commands still in flight if the caller
+        # stopped early, so the connection stays usable
+        for _, _, tag in inflight:
+            if tag is not None:
+                try:
+                    mail._command_complete('UID', tag)
+                except mail.error:
+                    pass
+        if inflight:
+            mail._untagged_response('OK', None, 'FETCH')
+
+
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+           'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def _imap_date(value):
+    """Format a date as IMAP search date (e.g. 01-Jan-2024), locale independent"""
+    return f"{value.day:02d}-{_MONTHS[value.month - 1]}-{value.year}"
+
+
+def _imap_string(value):
+    """
+    Search string argument: quoted when ASCII, otherwise UTF-8 bytes that
+    uid_search() sends as a literal (RFC 3501 allows no 8-bit data in
+    quoted strings)
+    """
+    if not value.isascii():
+        return value.encode('utf-8')
+    escaped = value.replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def build_search_criteria(since=None, before=None, from_addr='', subject='',
+                          larger_kb=0, smaller_kb=0):
+    """
+    Build IMAP SEARCH criteria evaluated by the server
+
+    Args:
+        since: Optional date; messages on or after it
+        before: Optional date; messages strictly before it
+        from_addr: Substring of the From header
+        subject: Substring of the Subject header
+        larger_kb: Minimum size in KB (0 = no limit)
+        smaller_kb: Maximum size in KB (0 = no limit)
+
+    Returns:
+        Tuple of (charset or None, list of criteria). Non-ASCII values are
+        UTF-8 bytes, to be sent as literals by uid_search().
+    """
+    criteria = []
+    if since:
+        criteria += ['SINCE', _imap_date(since)]
+    if before:
+        criteria += ['BEFORE', _imap_date(before)]
+    if from_addr:
+        criteria += ['FROM', _imap_string(from_addr)]
+    if subject:
+        criteria += ['SUBJECT', _imap_string(subject)]
+    if larger_kb:
+        criteria += ['LARGER', str(int(larger_kb) * 1024)]
+    if smaller_kb:
+        criteria += ['SMALLER', str(int(smaller_kb) * 1024)]
+
+    charset = 'UTF-8' if any(isinstance(c, bytes) for c in criteria) else None
+    return charset, criteria
+
+
+def _search(mail, args, literal=None):
+    """Run one UID SEARCH, optionally ending in a literal; returns a set of UIDs"""
+    if literal is not None:
+        mail.literal = literal
+    typ, data = mail.uid('SEARCH', *args)
+    if typ != 'OK' or not data or not data[0]:
+        return set()
+    return set(data[0].split())
+
+
+def uid_search(mail, first, last, charset=None, criteria=None):
+    """
+    Resolve a range of message positions plus filters to UIDs on the server
+
+    Only the matching UIDs are transferred, never the whole folder listing.
+    imaplib sends one literal per command, at its end, so each non-ASCII
+    criterion gets a search of its own and the results are intersected.
+
+    Args:
+        mail: IMAP connection object
+        first: First message position (1-based sequence number)
+        last: Last message position
+        charset: Optional search charset
+        criteria: Optional list of extra search criteria (bytes items are
+            sent as literals)
+
+    Returns:
+        List of UIDs (bytes) in ascending order
+    """
+    args = ['CHARSET', charset] if charset else []
+    args.append(f"{first}:{last}")
+    criteria = criteria or []
+    literals = [k for k, c in enumerate(criteria) if isinstance(c, bytes)]
+    args += [c for k, c in enumerate(criteria) if k not in literals and k + 1 not in literals]
+
+    if not literals:
+        found = _search(mail, args)
+    else:
+        found = None
+        for k in literals:
+            matches = _search(mail, args + [criteria[k - 1]], criteria[k])
+            found = matches if found is None else found & matches
+            if not found:
+                break
+    return sorted(found, key=int)
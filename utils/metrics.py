@@ -0,0 +1,271 @@
+"""
+Run instrumentation
+Per-stage wall/CPU time, bytes, throughput and memory of an extraction run
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+from utils.config import METRICS_DIR
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Stages reported in this order (others are appended as they appear)
+STAGES = ('connect', 'search', 'dedup', 'fetch', 'parse', 'transform', 'compress', 'write', 'index')
+
+
+# Current memory is sampled at most this often while stages are recorded
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+def peak_rss_bytes():
+    """
+    Peak resident set size over the whole life of this process
+
+    The value never goes down, so in a long-running app it reflects the
+    largest run so far rather than the current one; see current_rss_bytes().
+
+    Returns:
+        Bytes, or None if unavailable
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def current_rss_bytes():
+    """Current resident set size of this process, or None if unavailable (non-Linux)"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def timed_call(func, payload):
+    """
+    Run func(payload) and measure it
+
+    Module-level so it can wrap a pipeline transform in a worker process.
+
+    Returns:
+        Tuple of (result, wall seconds, CPU seconds)
+    """
+    wall, cpu = time.perf_counter(), time.thread_time()
+    result = func(payload)
+    return result, time.perf_counter() - wall, time.thread_time() - cpu
+
+
+def timed(metrics, name, nbytes=0):
+    """metrics.stage(name) when a run is measured, otherwise a no-op context"""
+    return metrics.stage(name, nbytes) if metrics is not None else nullcontext()
+
+
+class RunMetrics:
+    """
+    Collects timings and counters of one extraction run
+
+    Stages may be timed from several threads; CPU time is the thread CPU
+    time of the thread (or worker process) doing the stage's work. Memory
+    is reported per run: the current RSS is sampled at the start, while
+    stages are recorded and at the end, next to the process-lifetime peak.
+    With profile=True the run is also captured with cProfile and tracemalloc.
+    """
+
+    def __init__(self, profile=False):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._end = None
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.messages = 0
+        self.profile = profile
+        self.profile_text = ''
+        self.memory_text = ''
+        self._profiler = None
+        self._tracing = False
+        self.rss_start = current_rss_bytes()
+        self.rss_peak = self.rss_start
+        self._rss_sampled = self._start
+
+    def _stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {'wall_s': 0.0, 'cpu_s': 0.0, 'calls': 0, 'bytes': 0}
+        return stage
+
+    def record(self, name, wall, cpu=0.0, nbytes=0, calls=1):
+        """
+        Add a measurement to a stage
+
+        Args:
+            name: Stage name
+            wall: Wall-clock seconds
+            cpu: CPU seconds
+            nbytes: Bytes handled
+            calls: Number of operations measured
+        """
+        with self._lock:
+            stage = self._stage(name)
+            stage['wall_s'] += wall
+            stage['cpu_s'] += cpu
+            stage['calls'] += calls
+            stage['bytes'] += nbytes
+            self.sample_rss()
+
+    def sample_rss(self, force=False):
+        """Fold the current RSS into the run's peak (rate-limited unless forced)"""
+        if self.rss_start is None:
+            return
+        now = time.perf_counter()
+        if not force and now - self._rss_sampled < RSS_SAMPLE_INTERVAL:
+            return
+        self._rss_sampled = now
+        rss = current_rss_bytes()
+        if rss is not None and rss > self.rss_peak:
+            self.rss_peak = rss
+
+    @contextmanager
+    def stage(self, name, nbytes=0):
+        """Time the enclosed block as part of a stage"""
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - wall, time.thread_time() - cpu, nbytes)
+
+    def timed_iter(self, name, iterable, size=None):
+        """
+        Attribute the time spent producing each item of an iterable to a stage
+
+        Args:
+            name: Stage name
+            iterable: Iterable to wrap (e.g. a fetch generator)
+            size: Optional function returning the byte size of an item
+
+        Returns:
+            Generator yielding the same items
+        """
+        it = iter(iterable)
+        while True:
+            wall, cpu = time.perf_counter(), time.thread_time()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.record(name, time.perf_counter() - wall, time.thread_time() - cpu, calls=0)
+                return
+            self.record(name, time.perf_counter() - wall, time.thread_time() - cpu,
+                        size(item) if size else 0)
+            yield item
+
+    def count_message(self, n=1):
+        """Count processed messages"""
+        with self._lock:
+            self.messages += n
+
+    def start_profiling(self):
+        """Start cProfile and tracemalloc if this run is profiled"""
+        if not self.profile:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self._tracing = True
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+
+    def finish(self):
+        """Stop the clock (and the profilers) at the end of the run"""
+        if self._end is not None:
+            return
+        self._end = time.perf_counter()
+        self.sample_rss(force=True)
+        if self._profiler is not None:
+            self._profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats('cumulative').print_stats(30)
+            self.profile_text = out.getvalue()
+            self._profiler = None
+        if self._tracing:
+            self._tracing = False
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            lines = [f"Peak traced memory: {peak / 1048576:.1f} MB", ""]
+            for stat in snapshot.statistics('lineno')[:15]:
+                lines.append(str(stat))
+            self.memory_text = '\n'.join(lines)
+
+    @property
+    def elapsed(self):
+        """Wall-clock duration of the run in seconds"""
+        return (self._end or time.perf_counter()) - self._start
+
+    def to_dict(self):
+        """
+        Summary of the run, suitable for JSON export
+
+        Returns:
+            Dict with totals, throughput, memory and per-stage figures;
+            run_peak_rss_mb / run_rss_growth_mb are the sampled peak of this
+            run and its growth over the RSS at the start, process_peak_rss_mb
+            the peak over the whole life of the process
+        """
+        elapsed = self.elapsed
+        fetched = self.stages.get('fetch', {}).get('bytes', 0)
+        order = [s for s in STAGES if s in self.stages]
+        order += [s for s in self.stages if s not in order]
+        process_peak = peak_rss_bytes()
+        run_peak = self.rss_peak
+        return {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+            'elapsed_s': round(elapsed, 4),
+            'messages': self.messages,
+            'messages_per_s': round(self.messages / elapsed, 2) if elapsed else 0.0,
+            'bytes_fetched': fetched,
+            'bytes_per_s': round(fetched / elapsed, 1) if elapsed else 0.0,
+            'run_peak_rss_mb': round(run_peak / 1048576, 1) if run_peak else None,
+            'run_rss_growth_mb': (round((run_peak - self.rss_start) / 1048576, 1)
+                                  if run_peak else None),
+            'process_peak_rss_mb': round(process_peak / 1048576, 1) if process_peak else None,
+            'stages': {
+                name: {
+                    'wall_s': round(self.stages[name]['wall_s'], 4),
+                    'cpu_s': round(self.stages[name]['cpu_s'], 4),
+                    'calls': self.stages[name]['calls'],
+                    'bytes': self.stages[name]['bytes'],
+                }
+                for name in order
+            },
+        }
+
+    def to_json(self, **extra):
+        """JSON form of to_dict(), with optional extra top-level fields"""
+        return json.dumps({**extra, **self.to_dict()}, indent=2, default=str)
+
+    def append_to_log(self, root=METRICS_DIR, **extra):
+        """
+        Append the run summary as one JSON line to root/runs.jsonl
+
+        Args:
+            root: Directory of the run log
+            **extra: Extra top-level fields (e.g. mode and options)
+
+        Returns:
+            Path of the log file
+        """
+        os.makedirs(root, exist_ok=True)
+        path = os.path.join(root, 'runs.jsonl')
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({**extra, **self.to_dict()}, default=str) + '\n')
+        return path
@@ -0,0 +1,214 @@
+"""
+Lazy MIME body locator
+Scans multipart boundaries over the raw message and decodes only the chosen text part
+"""
+import binascii
+from email.parser import BytesHeaderParser
+
+from utils.html_text import html_to_text
+
+_header_parser = BytesHeaderParser()
+
+
+def decode_part(data, encoding, charset):
+    """
+    Decode a MIME part body
+
+    Args:
+        data: Raw part bytes (any bytes-like object, e.g. a memoryview)
+        encoding: Content-Transfer-Encoding (lower case)
+        charset: Declared charset
+
+    Returns:
+        Decoded string
+    """
+    try:
+        if encoding == 'base64':
+            data = binascii.a2b_base64(data)
+        elif encoding == 'quoted-printable':
+            data = binascii.a2b_qp(data)
+    except (binascii.Error, ValueError):
+        pass
+
+    try:
+        return str(data, charset or 'utf-8', 'ignore')
+    except LookupError:
+        return str(data, 'utf-8', 'ignore')
+
+
+def _part_headers(raw, start, end):
+    """
+    Parse the header block of the part raw[start:end]
+
+    Returns:
+        Tuple of (header-only Message, offset where the part body starts)
+    """
+    if raw.startswith(b'\r\n', start, end):
+        return _header_parser.parsebytes(b''), start + 2
+    if raw.startswith(b'\n', start, end):
+        return _header_parser.parsebytes(b''), start + 1
+
+    crlf = raw.find(b'\r\n\r\n', start, end)
+    lf = raw.find(b'\n\n', start, end)
+    if crlf != -1 and (lf == -1 or crlf < lf):
+        head_end, body_start = crlf, crlf + 4
+    elif lf != -1:
+        head_end, body_start = lf, lf + 2
+    else:
+        head_end = body_start = end
+    return _header_parser.parsebytes(raw[start:head_end]), body_start
+
+
+def _find_delimiter(raw, delim, start, end):
+    """Find the next boundary delimiter that starts a line"""
+    while True:
+        pos = raw.find(delim, start, end)
+        if pos <= 0 or raw[pos - 1:pos] == b'\n':
+            return pos
+        start = pos + 1
+
+
+def _iter_subparts(raw, start, end, boundary):
+    """
+    Locate the body parts of a multipart entity without copying them
+
+    Returns:
+        Generator of (start, end) offsets of each part, headers included
+    """
+    delim = b'--' + boundary
+    pos = _find_delimiter(raw, delim, start, end)
+    while pos != -1:
+        after = pos + len(delim)
+        if raw.startswith(b'--', after, end):
+            return  # close delimiter
+        line_end = raw.find(b'\n', after, end)
+        if line_end == -1:
+            return
+        part_start = line_end + 1
+        nxt = _find_delimiter(raw, delim, part_start, end)
+        part_end = end if nxt == -1 else nxt
+        # The line break before a delimiter belongs to the delimiter
+        if nxt != -1:
+            if raw[part_end - 2:part_end] == b'\r\n':
+                part_end -= 2
+            elif raw[part_end - 1:part_end] == b'\n':
+                part_end -= 1
+        yield part_start, max(part_start, part_end)
+        pos = nxt
+
+
+class _Walk:
+    """Search state: first HTML part seen, kept as offsets until needed"""
+    __slots__ = ('html',)
+
+    def __init__(self):
+        self.html = None
+
+
+def _walk(raw, view, start, end, state):
+    """Depth-first search for the first non-empty text/plain part"""
+    headers, body_start = _part_headers(raw, start, end)
+    if headers.get_content_disposition() == 'attachment':
+        return None
+
+    if headers.get_content_maintype() == 'multipart':
+        boundary = headers.get_boundary()
+        if not boundary:
+            return None
+        for part_start, part_end in _iter_subparts(raw, body_start, end, boundary.encode('latin-1', 'ignore')):
+            text = _walk(raw, view, part_start, part_end, state)
+            if text:
+                return text
+        return None
+
+    ctype = headers.get_content_type()
+    if body_start >= end or ctype not in ('text/plain', 'text/html'):
+        return None
+
+    encoding = str(headers.get('Content-Transfer-Encoding', '')).strip().lower()
+    charset = headers.get_content_charset()
+    if ctype == 'text/plain':
+        return decode_part(view[body_start:end], encoding, charset)
+    if state.html is None:
+        state.html = (body_start, end, encoding, charset)
+    return None
+
+
+def find_body_text(raw):
+    """
+    Extract the body text of a raw message, preferring plain text over HTML
+
+    Only header blocks are parsed. Boundaries are located with bytes.find()
+    and part bodies are addressed through a memoryview, so attachments are
+    skipped without being copied or base64-decoded; only the selected text
+    part is decoded, using its declared charset. The walk stops at the first
+    text/plain part, and an HTML fallback is decoded only when no plain text
+    part exists.
+
+    Args:
+        raw: Raw RFC822 bytes
+
+    Returns:
+        Extracted body text as string
+    """
+    if isinstance(raw, memoryview):
+        raw = raw.tobytes()
+    view = memoryview(raw)
+    state = _Walk()
+    try:
+        text = _walk(raw, view, 0, len(raw), state)
+        if text:
+            return text
+        if state.html:
+            start, end, encoding, charset = state.html
+            return html_to_text(decode_part(view[start:end], encoding, charset))
+    except (ValueError, TypeError, LookupError):
+        pass
+    return ""
+
+
+def _raw_leaves(raw, view, start, end):
+    """Walk a raw message and yield (headers, body start, end) of every leaf part"""
+    headers, body_start = _part_headers(raw, start, end)
+    if headers.get_content_maintype() == 'multipart':
+        boundary = headers.get_boundary()
+        if not boundary:
+            return
+        for part_start, part_end in _iter_subparts(raw, body_start, end, boundary.encode('latin-1', 'ignore')):
+            yield from _raw_leaves(raw, view, part_start, part_end)
+        return
+    yield headers, body_start, end
+
+
+def iter_raw_attachments(raw):
+    """
+    Locate the attachments of a raw message without decoding them
+
+    A leaf part is an attachment when its disposition is 'attachment' or
+    it carries a file name. Bodies are returned as memoryview slices.
+
+    Args:
+        raw: Raw RFC822 bytes
+
+    Returns:
+        Generator of dicts with content_type, filename (as in the header),
+        encoding, size (encoded bytes) and data (memoryview of the encoded
+        body)
+    """
+    if isinstance(raw, memoryview):
+        raw = raw.tobytes()
+    view = memoryview(raw)
+    try:
+        for headers, body_start, end in _raw_leaves(raw, view, 0, len(raw)):
+            filename = headers.get_filename()
+            if headers.get_content_disposition() != 'attachment' and not filename:
+                continue
+            yield {
+                'content_type': headers.get_content_type(),
+                'filename': filename,
+                'encoding': str(headers.get('Content-Transfer-Encoding', '')).strip().lower(),
+                'size': max(0, end - body_start),
+                'data': view[body_start:end],
+            }
+    except (ValueError, TypeError, LookupError):
+        return
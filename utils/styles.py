@@ -2,11 +2,9 @@
 Custom CSS styles for the application
 """
 import streamlit as st
+from utils.html_assets import minify_css
 
-def load_custom_css():
-    """Load custom CSS styles for the application"""
-    st.markdown("""
-    <style>
+CUSTOM_CSS = """
         /* ==================== GLOBAL STYLES ==================== */
         .stApp {
             background-color: #1a1b26;
@@ -17,8 +15,8 @@ def load_custom_css():
             display: none;
         }
         
-        /* ==================== TABS STYLING ==================== */
-        .stTabs [data-baseweb="tab-list"] {
+        /* ==================== NAVIGATION ==================== */
+        [role="radiogroup"][aria-label="Navigation"] {
             gap: 10px;
             background-color: #565F89;
             padding: 10px 20px;
@@ -26,29 +24,44 @@ def load_custom_css():
             box-shadow: 0 4px 6px rgba(0,0,0,0.2);
         }
 
-        .stTabs [data-baseweb="tab"] {
+        [role="radiogroup"][aria-label="Navigation"] label {
             height: 50px;
+            align-items: center;
             background-color: transparent;
             border-radius: 8px;
-            color: #919499;
-            font-weight: 600;
-            border: none;
+            margin: 0;
             padding: 0 20px;
             transition: all 0.3s ease;
         }
 
+        [role="radiogroup"][aria-label="Navigation"] label p {
+            color: #919499 !important;
+            font-weight: 600;
+        }
+
+        /* Hide the radio dots */
+        [role="radiogroup"][aria-label="Navigation"] label > div:first-child {
+            display: none;
+        }
+
         /* Selected Tab */
-        .stTabs [aria-selected="true"] {
+        [role="radiogroup"][aria-label="Navigation"] label:has(input:checked) {
             background-color: #00f5c3 !important;
+        }
+
+        [role="radiogroup"][aria-label="Navigation"] label:has(input:checked) p {
             color: #1a1b26 !important;
             font-weight: bold;
         }
-        
+
         /* Hover Effect */
-        .stTabs [data-baseweb="tab"]:hover {
-            color: #00f5c3;
+        [role="radiogroup"][aria-label="Navigation"] label:hover {
             transform: translateY(-2px);
         }
+
+        [role="radiogroup"][aria-label="Navigation"] label:not(:has(input:checked)):hover p {
+            color: #00f5c3 !important;
+        }
         
         /* ==================== LABELS & TEXT ==================== */
         label {
@@ -125,5 +138,12 @@ def load_custom_css():
         ::-webkit-scrollbar-thumb:hover {
             background: #00f5c3;
         }
-    </style>
-    """, unsafe_allow_html=True)
+"""
+
+# Built once per process; every rerun sends the same small element, which
+# the browser keeps in place instead of re-inserting the stylesheet
+_STYLE_TAG = f"<style>{minify_css(CUSTOM_CSS)}</style>"
+
+def load_custom_css():
+    """Load custom CSS styles for the application"""
+    st.markdown(_STYLE_TAG, unsafe_allow_html=True)